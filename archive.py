@@ -0,0 +1,160 @@
+import contextlib
+from dataclasses import dataclass, field
+import fnmatch
+import functools
+import os
+import tarfile
+from typing import Optional
+import zipfile
+import filetype
+
+import trcparser
+from decompress import DecompressedFile, MIME_TYPES, head
+
+__doc__ = '''Trace files straight from the tar and zip archives, without extracting them. Members of
+    the archive are named 'archive!member', that's what ends up in the file_name column.
+
+    Members of the plain tar are memory-mapped like the uncompressed trace files, members of the
+    zip file are read through zipfile. Both can be opened in any order. Compressed tar (tar.gz,
+    tar.bz2, tar.xz, tar.zst) is a stream: it is decompressed once by decompress.DecompressedFile
+    and members are read in the order they are in the archive, by one task. Members themselves
+    are expected to be uncompressed trace files.'''
+
+SEPARATOR = '!'
+# tar header: magic at 257
+TAR_MAGIC = b'ustar'
+
+class TarMember(trcparser.MappedFile):
+    """Member of the plain tar, mapped to the memory. Last line is cut at the end of the member
+        even if it has no line end."""
+    def __init__(self, fname: str, info: tarfile.TarInfo) -> None:
+        super().__init__(fname, 'rb', info.offset_data, info.offset_data + info.size)
+    def _range(self):
+        (readline, tell, end) = (self.buf.readline, self.buf.tell, self.end)
+        while (pos := tell()) < end:
+            line = readline()
+            yield line if pos + len(line) <= end else line[:end - pos]
+
+@dataclass
+class Members:
+    """Members of the archive that are processed together, in the archive order. None names
+        all the members that match --member-glob."""
+    names: Optional[list[str]] = field(default_factory=list)
+    # Uncompressed size of the members, size of the file for the compressed tar
+    size: int = 0
+
+def archive_type(fname: str) -> Optional[str]:
+    """Returns 'zip', 'tar' or the compression format of the tar file (decompress.FORMATS key),
+        None if the file is not an archive."""
+    if not os.path.isfile(fname):
+        return None
+    stat = os.stat(fname)
+    return _archive_type(os.path.abspath(fname), stat.st_size, stat.st_mtime_ns)
+
+@functools.lru_cache(maxsize=1024)
+def _archive_type(fname: str, size: int, mtime_ns: int) -> Optional[str]:
+    """archive_type() of the file with the size and modification time. Compressed tar is
+        recognized by the header of the first member, only that is decompressed."""
+    if zipfile.is_zipfile(fname):
+        return 'zip'
+    match filetype.guess(fname):
+        case ft if ft and ft.mime == 'application/x-tar':
+            return 'tar'
+        case ft if ft and ft.mime in MIME_TYPES:
+            if head(fname, MIME_TYPES[ft.mime], 512)[257:262] == TAR_MAGIC:
+                return MIME_TYPES[ft.mime]
+    return None
+
+def split_name(fname: str) -> Optional[tuple[str, str]]:
+    """Splits 'archive!member' into archive and member name, None if fname is not a member
+        of the archive."""
+    (name, sep, member) = fname.rpartition(SEPARATOR)
+    if sep and member and archive_type(name) is not None:
+        return (name, member)
+    return None
+
+def selected(member: str, pattern: Optional[str]) -> bool:
+    """Glob matches the whole name of the member, or just the base name"""
+    return (pattern is None or fnmatch.fnmatch(member, pattern)
+            or fnmatch.fnmatch(os.path.basename(member), pattern))
+
+def list_members(fname: str, pattern: Optional[str] = None) -> list[tuple[str, int]]:
+    """Returns (name, size) of the regular file members, matching the glob pattern. Compressed
+        tar is decompressed for that."""
+    kind = archive_type(fname)
+    if kind == 'zip':
+        with zipfile.ZipFile(fname) as zfile:
+            return [(i.filename, i.file_size) for i in zfile.infolist()
+                    if not i.is_dir() and selected(i.filename, pattern)]
+    with _open_tar(fname, kind) as tar:
+        return [(i.name, i.size) for i in tar if i.isfile() and selected(i.name, pattern)]
+
+@contextlib.contextmanager
+def _open_tar(fname: str, kind: str):
+    if kind == 'tar':
+        with tarfile.open(fname, 'r:') as tar:
+            yield tar
+        return
+    with DecompressedFile(fname, 'rb', kind) as src, tarfile.open(fileobj=src, mode='r|') as tar:
+        yield tar
+
+def iter_members(fname: str, names: Optional[list[str]] = None, pattern: Optional[str] = None):
+    """Yields ('archive!member', member) for the members in names, or the members matching the
+        pattern. Member is the context manager that gives lines of the member, like the openers
+        from trcparser.get_opener(). Member has to be read before the next one is requested,
+        compressed tar is read as a stream."""
+    kind = archive_type(fname)
+    wanted = set(names) if names is not None else None
+    def want(member: str) -> bool:
+        return member in wanted if wanted is not None else selected(member, pattern)
+
+    if kind == 'zip':
+        with zipfile.ZipFile(fname) as zfile:
+            for info in zfile.infolist():
+                if not info.is_dir() and want(info.filename):
+                    yield (f'{fname}{SEPARATOR}{info.filename}', zfile.open(info))
+        return
+    if kind == 'tar':
+        with tarfile.open(fname, 'r:') as tar:
+            infos = [i for i in tar.getmembers() if i.isfile() and want(i.name)]
+        for info in infos:
+            yield (f'{fname}{SEPARATOR}{info.name}', TarMember(fname, info))
+        return
+    with _open_tar(fname, kind) as tar:
+        for info in tar:
+            if info.isfile() and want(info.name):
+                yield (f'{fname}{SEPARATOR}{info.name}', tar.extractfile(info))
+
+class Member:
+    """Member opened by open_member(), keeps the archive open until it is closed."""
+    def __init__(self, members, trace) -> None:
+        self.members = members
+        self.trace = trace
+    def __enter__(self):
+        return self.trace
+    def __exit__(self, *exc) -> None:
+        self.trace.close()
+        self.members.close()
+
+def open_member(fname: str, mode: str = 'rb') -> Member:
+    """Opens one member, fname is 'archive!member'. Has the same signature as the openers from
+        trcparser.get_opener()."""
+    if mode != 'rb':
+        raise ValueError(f"open_member: unsupported mode {mode}")
+    (name, member) = split_name(fname)
+    members = iter_members(name, [member])
+    for (_, trace) in members:
+        return Member(members, trace)
+    raise FileNotFoundError(f"No member {member} in {name}")
+
+def plan_members(fname: str, pattern: Optional[str], jobs: int) -> list[Members]:
+    """Splits the members of the archive between the parallel tasks, without parallelism all of
+        them go to one task. Members of the plain tar and zip file are read directly, every member
+        is a task of its own. Compressed tar is one task: it would be decompressed by every task
+        that reads a part of it, and listing the members would cost a decompression too."""
+    if archive_type(fname) not in ('tar', 'zip'):
+        return [Members(None, os.path.getsize(fname))]
+    members = list_members(fname, pattern)
+    if jobs <= 1:
+        return [Members([name for (name, _) in members], sum(size for (_, size) in members))]
+    return [Members([name], size) for (name, size) in members]
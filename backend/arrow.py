@@ -1,20 +1,46 @@
+from array import array
 from concurrent.futures import ThreadPoolExecutor, Future
-from typing import Optional,Union
+from dataclasses import dataclass, field
+import itertools
+import time
+from typing import Iterator, Optional, Union
+from urllib.parse import quote
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
+from ops import FIELD_NAMES, SPAN_ID, SQL_ID
+from histograms import DIGITS, HISTOGRAM_DIR, histograms_table, merge_tables
+from spans import SPANS_DIR, spans_table
 
-__doc__ = ''' Adapter for pyarrow: turns stuff into Parquet files.'''
-# How many rows are bufferd and flushed to the disk in one file. Bigger number means
-# larger memory usage and less parquet files
-BUFFER_SIZE = 500000000
-PARQUET_SCHEMA_VERSION = '0.4'
+__doc__ = ''' Adapter for pyarrow: turns stuff into Parquet files. Rows are buffered in blocks
+    and handed to the writer thread a row group at a time. Writer keeps the file open and appends
+    the row groups, until the file grows over the target size or the backend is flushed.
+
+    Optionally the files are written in the hive partitioned layout, for example
+    "<dbdir>/date=2024-05-01/hour=13/service_name=orcl/<prefix>.<n>". Rows of the span go to the
+    partition of the span: date and hour of its start, like the ts of the span summary, and the
+    values of its first row. Every partition has its own open file. Sidecars mirror the layout,
+    "<dbdir>/_spans/date=2024-05-01/hour=13/service_name=orcl/<prefix>.<n>".
+
+    Open files have no footer yet, they are written under "<dbdir>/_inprogress/" and moved into
+    place when closed, after their sidecars, so readers of "<dbdir>/*" only see finished files.'''
+PARQUET_SCHEMA_VERSION = '0.5'
+# Key of the schema version in the file metadata
+SCHEMA_VERSION_KEY = b'trctools.schema_version'
 DEFAULT_FS = 'local'
+# Files being written, out of the reach of the "<dbdir>/*" glob
+INPROGRESS_DIR = '_inprogress'
+# Low cardinality strings are dictionary columns, like in the column buffer
+DICT_TYPE = pa.dictionary(pa.int32(), pa.string())
 
+# Since 0.5 the low cardinality strings are dictionary columns, and line, plh and hv are
+# 32 bits: hash values and plan hash values are 32 bits in the trace. summary.py reads the older
+# files too.
 PARQUET_SCHEMA = pa.schema([
     ('span_id', pa.uint64()),
-    ('sql_id', pa.string()),
-    ('cursor_id', pa.string()),
-    ('ops', pa.string()),
+    ('sql_id', DICT_TYPE),
+    ('cursor_id', DICT_TYPE),
+    ('ops', DICT_TYPE),
     ('cpu_time', pa.uint64()),
     ('elapsed_time', pa.uint64()),
     ('ph_reads', pa.uint64()),
@@ -24,81 +50,290 @@ PARQUET_SCHEMA = pa.schema([
     ('rows_processed', pa.uint64()),
     ('rec_call_dp', pa.uint8()),
     ('opt_goal', pa.uint8()),
-    ('plh', pa.uint64()),
+    ('plh', pa.uint32()),
     ('tim', pa.uint64()),
     ('c_type', pa.uint8()),
-    ('event_name', pa.string()),
+    ('event_name', DICT_TYPE),
     ('event_raw', pa.string()),
-    ('file_name', pa.string()),
-    ('line', pa.uint64()),
+    ('file_name', DICT_TYPE),
+    ('line', pa.uint32()),
     ('ts', pa.timestamp('us')),
     # Next 6 is for PIC
     ('len', pa.uint32()),
     ('uid', pa.uint32()),
     ('oct', pa.uint16()),
     ('lid', pa.uint16()),
-    ('hv', pa.uint64()),
+    ('hv', pa.uint32()),
     ('ad', pa.string()),
     # For XCTEND
     ('rlbk', pa.uint8()),
     ('rd_only', pa.uint8()),
     # For LOBs
-    ('lobtype', pa.string()),
+    ('lobtype', DICT_TYPE),
     ('bytes', pa.uint64()),
-    ('sid', pa.string()),
-    ('client_id', pa.string()),
-    ('service_name', pa.string()),
-    ('module', pa.string()),
-    ('action', pa.string()),
+    ('sid', DICT_TYPE),
+    ('client_id', DICT_TYPE),
+    ('service_name', DICT_TYPE),
+    ('module', DICT_TYPE),
+    ('action', DICT_TYPE),
     ('container_id', pa.uint16()),
     ('error_code', pa.uint16()), # Populated for the ERROR call
 ])
 
+# ops.FIELD_NAMES are in the PARQUET_SCHEMA order
+# Fields that can be something else than int, or are not set for every row
+OBJECT_FIELDS = {'sql_id': '', 'cursor': '', 'op_type': '', 'name': '', 'raw': '', 'fname': '',
+                 'ts': None, 'ad': '', 'lobtype': '', 'sid': '', 'client_id': '',
+                 'service_name': '', 'module': '', 'action': '', 'container_id': 0}
+# Fields that are set for the file or session, not for the line. Row keeps these in one tuple.
+SESSION_FIELDS = ('fname', 'sid', 'client_id', 'service_name', 'module', 'action',
+                  'container_id')
+# Rows in one column block
+BLOCK_SIZE = 65536
+# String fields with few distinct values. The parser interns these, and they are buffered as
+# dictionary arrays: codes and one copy of each value per block instead of a copy per row. Written
+# to Parquet as they are, the dictionary columns of PARQUET_SCHEMA.
+DICT_FIELDS = frozenset(('sql_id', 'cursor', 'op_type', 'name', 'fname', 'lobtype', 'sid',
+                         'client_id', 'service_name', 'module', 'action'))
+# Columns that grow steadily with the row, DELTA_BINARY_PACKED instead of the dictionary encoding
+DELTA_COLUMNS = ('tim', 'ts', 'line')
+
+class ColumnBuffer:
+    """Buffers rows column by column, in preallocated blocks of BLOCK_SIZE rows. Integer columns
+        are kept in array.array, the rest in lists. Full blocks are turned into record batches.
+        Defaults are the same as in ops.FIELDS. SESSION_FIELDS come in the 'session' tuple, these
+        are stored as tuples and split into columns when the block is sealed. Block is allocated
+        by the first row.
+
+        Ops come as values, lists with every field in the FIELD_NAMES order. These are kept as
+        they are and turned into columns by zip() when the block is sealed, which is several
+        times faster than writing each field into its column in Python."""
+    def __init__(self, block_size: int = BLOCK_SIZE) -> None:
+        self.block_size = block_size
+        self.batches: list[pa.RecordBatch] = []
+        self.length = 0
+        self.columns: dict = {}
+        # Ops.values of the block
+        self.rows: list[list] = []
+        self._zeros = bytes(8 * block_size)
+    def __len__(self) -> int:
+        return self.length + len(self.rows) + sum(b.num_rows for b in self.batches)
+    def _new_block(self) -> None:
+        self.columns = {}
+        self.columns['session'] = [None] * self.block_size
+        for name in FIELD_NAMES:
+            if name in SESSION_FIELDS:
+                continue
+            if name in OBJECT_FIELDS:
+                self.columns[name] = [OBJECT_FIELDS[name]] * self.block_size
+            else:
+                self.columns[name] = array('q', self._zeros)
+        self.length = 0
+    def append(self, row: dict, span_id: int, sql_id: str) -> None:
+        """Writes the row: dict with ops.FIELD_NAMES as keys."""
+        if self.length == self.block_size:
+            self.seal()
+        if self.length == 0:
+            self._new_block()
+        idx = self.length
+        cols = self.columns
+        for (key, value) in row.items():
+            if (col := cols.get(key)) is not None:
+                col[idx] = value
+        cols['span_id'][idx] = span_id
+        cols['sql_id'][idx] = sql_id
+        self.length += 1
+    def append_values(self, values: list, span_id: int, sql_id: str) -> None:
+        """Adds the row: Ops.values. Sets span_id and sql_id in the values."""
+        if len(self.rows) == self.block_size:
+            self.seal()
+        values[SPAN_ID] = span_id
+        values[SQL_ID] = sql_id
+        self.rows.append(values)
+    def _seal_rows(self) -> None:
+        arrays = [pa.array(col, DICT_TYPE) if name in DICT_FIELDS else pa.array(col)
+                  for (name, col) in zip(FIELD_NAMES, zip(*self.rows))]
+        self.batches.append(pa.RecordBatch.from_arrays(arrays, schema=PARQUET_SCHEMA))
+        self.rows = []
+    def seal(self) -> None:
+        """Turns the current block into record batch and starts a new one."""
+        if self.rows:
+            self._seal_rows()
+        if self.length == 0:
+            return
+        arrays = []
+        columns = self.columns
+        columns.update(zip(SESSION_FIELDS, map(list, zip(*columns['session'][:self.length]))))
+        for (name, field) in zip(FIELD_NAMES, PARQUET_SCHEMA):
+            col = columns[name]
+            if name in DICT_FIELDS:
+                arrays.append(pa.array(col[:self.length], DICT_TYPE))
+            elif isinstance(col, array):
+                arr = pa.Array.from_buffers(pa.int64(), self.length, [None, pa.py_buffer(col)])
+                arrays.append(arr.cast(field.type))
+            else:
+                # Inferred and then cast, like RecordBatch.from_arrays does in _seal_rows.
+                # CONTAINER ID comes as a string, for example.
+                arrays.append(pa.array(col[:self.length]).cast(field.type))
+        self.batches.append(pa.RecordBatch.from_arrays(arrays, schema=PARQUET_SCHEMA))
+        self.columns = {}
+        self.length = 0
+    def take_batches(self, seal: bool = True) -> list[pa.RecordBatch]:
+        """Returns the batches, and clears the list. Seals the current block first if asked."""
+        if seal:
+            self.seal()
+        (out, self.batches) = (self.batches, [])
+        return out
+
+# Partition columns: date and hour of the span start in UTC, and the session fields
+PARTITION_KEYS = ('date', 'hour', 'service_name', 'client_id', 'module', 'action')
+# Partition of the null and empty values, DuckDB reads it as null
+DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+# Parquet codecs, 'none' is uncompressed
+CODECS = ('zstd', 'lz4', 'snappy', 'gzip', 'brotli', 'none')
+
+@dataclass(frozen=True)
+class WriterOptions:
+    """How the Parquet files are written. Row group is cut at the span boundary, so it can be
+        a span longer than row_group_size rows."""
+    # Rows in one row group. Buffered rows and the row group being written are in memory.
+    row_group_size: int = 4 * BLOCK_SIZE
+    # File is closed and the next one started when it grows over that many bytes
+    file_size: int = 256 * 1024 * 1024
+    # or when it has been open for that many seconds, 0 is no limit. Rows become visible to the
+    # readers when the file is closed.
+    file_age: float = 0
+    # Codec of the columns, and its level. None is the default level of the codec.
+    compression: str = 'zstd'
+    compression_level: Optional[int] = None
+    # {column: (codec, level)}, overrides the above
+    column_compression: dict = field(default_factory=dict)
+    # Partition columns of the hive partitioned layout, from PARTITION_KEYS. Empty for the flat
+    # layout.
+    partition_by: tuple[str, ...] = ()
+    def writer_args(self) -> dict:
+        """Compression and encoding arguments for pq.ParquetWriter"""
+        encodings = {'use_dictionary': [name for name in PARQUET_SCHEMA.names
+                                        if name not in DELTA_COLUMNS],
+                     'column_encoding': dict.fromkeys(DELTA_COLUMNS, 'DELTA_BINARY_PACKED')}
+        if not self.column_compression:
+            return {'compression': self.compression, 'compression_level': self.compression_level,
+                    **encodings}
+        codecs = {name: self.compression for name in PARQUET_SCHEMA.names}
+        levels = {name: self.compression_level for name in PARQUET_SCHEMA.names
+                  if self.compression_level is not None}
+        for (name, (codec, level)) in self.column_compression.items():
+            codecs[name] = codec
+            if level is None:
+                levels.pop(name, None)
+            else:
+                levels[name] = level
+        return {'compression': codecs, 'compression_level': levels or None, **encodings}
+
+def parse_column_compression(spec: str) -> dict:
+    """Parses 'column=codec[:level],...' into WriterOptions.column_compression"""
+    out = {}
+    for item in filter(None, spec.split(',')):
+        (name, _, codec) = item.strip().partition('=')
+        (codec, _, level) = codec.partition(':')
+        if name not in PARQUET_SCHEMA.names:
+            raise ValueError(f"Unknown column: {name}")
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        if level and codec in ('snappy', 'none'):
+            raise ValueError(f"{codec} has no levels")
+        out[name] = (codec, int(level) if level else None)
+    return out
+
+def parse_partition_by(spec: str) -> tuple[str, ...]:
+    """Parses 'key,...' into WriterOptions.partition_by"""
+    keys = tuple(key.strip() for key in spec.split(',') if key.strip())
+    for key in keys:
+        if key not in PARTITION_KEYS:
+            raise ValueError(f"Unknown partition column: {key}")
+    if len(set(keys)) != len(keys):
+        raise ValueError(f"Repeated partition column: {spec}")
+    return keys
+
+def partition_paths(tbl: pa.Table, spans: pa.Table, keys: tuple[str, ...]) -> pa.Array:
+    """Partition directory, "key=value/...", of every span of the span summary. Values come
+        from the span summary and the first rows of the spans in tbl."""
+    columns = [key for key in keys if key not in ('date', 'hour')]
+    firsts = pa.table({'span_id': tbl['span_id'],
+                       **{key: tbl[key].cast(pa.string()) for key in columns}}) \
+        .group_by('span_id', use_threads=False).aggregate([(key, 'first') for key in columns])
+    idx = pc.index_in(spans['span_id'], value_set=firsts['span_id'])
+    values = {key: pc.take(firsts[f'{key}_first'], idx).to_pylist() for key in columns}
+    values['date'] = pc.strftime(spans['ts'], '%Y-%m-%d').to_pylist()
+    values['hour'] = pc.strftime(spans['ts'], '%H').to_pylist()
+    return pa.array(['/'.join(f"{key}={quote(value, safe='') if value else DEFAULT_PARTITION}"
+                              for (key, value) in zip(keys, row))
+                     for row in zip(*(values[key] for key in keys))], pa.string())
+
+@dataclass
+class _OpenFile:
+    """Parquet file being written, and the span summaries and histograms of its row groups"""
+    number: int
+    stream: pa.NativeFile
+    writer: pq.ParquetWriter
+    # time.monotonic() when the file was opened
+    opened: float = field(default_factory=time.monotonic)
+    spans: list[pa.Table] = field(default_factory=list)
+    hists: list[pa.Table] = field(default_factory=list)
+
+def get_fs(fstype: str = DEFAULT_FS, fopt: Union[dict, None] = None) -> pa.fs.FileSystem:
+    """Initialises pyarrow FileSystem"""
+    if not fopt:
+        fopt = {}
+    match fstype:
+        case 'local':
+            return pa.fs.LocalFileSystem(**fopt)
+        case 's3':
+            return pa.fs.S3FileSystem(**fopt)
+        case 'gcs':
+            return pa.fs.GcsFileSystem(**fopt)
+        case 'hadoop':
+            return pa.fs.HadoopFileSystem(**fopt)
+        case 'subtree':
+            return pa.fs.SubTreeFileSystem(**fopt)
+        case _:
+            raise ValueError(f"Unknown file system: {fstype}")
+
 class Backend:
     """pyarrow/Parquet storage backend"""
-    def __init__(self, dbdir: str, prefix: str) -> None:
+    def __init__(self, dbdir: str, prefix: str, span_id_base: int = 0,
+                 histogram_digits: int = DIGITS, options: WriterOptions = WriterOptions()) -> None:
         self.dbdir = dbdir
-        self.filename = f'{dbdir}/{prefix}'
-        self._span_id: int = 0
-        self._ops_list: list = []
+        self.prefix = prefix
+        self.histogram_digits = histogram_digits
+        self.options = options
+        # Span ids are generated from span_id_base + 1 onwards. count() is atomic, the writer
+        # thread takes the id for the schema version record.
+        self._span_ids = itertools.count(span_id_base + 1)
+        self._buffer = ColumnBuffer()
+        # Number of the next file, and the open files by the partition directory, '' in the flat
+        # layout. Used by the writer thread only.
         self._flush_count: int = 0
-        self._table: Optional[pa.Table] = None
+        self._files: dict[str, _OpenFile] = {}
         self.future: Future = None
         self.executor = ThreadPoolExecutor(max_workers=1)
 
         self.set_fs()
     def set_fs(self, fstype: str = DEFAULT_FS, fopt: Union[dict, None] = None) -> None:
         """Sets pyarrow FileSystem"""
-        if not fopt:
-            fopt = {}
-        match fstype:
-            case 'local':
-                self.fs = pa.fs.LocalFileSystem(**fopt)
-                self.fs.create_dir(self.dbdir)
-            case 's3':
-                self.fs = pa.fs.S3FileSystem(**fopt)
-            case 'gcs':
-                self.fs = pa.fs.GcsFileSystem(**fopt)
-            case 'hadoop':
-                self.fs = pa.fs.HadoopFileSystem(**fopt)
-            case 'subtree':
-                self.fs = pa.fs.SubTreeFileSystem(**fopt)
-            case _:
-                raise ValueError(f"Unknown file system: {fstype}")
+        self.fs = get_fs(fstype, fopt)
+        self._local = fstype == 'local'
+        if self._local:
+            self.fs.create_dir(f'{self.dbdir}/{SPANS_DIR}')
+            self.fs.create_dir(f'{self.dbdir}/{HISTOGRAM_DIR}')
+            self.fs.create_dir(f'{self.dbdir}/{INPROGRESS_DIR}')
     def get_span_id(self) -> int:
         '''Span id generator'''
-        self._span_id += 1
-        return self._span_id
-    def _batch2table(self) -> None:
-        ''' Compresses self._ops_list into arrays, turns arrays into table and merges it
-            with self._table.'''
-        arrays = [pa.array(i) for i in zip(*self._ops_list)]
-        tbl = pa.Table.from_arrays(arrays, schema = PARQUET_SCHEMA)
-        if self._table:
-            self._table = pa.concat_tables([self._table, tbl])
-        else:
-            self._table = tbl
-        self._ops_list = []
+        return next(self._span_ids)
+    def _batch2table(self) -> pa.Table:
+        ''' Seals the column buffer and turns its blocks into the table.'''
+        return pa.Table.from_batches(self._buffer.take_batches(), schema=PARQUET_SCHEMA)
     def _inject_schema_version(self) -> pa.Table:
         '''Adds Parquet schema version record to the generated file.'''
         schema_record = [[self.get_span_id()], [None], [None], ['HEADER'], [None], [None], [None],
@@ -110,39 +345,119 @@ class Backend:
         tbl = pa.Table.from_arrays(schema_record, schema = PARQUET_SCHEMA)
         return tbl
     def check_and_execute(self) -> None:
-        '''Flushes the data to the disk in the background and checks if any of the previous
-            flushes have completed'''
+        '''Hands the buffered rows to the writer thread as one row group. Waits for the previous
+            row group first, so that at most two are in memory.'''
+        tbl = self._batch2table()
+        self._wait_writer()
+        self.future = self.executor.submit(self.flush_batches, tbl)
+    def _wait_writer(self) -> None:
+        '''Waits for the previous flush, raises its exception'''
         if self.future:
             ex = self.future.exception()
             if ex:
                 raise RuntimeError(ex)
-        self.future = self.executor.submit(self.flush_batches, self._table)
 
     def add_ops(self, span_id: int, sql_id: str, ops) -> None:
-        ''' Adds list of ops to the batch. Checks the size of the _ops_list and _table and
-            triggers flush if needed.'''
-        self._ops_list += [o.astuple(span_id, sql_id) for o in ops]
-        if len(self._ops_list) > BUFFER_SIZE/100:
-            self._batch2table()
-        if self._table and self._table.get_total_buffer_size() > BUFFER_SIZE:
+        ''' Writes the list of ops into the column buffer. Hands the row group to the writer
+            when there are enough rows.'''
+        append = self._buffer.append_values
+        for o in ops:
+            append(o.values, span_id, sql_id)
+        self._check_size()
+    def _check_size(self) -> None:
+        if len(self._buffer) >= self.options.row_group_size:
             self.check_and_execute()
-            self._table = None
+    def _path(self, subdir: str, partition: str, number: int) -> str:
+        '''Name of the file in dbdir or in its sidecar subdir, '' for the raw files'''
+        return '/'.join(filter(None, (self.dbdir, subdir, partition,
+                                      f'{self.prefix}.{number}')))
+    def _partitions(self, tbl: pa.Table, spans: pa.Table) -> Iterator[tuple]:
+        '''Splits the table and its span summary by partition: (partition, ops, spans)'''
+        if not self.options.partition_by:
+            yield ('', tbl, spans)
+            return
+        span_paths = partition_paths(tbl, spans, self.options.partition_by)
+        row_paths = pc.take(span_paths, pc.index_in(tbl['span_id'], value_set=spans['span_id']))
+        for partition in pc.unique(span_paths).to_pylist():
+            yield (partition, tbl.filter(pc.equal(row_paths, partition)),
+                   spans.filter(pc.equal(span_paths, partition)))
     def flush_batches(self, tbl) -> None:
-        '''Flushes everything to the disk.'''
-        sch = self._inject_schema_version()
-        tbl = pa.concat_tables([tbl, sch])
-        with self.fs.open_output_stream(f'{self.filename}.{self._flush_count}') as fstream:
-            pq.write_table(tbl, fstream, compression='gzip')
-            fstream.flush()
-        del tbl
+        '''Writes the table as a row group of the current file of every partition it has rows
+            of, opens the file if needed. Closes the file when it grows over options.file_size
+            or gets older than options.file_age.'''
+        tbl = tbl.cast(PARQUET_SCHEMA)
+        for (partition, ops, spans) in self._partitions(tbl, spans_table(tbl)):
+            out = self._files.get(partition)
+            if out is None:
+                out = self._files[partition] = self._open_file(partition)
+                ops_out = pa.concat_tables([ops, self._inject_schema_version()])
+            else:
+                ops_out = ops
+            out.spans.append(spans)
+            out.hists.append(histograms_table(ops, spans, self.histogram_digits))
+            out.writer.write_table(ops_out, row_group_size=ops_out.num_rows)
+            del ops_out
+            if out.stream.tell() >= self.options.file_size or self._aged(out):
+                self._close_file(partition)
+    def _open_file(self, partition: str) -> _OpenFile:
+        '''Opens the next file of the partition. Schema version record is added to its first
+            row group, for the readers that don't look at the metadata.'''
+        if self._local and partition:
+            for subdir in ('', SPANS_DIR, HISTOGRAM_DIR, INPROGRESS_DIR):
+                self.fs.create_dir('/'.join(filter(None, (self.dbdir, subdir, partition))))
+        number = self._flush_count
         self._flush_count += 1
+        stream = self.fs.open_output_stream(self._path(INPROGRESS_DIR, partition, number))
+        schema = PARQUET_SCHEMA.with_metadata({SCHEMA_VERSION_KEY: PARQUET_SCHEMA_VERSION})
+        return _OpenFile(number, stream,
+                         pq.ParquetWriter(stream, schema, **self.options.writer_args()))
+    def _close_file(self, partition: str = '') -> None:
+        '''Closes the current file of the partition, writes its span summary and histograms
+            and moves the file into place'''
+        out = self._files.pop(partition, None)
+        if out is None:
+            return
+        out.writer.close()
+        out.stream.close()
+        # Span summaries and histograms have no column overrides
+        compression = {'compression': self.options.compression,
+                       'compression_level': self.options.compression_level}
+        with self.fs.open_output_stream(self._path(SPANS_DIR, partition, out.number)) as fstream:
+            pq.write_table(pa.concat_tables(out.spans), fstream, **compression)
+        with self.fs.open_output_stream(self._path(HISTOGRAM_DIR, partition, out.number)) \
+                as fstream:
+            pq.write_table(merge_tables(out.hists), fstream, **compression)
+        self.fs.move(self._path(INPROGRESS_DIR, partition, out.number),
+                     self._path('', partition, out.number))
+    def _aged(self, out: _OpenFile) -> bool:
+        return bool(self.options.file_age) and \
+            time.monotonic() - out.opened >= self.options.file_age
+    def _close_files(self, aged: bool = False) -> None:
+        '''Closes the files of all partitions, or just the ones older than options.file_age'''
+        for (partition, out) in list(self._files.items()):
+            if not aged or self._aged(out):
+                self._close_file(partition)
     def flush(self) -> None:
-        '''Flushes the _ops_list to the table, and table to the disk.'''
-        if len(self._ops_list) > 0:
-            self._batch2table()
-        if self._table is not None:
+        '''Writes the buffered rows, and closes the files.'''
+        if len(self._buffer) > 0:
+            self.check_and_execute()
+        self._wait_writer()
+        self.future = self.executor.submit(self._close_files)
+        self._wait_writer()
+    def write_row_group(self) -> None:
+        '''Writes the buffered rows as a row group, the files stay open until they grow over
+            options.file_size or get older than options.file_age. Follow mode calls this instead
+            of flush().'''
+        if len(self._buffer) > 0:
             self.check_and_execute()
-            self._table = None
-        ex = self.future.exception()
-        if ex:
-            raise RuntimeError(ex)
+        if self.options.file_age:
+            self._wait_writer()
+            self.future = self.executor.submit(self._close_files, True)
+
+class ColumnarBackend(Backend):
+    """Backend for the columnar engine. Takes columnar.Row's instead of Ops."""
+    def add_ops(self, span_id: int, sql_id: str, ops) -> None:
+        append = self._buffer.append
+        for row in ops:
+            append(row, span_id, sql_id)
+        self._check_size()
@@ -68,4 +68,4 @@ class Backend:
                 sp.add_event(o['op_type'], o, last_ts)
         sp.end(last_ts)
     def flush(self):
-        pass
+        self.processor.force_flush()
@@ -0,0 +1,88 @@
+"""Decompression and parse throughput per codec. For every codec reports MB/s of reading the lines
+    with the stdlib module and with decompress.DecompressedFile (one thread, and decompress.THREADS
+    threads), and lines/s of process_file() with both. Multi-member files are made of independently
+    compressed 1 MB pieces, like bgzip or pbzip2 output.
+
+    Usage: python bench/bench_decompress.py [repeat]"""
+import bz2
+import gzip
+import io
+import lzma
+import os
+import sys
+import tempfile
+import time
+
+from common import make_trace
+
+import decompress
+import trcparser
+from call_tracker import CallTracker
+from tests.mock_backend import Backend
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MEMBER_SIZE = 1 << 20
+
+def members(data: bytes, compress) -> bytes:
+    return b''.join(compress(data[i:i + MEMBER_SIZE]) for i in range(0, len(data), MEMBER_SIZE))
+
+def codecs() -> list[tuple]:
+    """(name, DecompressedFile format, compress function, stdlib open)"""
+    out = [
+        ('gzip', 'gzip', gzip.compress, gzip.open),
+        ('gzip multi', 'gzip', lambda d: members(d, gzip.compress), gzip.open),
+        ('bzip2', 'bzip2', bz2.compress, bz2.open),
+        ('bzip2 multi', 'bzip2', lambda d: members(d, bz2.compress), bz2.open),
+        ('xz', 'xz', lzma.compress, lzma.open),
+    ]
+    if zstandard:
+        cctx = zstandard.ZstdCompressor()
+        dctx = zstandard.ZstdDecompressor()
+        def zstd_open(fname, mode):
+            return io.BufferedReader(dctx.stream_reader(open(fname, mode), read_across_frames=True,
+                                                        closefd=True))
+        out.append(('zstd', 'zstd', cctx.compress, zstd_open))
+        out.append(('zstd multi', 'zstd', lambda d: members(d, cctx.compress), zstd_open))
+    return out
+
+def read_rate(opener, fname: str, size: int) -> float:
+    start = time.perf_counter()
+    with opener(fname, 'rb') as fdesc:
+        for _ in fdesc:
+            pass
+    return size/(time.perf_counter() - start)/1e6
+
+def parse_rate(opener, fname: str) -> float:
+    tracker = CallTracker(Backend())
+    start = time.perf_counter()
+    with opener(fname, 'rb') as trace:
+        (lines, _) = trcparser.process_file(tracker, fname, trace=trace)
+    tracker.flush()
+    return lines/(time.perf_counter() - start)
+
+def main(repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        plain = make_trace(os.path.join(tmpdir, 'bench.trc'), repeat, 'tests/traces/mixed_execs.trc')
+        with open(plain, 'rb') as fdesc:
+            data = fdesc.read()
+        print(f'{len(data)/1e6:.1f} MB trace file, {decompress.THREADS} threads')
+        for (name, fmt, compress, stdlib_open) in codecs():
+            fname = os.path.join(tmpdir, name.replace(' ', '_'))
+            with open(fname, 'wb') as fdesc:
+                fdesc.write(compress(data))
+            one = lambda f, m, fmt=fmt: decompress.DecompressedFile(f, m, fmt, 1)
+            many = lambda f, m, fmt=fmt: decompress.DecompressedFile(f, m, fmt)
+            openers = (('stdlib', stdlib_open), ('1 thread', one), ('threads', many))
+            reads = ', '.join(f'{label} {read_rate(opener, fname, len(data)):7.1f}'
+                              for (label, opener) in openers if opener)
+            parses = ', '.join(f'{label} {parse_rate(opener, fname):7.0f}'
+                               for (label, opener) in openers if opener)
+            print(f'{name:>12}: read MB/s: {reads}')
+            print(f'{"":>12}  parse lines/s: {parses}')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
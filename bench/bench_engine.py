@@ -0,0 +1,44 @@
+"""Compares the ingestion engines, ops and columnar: lines/s and peak RSS of processing a
+    synthetic trace file into Parquet. Every engine runs in its own process.
+
+    Usage: python bench/bench_engine.py [repeat]"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, make_trace
+
+def run(engine: str, fname: str, dbdir: str) -> None:
+    from call_tracker import CallTracker
+    from columnar import row_factory
+    from backend.arrow import Backend, ColumnarBackend
+    import trcparser
+
+    start = time.perf_counter()
+    if engine == 'columnar':
+        tracker = CallTracker(ColumnarBackend(dbdir, engine), row_factory)
+    else:
+        tracker = CallTracker(Backend(dbdir, engine))
+    (lines, _) = trcparser.process_file(tracker, fname)
+    tracker.flush()
+    elapsed = time.perf_counter() - start
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{engine:>10}: {lines} lines, {elapsed:.2f} s, {lines/elapsed:.0f} lines/s, '
+          + f'peak RSS {maxrss/1024:.0f} MB')
+
+def main(repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = make_trace(os.path.join(tmpdir, 'bench.trc'), repeat, 'tests/traces/mixed_execs.trc')
+        print(f'{os.path.getsize(fname)/1024/1024:.1f} MB trace file')
+        for engine in ('ops', 'columnar'):
+            subprocess.run([sys.executable, __file__, '--run', engine, fname,
+                            os.path.join(tmpdir, engine)], check=True, cwd=ROOT)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        run(*sys.argv[2:5])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,98 @@
+"""Memory and speed of the Ops records. Compares ops.Ops with the DatabaseOp dataclass wrapped into
+    Ops with __getattr__ redirection, as it was before: bytes per record, records/s of
+    ops_factory() and astuple(), and attribute reads/s. Then runs process_file() with the Parquet
+    backend over a synthetic trace of the given number of lines and reports the peak RSS. Ops
+    live until their span is dumped, their values until backend.arrow.BLOCK_SIZE rows are
+    buffered, and the rest of the row group until WriterOptions.row_group_size rows.
+
+    Usage: python bench/bench_ops.py [lines]"""
+from dataclasses import field, make_dataclass
+import gc
+from operator import attrgetter
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import make_trace
+
+import ops
+import trcparser
+from backend.arrow import Backend
+from call_tracker import CallTracker
+from tests import test_constants
+
+# DatabaseOp as it was
+DatabaseOp = make_dataclass('DatabaseOp', [(name, object, field(default=default))
+                                            for (name, default) in ops.FIELDS], kw_only=True)
+_astuple = attrgetter(*ops.FIELD_NAMES)
+
+class LegacyExec:
+    """Ops wrapping DatabaseOp, with the attributes redirected through __getattr__"""
+    def __init__(self, op_type, cursor, params, fmeta, ts_callback):
+        self.dbop = DatabaseOp(op_type=op_type, cursor=cursor, fname=fmeta['FILE_NAME'],
+                               line=fmeta['LINE_COUNT'], sid=fmeta['SID'],
+                               client_id=fmeta['CLIENT ID'], service_name=fmeta['SERVICE NAME'],
+                               module=fmeta['MODULE'], action=fmeta['ACTION'],
+                               container_id=fmeta['CONTAINER ID'])
+        self.ts_callback = ts_callback
+        self.dbop.__dict__.update(ops.exec_fields(params))
+    def __getattr__(self, name):
+        if name in self.dbop.__dict__:
+            return self.dbop.__dict__[name]
+        raise AttributeError(name)
+    def astuple(self, span_id, sql_id):
+        self.dbop.span_id = span_id
+        self.dbop.sql_id = sql_id
+        if self.dbop.ts is None and self.ts_callback is not None:
+            self.dbop.ts = self.ts_callback(self.dbop.tim)
+        return _astuple(self.dbop)
+
+PARAMS = b'c=73,e=73,p=1,cr=2,cu=3,mis=4,r=5,dep=6,og=7,plh=2725028981,tim=5793511830834'
+COUNT = 100000
+
+def make(factory) -> list:
+    return [factory('EXEC', test_constants.CURSOR, PARAMS, test_constants.FMETA, lambda tim: None)
+            for _ in range(COUNT)]
+
+def measure(name: str, factory) -> None:
+    gc.collect()
+    tracemalloc.start()
+    records = make(factory)
+    size = tracemalloc.get_traced_memory()[0] / COUNT
+    tracemalloc.stop()
+    start = time.perf_counter()
+    make(factory)
+    created = COUNT / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for rec in records:
+        rec.astuple(1, 'abc')
+    tuples = COUNT / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for rec in records:
+        (rec.op_type, rec.cursor, rec.tim, rec.e)
+    reads = 4 * COUNT / (time.perf_counter() - start)
+    print(f'{name:>8}: {size:6.0f} bytes/record, {created:9.0f} records/s, astuple {tuples:9.0f}/s, '
+          + f'attribute reads {reads:10.0f}/s')
+
+def main(lines: int) -> None:
+    # First, before the records of measure() take the memory
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = 'tests/traces/mixed_execs.trc'
+        with open(os.path.join(os.path.dirname(__file__), '..', source), 'rb') as fdesc:
+            repeat = max(1, lines // fdesc.read().count(b'\n'))
+        fname = make_trace(os.path.join(tmpdir, 'bench.trc'), repeat, source)
+        tracker = CallTracker(Backend(os.path.join(tmpdir, 'out'), 'bench'))
+        start = time.perf_counter()
+        (count, _) = trcparser.process_file(tracker, fname)
+        tracker.flush()
+        elapsed = time.perf_counter() - start
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'process_file: {count} lines, {count/elapsed:.0f} lines/s, peak RSS {maxrss/1024:.0f} MB')
+    measure('legacy', LegacyExec)
+    measure('ops', ops.ops_factory)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
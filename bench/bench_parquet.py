@@ -0,0 +1,88 @@
+"""Parquet codecs: write throughput, file size and the time of summary.py summary on the raw
+    rows, for every codec and for the per column overrides. Rows come from a synthetic trace
+    file, parsed once. Summary query reads the raw rows, not the span summaries. Last row is
+    zstd in the schema 0.4: plain strings, 64 bit line, plh and hv, no delta encodings.
+
+    Usage: python bench/bench_parquet.py [repeat]"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from common import make_trace
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import trcparser
+from backend.arrow import Backend, PARQUET_SCHEMA, WriterOptions, parse_column_compression
+from call_tracker import CallTracker
+from summary import SummaryDuckdb
+
+# Heavier compression on the SQL text, waits and binds, none on the low cardinality columns
+# that Parquet dictionary-encodes anyway
+OVERRIDES = 'event_raw=zstd:9,ops=none,sql_id=none,cursor_id=none,event_name=none,file_name=none'
+
+CHOICES = (
+    ('gzip', WriterOptions(compression='gzip')),
+    ('zstd', WriterOptions()),
+    ('zstd:9', WriterOptions(compression_level=9)),
+    ('lz4', WriterOptions(compression='lz4')),
+    ('snappy', WriterOptions(compression='snappy')),
+    ('none', WriterOptions(compression='none')),
+    ('zstd+overrides', WriterOptions(column_compression=parse_column_compression(OVERRIDES))),
+)
+
+# Schema 0.4
+OLD_SCHEMA = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_dictionary(f.type)
+                       else pa.field(f.name, pa.uint64()) if f.name in ('line', 'plh', 'hv')
+                       else f for f in PARQUET_SCHEMA])
+
+def load(fname: str, tmpdir: str) -> pa.Table:
+    """Rows of the trace file, in PARQUET_SCHEMA"""
+    backend = Backend(os.path.join(tmpdir, 'load'), 'bench',
+                      options=WriterOptions(row_group_size=sys.maxsize))
+    tracker = CallTracker(backend)
+    trcparser.process_file(tracker, fname)
+    tracker.reset()
+    return backend._batch2table().cast(PARQUET_SCHEMA)
+
+def write(tbl: pa.Table, dbdir: str, options: WriterOptions, old: bool = False) -> float:
+    os.makedirs(dbdir)
+    start = time.perf_counter()
+    if old:
+        (tbl, schema, args) = (tbl.cast(OLD_SCHEMA), OLD_SCHEMA, {'compression': 'zstd'})
+    else:
+        (schema, args) = (PARQUET_SCHEMA, options.writer_args())
+    with pq.ParquetWriter(os.path.join(dbdir, 'bench.0'), schema, **args) as writer:
+        for batch in tbl.to_batches(options.row_group_size):
+            writer.write_batch(batch, row_group_size=options.row_group_size)
+    return time.perf_counter() - start
+
+def query(dbdir: str) -> float:
+    """Best of three"""
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            SummaryDuckdb(f'{dbdir}/*', 'simple', 30, True).summary({})
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = make_trace(os.path.join(tmpdir, 'bench.trc'), repeat, 'tests/traces/mixed_execs.trc')
+        tbl = load(fname, tmpdir)
+        size = tbl.get_total_buffer_size()
+        print(f'{tbl.num_rows} rows, {size/1e6:.1f} MB in Arrow')
+        for (name, options) in CHOICES + (('zstd, 0.4', WriterOptions()),):
+            dbdir = os.path.join(tmpdir, name)
+            elapsed = write(tbl, dbdir, options, name.endswith('0.4'))
+            fsize = os.path.getsize(os.path.join(dbdir, 'bench.0'))
+            print(f'{name:>15}: write {size/elapsed/1e6:6.1f} MB/s, file {fsize/1e6:6.1f} MB, '
+                  + f'summary {query(dbdir)*1000:6.1f} ms')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,70 @@
+"""Timestamp parsing of the *** lines: strptime_timestamp() against TimestampParser, without the
+    cache (every timestamp different) and with the repeated timestamps, and process_file() over
+    the trace where every call is preceded by the session and client id lines, like in the
+    traces of the connection pool.
+
+    Usage: python bench/bench_timestamp.py [count]"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from common import make_trace
+
+import timestamp
+import trcparser
+from call_tracker import CallTracker
+from tests.mock_backend import Backend
+
+def timestamps(count: int, tz: str) -> list[str]:
+    start = datetime.datetime(2023, 5, 19, 5, 28)
+    return [(start + datetime.timedelta(microseconds=37*i)).isoformat(timespec='microseconds')
+            + tz for i in range(count)]
+
+def pooled_trace(fname: str, repeat: int) -> str:
+    """no_timezone.trc with the session header (*** lines) in front of every repeated body"""
+    make_trace(fname, 1, 'tests/traces/no_timezone.trc')
+    with open(fname, 'rb') as fdesc:
+        trace = fdesc.read()
+    stars = trace.index(b'\n*** SESSION ID') + 1
+    body = trace.index(b'\n=====================') + 1
+    with open(fname, 'wb') as fdesc:
+        fdesc.write(trace[:body])
+        for _ in range(repeat):
+            fdesc.write(trace[stars:])
+    return fname
+
+def rate(func, sample) -> float:
+    start = time.perf_counter()
+    for instr in sample:
+        func(instr)
+    return len(sample)/(time.perf_counter() - start)
+
+def parse_rate(fname: str) -> float:
+    tracker = CallTracker(Backend())
+    start = time.perf_counter()
+    (lines, _) = trcparser.process_file(tracker, fname)
+    tracker.flush()
+    return lines/(time.perf_counter() - start)
+
+def main(count: int) -> None:
+    for (name, tz) in (('with tz', '+02:00'), ('no tz', '')):
+        unique = timestamps(count, tz)
+        # Every timestamp 10 times, like the *** lines of the pooled sessions
+        repeated = [instr for instr in unique[:count//10] for _ in range(10)]
+        for (label, sample) in (('unique', unique), ('repeated', repeated)):
+            old = rate(timestamp.strptime_timestamp, sample)
+            new = rate(timestamp.TimestampParser(), sample)
+            print(f'{name:>8} {label:>8}: strptime {old:10.0f}/s, TimestampParser {new:10.0f}/s, '
+                  + f'speedup {new/old:.2f}x')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = pooled_trace(os.path.join(tmpdir, 'bench.trc'), count//100)
+        new = parse_rate(fname)
+        trcparser.get_timestamp = timestamp.strptime_timestamp
+        old = parse_rate(fname)
+    print(f'{"process_file":>17}: strptime {old:10.0f} lines/s, TimestampParser {new:10.0f} lines/s')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
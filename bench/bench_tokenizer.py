@@ -0,0 +1,103 @@
+"""Benchmarks the tokenizer against the regex cascade it replaced. Reports lines/sec of reading
+    the lines in text and binary mode and through mmap, of the line classification alone and of the whole
+    process_file() over the traces in tests/traces.
+
+    Usage: python bench/bench_tokenizer.py [repeat]"""
+import contextlib
+import glob
+import io
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import tokenizer
+import trcparser
+from call_tracker import CallTracker
+from tests.mock_backend import Backend
+
+TRACES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', 'traces', '*.trc')
+
+# The cascade worked on decoded lines
+def _text(matcher):
+    return re.compile(matcher.pattern.decode())
+RES_MATCHER = re.compile(r'''^(={21})''')
+CALL_MATCHER = _text(tokenizer.CALL_MATCHER)
+XLOB_MATCHER = _text(tokenizer.XLOB_MATCHER)
+DATE_MATCHER = _text(tokenizer.DATE_MATCHER)
+STARS_MATCHER = _text(tokenizer.STARS_MATCHER)
+FILE_HEADER_MATCHER = _text(tokenizer.FILE_HEADER_MATCHER)
+
+def cascade(line):
+    """Regex cascade as it was in process_file before the tokenizer"""
+    if (m := CALL_MATCHER.match(line)) is not None:
+        return (tokenizer.CALL, m.group(1), m.group(2), m.group(4))
+    if (m := XLOB_MATCHER.match(line)) is not None:
+        return (tokenizer.XLOB, m.group(1), m.group(2))
+    if RES_MATCHER.match(line) is not None:
+        return tokenizer.TOKEN_RES
+    if (m := DATE_MATCHER.match(line)) is not None:
+        return (tokenizer.DATE, m.group(1))
+    if (m := STARS_MATCHER.match(line)) is not None:
+        return (tokenizer.STARS, m.group(1).strip(':'), m.group(2).strip('()'), m.group(3))
+    if (m := FILE_HEADER_MATCHER.match(line)) is not None:
+        return (tokenizer.HEADER, m.group(1), m.group(2))
+    return None
+
+def rate(func, lines, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            func(line)
+    return len(lines)*repeat/(time.perf_counter() - start)
+
+def read_rate(fnames, repeat, mode, opener=open):
+    count = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for fname in fnames:
+            with opener(fname, mode) as fdesc:
+                for _ in fdesc:
+                    count += 1
+    return count/(time.perf_counter() - start)
+
+def main(repeat):
+    fnames = sorted(glob.glob(TRACES))
+    lines = []
+    for fname in fnames:
+        with open(fname, 'rb') as fdesc:
+            lines.extend(fdesc)
+    waits = [line for line in lines if line.startswith((b'WAIT', b'FETCH'))]
+    fetches = [line.split(b':', 1)[1].rstrip(b'\n') for line in lines
+               if line.startswith(b'FETCH') and b'WAIT' not in line]
+
+    print(f'{len(lines)} lines, {len(waits)} WAIT/FETCH lines, repeat {repeat}')
+    text = read_rate(fnames, repeat, 'rt')
+    binary = read_rate(fnames, repeat, 'rb')
+    mapped = read_rate(fnames, repeat, 'rb', trcparser.MappedFile)
+    print(f'{"read":>12}: text {text:12.0f} lines/s, binary {binary:12.0f} lines/s, '
+          + f'mmap {mapped:12.0f} lines/s')
+    for name, sample in (('all lines', lines), ('WAIT/FETCH', waits)):
+        old = rate(cascade, [line.decode() for line in sample], repeat)
+        new = rate(tokenizer.tokenize, sample, repeat)
+        print(f'{name:>12}: cascade {old:12.0f} lines/s, tokenize {new:12.0f} lines/s, '
+              + f'speedup {new/old:.2f}x')
+    old = rate(tokenizer.decode_pairs, [line.decode() for line in fetches], repeat*10)
+    new = rate(tokenizer.decode_pairs, fetches, repeat*10)
+    print(f'{"FETCH pairs":>12}: str {old:16.0f} lines/s, bytes {new:15.0f} lines/s, '
+          + f'speedup {new/old:.2f}x')
+
+    total = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        for _ in range(repeat):
+            for fname in fnames:
+                tracker = CallTracker(Backend())
+                total += trcparser.process_file(tracker, fname)[0]
+                tracker.flush()
+    print(f'{"process_file":>12}: {total/(time.perf_counter() - start):.0f} lines/s')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
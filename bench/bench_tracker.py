@@ -0,0 +1,65 @@
+"""Memory of CallTracker in the session that opens many cursors and never closes them, like
+    the application server session with the statement cache. Synthetic trace has no '=====' lines,
+    so without the limits every span stays open until the end of the file. Reports the peak of
+    the traced memory, lines/s and evicted cursors, without limits and with --max-cursors and
+    --idle-gap.
+
+    Usage: python bench/bench_tracker.py [cursors]"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Puts the repository root into sys.path
+import common # pylint: disable=unused-import
+
+import trcparser
+from call_tracker import CallTracker
+from tests.mock_backend import Backend
+
+HEADER = b'*** 2023-05-19T05:28:00.339263+02:00\n'
+
+class Discard(Backend):
+    """Drops the rows, only the tracker is measured"""
+    def add_ops(self, span_id, cursor, ops):
+        pass
+
+def make_trace(fname: str, cursors: int) -> str:
+    tim = 5793511830000
+    with open(fname, 'wb') as fdesc:
+        fdesc.write(HEADER)
+        for i in range(cursors):
+            cursor = f'#{140000000000000 + i * 48}'.encode()
+            fdesc.write(b'PARSING IN CURSOR ' + cursor + b' len=8 dep=0 uid=1 oct=3 lid=1 tim='
+                        + str(tim).encode() + b' hv=1 ad=\'1\' sqlid=\'abc\'\nselect 1\n'
+                        + b'END OF STMT\n')
+            for op_type in (b'PARSE', b'EXEC', b'FETCH'):
+                tim += 100
+                fdesc.write(op_type + b' ' + cursor + b':c=1,e=1,p=0,cr=0,cu=0,mis=0,r=1,dep=0,'
+                            + b'og=1,plh=1,tim=' + str(tim).encode() + b'\n')
+                fdesc.write(b'WAIT ' + cursor + b": nam='SQL*Net message to client' ela= 1 "
+                            + b'driver id=1 #bytes=1 p3=0 obj#=-1 tim=' + str(tim).encode() + b'\n')
+    return fname
+
+def run(name: str, fname: str, **limits) -> None:
+    tracker = CallTracker(Discard(), **limits)
+    tracemalloc.start()
+    start = time.perf_counter()
+    (lines, _) = trcparser.process_file(tracker, fname)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    tracker.flush()
+    print(f'{name:>20}: peak {peak/1e6:7.1f} MB, {lines/elapsed:8.0f} lines/s, '
+          + f'evicted {tracker.evictions}')
+
+def main(cursors: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = make_trace(os.path.join(tmpdir, 'bench.trc'), cursors)
+        run('no limits', fname)
+        run('max_cursors=1000', fname, max_cursors=1000)
+        run('idle_gap=1s', fname, idle_tim=1000000)
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
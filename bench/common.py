@@ -0,0 +1,18 @@
+"""Helpers shared by the benchmarks."""
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+def make_trace(fname: str, repeat: int, source: str = 'tests/traces/simple_trace.trc') -> str:
+    """Writes synthetic trace file: header of the source trace, followed by its body (from the
+        first '=====================' line) repeated. Returns the file name."""
+    with open(os.path.join(ROOT, source), 'rb') as fdesc:
+        trace = fdesc.read()
+    body = trace.index(b'\n=====================') + 1
+    with open(fname, 'wb') as fdesc:
+        fdesc.write(trace[:body])
+        for _ in range(repeat):
+            fdesc.write(trace[body:])
+    return fname
@@ -1,15 +1,33 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+import heapq
 from typing import Optional
 from current_statement import CurrentStatement
-from ops import Ops
+from ops import Ops, ops_factory
+from profiles import Profile, FULL
 from time_tracker import TimeTracker
 
+# sql_ids remembered with the limits, for the cursors that come back after the eviction
+MAX_SQL_IDS = 65536
+
 class CallTracker:
     '''
         Tracks database client interactions.
+
+        Open spans are kept until the cursor is used again, or until the reset. Long-lived
+        sessions can open thousands of cursors, tracker can be bounded: spans of the cursors
+        that haven't been used for idle_tim microseconds of tim, or the least recently used
+        cursors over max_cursors, are dumped and forgotten. Zero turns the limit off. sql_ids of
+        the forgotten cursors are kept for up to max_sql_ids cursors.
     '''
-    def __init__(self, db) -> None:
+    def __init__(self, db, factory=ops_factory, profile: Profile = FULL, max_cursors: int = 0,
+                 idle_tim: int = 0) -> None:
         self.db = db
+        # Turns parsed lines into operations: ops.ops_factory or columnar.row_factory
+        self.ops_factory = factory
+        # What the parser captures, see profiles.py
+        self.profile = profile
+        # instrumentation.Profiler with --profile
+        self.profiler = None
         # {cursor handle: CurrentStatement}
         self.latest_cursors: defaultdict[str, CurrentStatement] = defaultdict(lambda: None)
         # {cursor handle: sql_id}
@@ -18,9 +36,24 @@ class CallTracker:
         self.dummy_counter = 0
         self.time_tracker = TimeTracker()
         self.stat: CurrentStatement = None
+
+        self.max_cursors = max_cursors
+        self.idle_tim = idle_tim
+        # {reason: cursors evicted}
+        self.evictions = {'idle': 0, 'lru': 0}
+        # {cursor handle: latest tim}, least recently used first. Only with the limits.
+        self._activity: Optional[OrderedDict[str, int]] = None
+        # (tim, cursor handle) of the cursors with tim, oldest first. Entries that no longer match
+        # _activity are stale and skipped. Only with idle_tim.
+        self._idle: list[tuple[int, str]] = []
+        self.max_sql_ids = MAX_SQL_IDS
+        if max_cursors or idle_tim:
+            self._activity = OrderedDict()
+            # Least recently used first, like _activity
+            self.cursors = OrderedDict()
     def _get_cursor(self, cursor: str) -> CurrentStatement:
         if not self.stat or self.stat.cursor != cursor:
-            self.stat = self.latest_cursors[cursor]
+            self.stat = self.latest_cursors.get(cursor)
         return self.stat
     def _set_cursor(self, cursor: str) -> None:
         # Cursors/statements come either throug PARSING IN CURSOR with sql_id,
@@ -54,6 +87,53 @@ class CallTracker:
         if not cstat or (ops.op_type in cstat.ops):
             cstat = self.add_latest_cursor(cursor)
         cstat.add_ops(ops)
+        if self._activity is not None:
+            self._touch(cursor, ops.tim)
+    def _touch(self, cursor: str, tim: int) -> None:
+        '''Marks the cursor as the most recently used, and evicts the idle and the least
+            recently used cursors. Lines without tim keep the latest tim of the cursor, cursor
+            that hasn't seen tim yet is never idle.'''
+        activity = self._activity
+        latest = activity.get(cursor)
+        if tim and tim != latest:
+            latest = tim
+            if self.idle_tim:
+                heapq.heappush(self._idle, (tim, cursor))
+        activity[cursor] = latest
+        activity.move_to_end(cursor)
+        if self.idle_tim and tim:
+            self._evict_idle(tim - self.idle_tim, cursor)
+        while self.max_cursors and len(activity) > self.max_cursors:
+            self._evict(next(iter(activity)), 'lru')
+        cursors = self.cursors
+        cursors.move_to_end(cursor)
+        for _ in range(len(cursors) - self.max_sql_ids):
+            oldest = next(iter(cursors))
+            if oldest in activity:
+                # Span is open, sql_id is needed when the cursor is used again
+                cursors.move_to_end(oldest)
+            else:
+                del cursors[oldest]
+    def _evict_idle(self, horizon: int, current: str) -> None:
+        '''Evicts the cursors whose latest tim is before the horizon.'''
+        (activity, idle) = (self._activity, self._idle)
+        while idle and idle[0][0] < horizon:
+            (tim, cursor) = heapq.heappop(idle)
+            if cursor != current and activity.get(cursor) == tim:
+                self._evict(cursor, 'idle')
+        # Stale entries of the busy cursors pile up when nothing is idle
+        if len(idle) > 2 * len(activity) + 64:
+            self._idle = [(tim, cursor) for (cursor, tim) in activity.items() if tim]
+            heapq.heapify(self._idle)
+    def _evict(self, cursor: str, reason: str) -> None:
+        '''Dumps the span of the cursor and forgets it. sql_id of the cursor is kept.'''
+        del self._activity[cursor]
+        stat = self.latest_cursors.pop(cursor, None)
+        if stat is self.stat:
+            self.stat = None
+        if stat and len(stat) > 0 and self.db:
+            self.dump_to_db(stat)
+        self.evictions[reason] += 1
     def add_lob(self, lob: Ops) -> bool:
         '''Add LOB operation to the current span. This bypasses normal flow since LOB ops have
             cursor #0.'''
@@ -73,6 +153,8 @@ class CallTracker:
                 empty.append(cursor)
         for cursor in empty:
             del self.latest_cursors[cursor]
+            if self._activity is not None:
+                self._activity.pop(cursor, None)
     def flush(self) -> None:
         '''Resets the tracker and flushes the db. '''
         if not self.db:
@@ -0,0 +1,81 @@
+from operator import itemgetter
+from ops import (wait_fields, raw_fields, xctend_fields, exec_fields, pic_fields, lob_fields,
+                    error_fields)
+from time_tracker import to_us
+from tokenizer import to_str
+
+__doc__ = """
+    Columnar ingestion engine. Instead of Ops objects, the lines are parsed into Rows: plain
+    dicts with the fields that are present in the line, keyed by ops.FIELD_NAMES. CallTracker
+    groups Rows into spans as usual, and backend.arrow.ColumnarBackend writes them straight
+    into per-column buffers when the span is dumped.
+"""
+
+class Row(dict):
+    """Fields of one line. Has the attributes CallTracker and CurrentStatement need."""
+    __slots__ = ()
+    op_type = property(itemgetter('op_type'))
+    cursor = property(itemgetter('cursor'))
+    @property
+    def sqlid(self) -> str:
+        return self.get('sql_id', '')
+    @property
+    def tim(self) -> int:
+        return self.get('tim', 0)
+    def add_line(self, line) -> None:
+        """Adds another line (str or bytes) to the raw field."""
+        self['raw'] = "".join((self.get('raw', ''), to_str(line)))
+    def drop_raw(self) -> None:
+        """Raw text is not captured by the ingest profile"""
+        self.pop('raw', None)
+
+# op_type: function that parses params into fields
+PARSERS = {
+    'WAIT': wait_fields,
+    'FETCH': exec_fields,
+    'EXEC': exec_fields,
+    'PARSE': exec_fields,
+    'CLOSE': exec_fields,
+    'STAT': raw_fields,
+    'BINDS': raw_fields,
+    'XCTEND': xctend_fields,
+}
+
+# fmeta keys for backend.arrow.SESSION_FIELDS
+SESSION_KEYS = ('FILE_NAME', 'SID', 'CLIENT ID', 'SERVICE NAME', 'MODULE', 'ACTION',
+                'CONTAINER ID')
+
+def _row(op_type: str, cursor: str, fmeta, ts_callback, fields: dict) -> Row:
+    row = Row(fields)
+    row['op_type'] = op_type
+    row['cursor'] = cursor
+    row['line'] = fmeta['LINE_COUNT']
+    # File and session level fields, in one tuple
+    row['session'] = tuple(map(fmeta.__getitem__, SESSION_KEYS))
+    # Wall clock is taken when the line is parsed, like in Ops
+    if ts_callback is not None:
+        row['ts'] = ts_callback(fields.get('tim'))
+    return row
+
+def row_factory(op_type: str, cursor: str, params, *args, **kwargs) -> Row:
+    """Drop-in replacement for ops.ops_factory that returns Rows. Throws the same exceptions
+        for malformed lines."""
+    if (parser := PARSERS.get(op_type)) is not None:
+        (fmeta, ts_callback) = args
+        return _row(op_type, cursor, fmeta, ts_callback, parser(params))
+    match [op_type, *args, *kwargs.values()]:
+        case ['STAR', fmeta, _, name, ts2]:
+            return _row(op_type, cursor, fmeta, None,
+                        {'name': name, 'raw': params, 'ts': to_us(ts2)})
+        case ['HEADER', fmeta, _, name, _]:
+            return _row(op_type, cursor, fmeta, None, {'name': name, 'raw': params, 'ts': None})
+        case ['PARSING IN CURSOR', fmeta, ts_callback]:
+            return _row('PIC', cursor, fmeta, ts_callback, pic_fields(params, fmeta))
+        case ['ERROR' | 'PARSE ERROR', fmeta, ts_callback]:
+            return _row(op_type, cursor, fmeta, ts_callback,
+                        error_fields(op_type, params, fmeta))
+        case _ if op_type.startswith('LOB'):
+            (fmeta, ts_callback) = args
+            return _row(op_type, cursor, fmeta, ts_callback, lob_fields(params))
+        case _:
+            raise AttributeError(f"Wrong op_type: {op_type}, {[op_type, *args, *kwargs.values()]}")
@@ -8,9 +8,8 @@ ITERABLE_OPS: tuple[str, ...] = ('WAIT', 'FETCH', 'STAT', 'LOB')
 
 class CurrentStatement:
     """Tracks operations done within one database interaction/span."""
+    __slots__ = ('cursor', 'sql_id', 'ops', 'ops_container')
     def __init__(self, cursor: str, sql_id: Optional[str]=None) -> None:
-        self.__slots__ = ('cursor', 'sql_id', 'known_ops', 'ops', 'ops_container')
-
         # Cursor is either 0 or a large number
         if not cursor or (len(cursor) <= 2 and cursor != '#0'):
             raise ValueError("init: got empty cursor")
@@ -0,0 +1,278 @@
+import bz2
+import io
+import lzma
+import mmap
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Optional
+
+__doc__ = '''Decompression of the compressed trace files in the background threads. Decompressed data
+    is passed to the parser through the bounded queue, so the parser and decompression run at the
+    same time: zlib, bz2, lzma and zstandard release the GIL while they work.
+
+    Files made of several independent members (multi-member gzip like bgzip output, multi-stream
+    bzip2 like pbzip2 output, concatenated xz streams, multi-frame or seekable zstd) are split
+    into segments at the member headers, and segments are decompressed in parallel. Header magic
+    can appear inside the compressed data too. Segment decompresses the members that start in it,
+    the last one may run over the end of the segment. If it does, the next segment started at the
+    false header and its output is dropped. Single member files are just one segment.'''
+
+# Compressed bytes per segment, and per decompress() call
+SEGMENT_SIZE = 4 << 20
+INPUT_BLOCK = 256 << 10
+# Max decompressed bytes per decompress() call, zstd doesn't have the limit
+OUTPUT_BLOCK = 1 << 20
+# Decompressed blocks buffered per segment
+QUEUE_BLOCKS = 8
+# Segments that are decompressed at the same time
+THREADS = min(4, os.cpu_count() or 1)
+
+# Decompression of the single member. Member ends when decompressor reaches eof, bytes after it
+# are in unused_data.
+def _gzip():
+    return zlib.decompressobj(wbits=31)
+
+def _zlib_pieces(dec, data):
+    """Feeds data to zlib decompressor, yields output in pieces of OUTPUT_BLOCK"""
+    while data:
+        yield dec.decompress(data, OUTPUT_BLOCK)
+        data = dec.unconsumed_tail
+
+def _pieces(dec, data):
+    """Same for bz2 and lzma"""
+    yield dec.decompress(data, OUTPUT_BLOCK)
+    while not dec.eof and not dec.needs_input:
+        yield dec.decompress(b'', OUTPUT_BLOCK)
+
+def _zstd_pieces(dec, data):
+    yield dec.decompress(data)
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as ex:
+        raise RuntimeError("zstandard module is needed for the zstd files") from ex
+    return zstandard.ZstdDecompressor().decompressobj()
+
+# format: (header magic, decompressor factory, function that feeds it)
+FORMATS = {
+    'gzip': (b'\x1f\x8b\x08', _gzip, _zlib_pieces),
+    'bzip2': (b'BZh', bz2.BZ2Decompressor, _pieces),
+    'xz': (b'\xfd7zXZ\x00', lzma.LZMADecompressor, _pieces),
+    'zstd': (b'\x28\xb5\x2f\xfd', _zstd, _zstd_pieces),
+    # Legacy lzma has no magic, it can't be split
+    'lzma': (None, lambda: lzma.LZMADecompressor(format=lzma.FORMAT_ALONE), _pieces),
+}
+# {mime type from filetype.guess(): format}
+MIME_TYPES = {
+    'application/gzip': 'gzip',
+    'application/x-bzip2': 'bzip2',
+    'application/x-xz': 'xz',
+    'application/zstd': 'zstd',
+}
+# bzip2 stream header: BZh[1-9] followed by the block or end of stream magic
+BZIP2_BLOCK = (b'1AY&SY', b'\x17rE8P\x90')
+
+def head(fname: str, fmt: str, size: int) -> bytes:
+    """First size bytes of the decompressed file, fewer if the file is shorter. Reads only as
+        much of the file as it needs, in the calling thread."""
+    (_, factory, pieces) = FORMATS[fmt]
+    dec = factory()
+    out = b''
+    with open(fname, 'rb') as fdesc:
+        while len(out) < size and (data := fdesc.read(INPUT_BLOCK >> 4)):
+            for piece in pieces(dec, data):
+                out += piece
+                if len(out) >= size:
+                    break
+    return out[:size]
+
+def _header_ok(fmt: str, buf, pos: int) -> bool:
+    if fmt == 'bzip2':
+        return buf[pos + 3:pos + 4] in b'123456789' and buf[pos + 4:pos + 10] in BZIP2_BLOCK
+    return True
+
+def plan_segments(buf, fmt: str, segment_size: int = SEGMENT_SIZE) -> list[int]:
+    """Start offsets of the segments: first member header after every segment_size bytes."""
+    magic = FORMATS[fmt][0]
+    starts = [0]
+    if magic is None:
+        return starts
+    pos = segment_size
+    while pos < len(buf):
+        idx = buf.find(magic, pos)
+        while idx >= 0 and not _header_ok(fmt, buf, idx):
+            idx = buf.find(magic, idx + 1)
+        if idx < 0:
+            break
+        starts.append(idx)
+        pos = idx + segment_size
+    return starts
+
+def _skip_padding(buf, pos: int, fmt: str) -> int:
+    """Skips zero padding between the members, and zstd skippable frames (seek table of the
+        seekable zstd)."""
+    while pos < len(buf):
+        if buf[pos] == 0 and fmt in ('gzip', 'xz'):
+            pos += 1
+        elif fmt == 'zstd' and buf[pos] & 0xf0 == 0x50 and buf[pos + 1:pos + 4] == b'\x2a\x4d\x18':
+            pos += 8 + int.from_bytes(buf[pos + 4:pos + 8], 'little')
+        else:
+            break
+    return pos
+
+class Segment(threading.Thread):
+    """Decompresses the members that start between start and end into the queue. Queue gets
+        the blocks of decompressed data, and finally the offset where the last member ended, or
+        the exception."""
+    def __init__(self, buf, fmt: str, start: int, end: int) -> None:
+        super().__init__(daemon=True)
+        self.buf = buf
+        self.fmt = fmt
+        self.start_pos = start
+        self.end = end
+        self.queue = queue.Queue(QUEUE_BLOCKS)
+        self.cancelled = False
+        # Time spent in decompression, without waiting for the space in the queue
+        self.busy_ns = 0
+    def run(self) -> None:
+        (_, factory, pieces) = FORMATS[self.fmt]
+        buf = self.buf
+        pos = self.start_pos
+        clock = time.perf_counter_ns
+        try:
+            while pos < self.end:
+                dec = factory()
+                while not dec.eof:
+                    if self.cancelled:
+                        return
+                    if pos >= len(buf):
+                        raise EOFError("Compressed file ended before the end-of-stream marker")
+                    start = clock()
+                    for data in pieces(dec, buf[pos:pos + INPUT_BLOCK]):
+                        if data:
+                            self.busy_ns += clock() - start
+                            self.queue.put(data)
+                            start = clock()
+                    self.busy_ns += clock() - start
+                    pos += min(INPUT_BLOCK, len(buf) - pos)
+                pos = _skip_padding(self.buf, pos - len(dec.unused_data), self.fmt)
+            self.queue.put(pos)
+        except Exception as ex:
+            self.queue.put(ex)
+    def cancel(self) -> None:
+        """Stops the thread, drains the queue so that it is not blocked."""
+        self.cancelled = True
+        while self.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+class DecompressedFile:
+    """Compressed file, decompressed in the background threads. Iterating over it gives the
+        lines as bytes. Has the same signature as the open functions returned by
+        trcparser.get_opener()."""
+    def __init__(self, fname: str, mode: str = 'rb', fmt: str = 'gzip',
+                    threads: Optional[int] = None, segment_size: int = SEGMENT_SIZE) -> None:
+        if mode != 'rb':
+            raise ValueError(f"DecompressedFile: unsupported mode {mode}")
+        self.fmt = fmt
+        self.threads = max(1, threads or THREADS)
+        self.fdesc = open(fname, 'rb')
+        self.buf = b''
+        if os.fstat(self.fdesc.fileno()).st_size > 0:
+            self.buf = mmap.mmap(self.fdesc.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                self.buf.madvise(mmap.MADV_SEQUENTIAL)
+        starts = plan_segments(self.buf, fmt, segment_size)
+        self.segments = [Segment(self.buf, fmt, start, end)
+                            for (start, end) in zip(starts, starts[1:] + [len(self.buf)])]
+        self.running: list[Segment] = []
+        # Decompression time of the finished segments, and time the reader waited for them
+        self.decompress_ns = 0
+        self.wait_ns = 0
+        # For read()
+        self._blocks = None
+        self._block = b''
+        self._pos = 0
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc) -> None:
+        self.close()
+    def close(self) -> None:
+        for segment in self.running:
+            segment.cancel()
+        self.running = []
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.fdesc.close()
+    def _start(self) -> None:
+        while self.segments and len(self.running) < self.threads:
+            segment = self.segments.pop(0)
+            segment.start()
+            self.running.append(segment)
+    def blocks(self):
+        """Yields the blocks of decompressed data, segment by segment."""
+        pos = 0
+        self._start()
+        while self.running:
+            segment = self.running.pop(0)
+            if segment.start_pos < pos:
+                # Previous segment ran over the start of this one, false header
+                segment.cancel()
+                self._start()
+                continue
+            if segment.start_pos > pos:
+                # Members between the end of the previous segment and this one were left to the
+                # dropped segment
+                self.running.insert(0, segment)
+                segment = Segment(self.buf, self.fmt, pos, segment.start_pos)
+                segment.start()
+            while True:
+                start = time.perf_counter_ns()
+                item = segment.queue.get()
+                self.wait_ns += time.perf_counter_ns() - start
+                if isinstance(item, bytes):
+                    yield item
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                pos = item
+                break
+            self.decompress_ns += segment.busy_ns
+            self._start()
+    def read(self, size: int = -1) -> bytes:
+        """Reads size bytes of decompressed data, everything if size is negative. For tarfile,
+            the lines are read by iterating over the file."""
+        if self._blocks is None:
+            self._blocks = self.blocks()
+        out = []
+        while size != 0:
+            if self._pos >= len(self._block):
+                (self._block, self._pos) = (next(self._blocks, b''), 0)
+                if not self._block:
+                    break
+            piece = self._block[self._pos:self._pos + size if size > 0 else None]
+            self._pos += len(piece)
+            size -= len(piece) if size > 0 else 0
+            out.append(piece)
+        return b''.join(out)
+    def __iter__(self):
+        rest = b''
+        for block in self.blocks():
+            if rest:
+                block = rest + block
+            lines = io.BytesIO(block)
+            for line in lines:
+                if line[-1:] != b'\n':
+                    rest = line
+                    break
+                yield line
+            else:
+                rest = b''
+        if rest:
+            yield rest
@@ -0,0 +1,93 @@
+from typing import Iterable, Optional
+from hdrh.histogram import HdrHistogram
+import pyarrow as pa
+import pyarrow.compute as pc
+
+__doc__ = '''Latency histograms, built at ingest time: HdrHistogram of the span elapsed time per
+    sql_id, and of the wait time per wait event, with count, sum and max. Written next to the
+    raw ops like the span summaries, "<dbdir>/_histograms/<prefix>.<n>" covers the spans and
+    waits of "<dbdir>/<prefix>.<n>". Histograms are mergeable: summary.py adds up the rows of the
+    same key from all the files, of the parallel workers and of the earlier runs.
+
+    Spans of the cursor #0 are left out of the sql_id histograms, like summary.py does by
+    default.'''
+
+HISTOGRAM_DIR = '_histograms'
+# Range and the default precision, in significant figures. HIGHEST is about 28 hours in
+# microseconds, values above it are recorded as HIGHEST, max keeps the real value and summary.py
+# takes the percentiles of such keys from the spans.
+LOWEST = 1
+HIGHEST = 100000000000
+DIGITS = 2
+
+HISTOGRAM_SCHEMA = pa.schema([
+    # 'sql_id' or 'wait'
+    ('kind', pa.string()),
+    ('key', pa.string()),
+    ('count', pa.uint64()),
+    ('sum', pa.uint64()),
+    ('max', pa.uint64()),
+    ('digits', pa.uint8()),
+    # HdrHistogram.encode(), base64 of the compressed counts
+    ('histogram', pa.string()),
+])
+
+def new_histogram(digits: int = DIGITS) -> HdrHistogram:
+    return HdrHistogram(LOWEST, HIGHEST, digits)
+
+def _rows(kind: str, keys: pa.Array, values: pa.Array, digits: int) -> list[dict]:
+    """Histograms of values by key. Repeating (key, value) pairs are counted first, so the
+        histogram gets one record_value() per distinct value."""
+    counts = pa.table({'key': keys, 'value': values}).group_by(['key', 'value'],
+                                                               use_threads=False) \
+        .aggregate([('value', 'count')])
+    hists: dict = {}
+    for (key, value, count) in zip(*(counts.column(name).to_pylist()
+                                     for name in ('key', 'value', 'value_count'))):
+        if (entry := hists.get(key)) is None:
+            entry = hists[key] = [new_histogram(digits), 0, 0]
+        entry[0].record_value(min(value, HIGHEST), count)
+        entry[1] += value * count
+        entry[2] = max(entry[2], value)
+    return [{'kind': kind, 'key': key, 'count': hist.get_total_count(), 'sum': total, 'max': top,
+             'digits': digits, 'histogram': hist.encode().decode()}
+            for (key, (hist, total, top)) in hists.items()]
+
+def histograms_table(ops: pa.Table, spans: pa.Table, digits: int = DIGITS) -> pa.Table:
+    """Histograms of the ops table, in backend.arrow.PARQUET_SCHEMA, and of its span summary,
+        in spans.SPANS_SCHEMA"""
+    timed = pc.and_(pc.is_valid(spans['ela']), pc.not_equal(spans['cursor_id'], '#0'))
+    spans = spans.filter(timed)
+    waits = ops.filter(pc.fill_null(pc.equal(ops['ops'], 'WAIT'), False))
+    rows = _rows('sql_id', spans['sql_id'], spans['ela'], digits)
+    rows += _rows('wait', waits['event_name'].cast(pa.string()), waits['elapsed_time'], digits)
+    return pa.Table.from_pylist(rows, schema=HISTOGRAM_SCHEMA)
+
+def merge_tables(tables: list[pa.Table]) -> pa.Table:
+    """Merges the histogram tables into one, with one row per kind and key"""
+    entries: dict = {}
+    for row in pa.concat_tables(tables).to_pylist():
+        entries.setdefault((row['kind'], row['key']), []).append(row)
+    rows = []
+    for ((kind, key), group) in entries.items():
+        if len(group) == 1:
+            rows.append(group[0])
+            continue
+        hist = merge((row['digits'], row['histogram']) for row in group)
+        rows.append({'kind': kind, 'key': key, 'count': sum(row['count'] for row in group),
+                     'sum': sum(row['sum'] for row in group),
+                     'max': max(row['max'] for row in group),
+                     'digits': max(row['digits'] for row in group),
+                     'histogram': hist.encode().decode()})
+    return pa.Table.from_pylist(rows, schema=HISTOGRAM_SCHEMA)
+
+def merge(rows: Iterable[tuple[int, str]]) -> Optional[HdrHistogram]:
+    """Adds up the encoded histograms, given as (digits, histogram). Result has the highest
+        precision of these. None if there is nothing to merge."""
+    rows = list(rows)
+    if not rows:
+        return None
+    out = new_histogram(max(digits for (digits, _) in rows))
+    for (_, encoded) in rows:
+        out.decode_and_add(encoded)
+    return out
@@ -0,0 +1,163 @@
+from collections import defaultdict
+import datetime
+import json
+import platform
+import threading
+import time
+from typing import Optional
+
+__doc__ = '''Per-stage timing of trc2db, for --profile. Profiler wraps the functions of the tracker
+    and backend into the timers, nothing is measured without it.
+
+    Stages that run in the parser thread are measured exclusively: time of the nested stages
+    is subtracted, backend.add_ops() called from CallTracker.reset() counts as backend, not as
+    tracker. What remains of the elapsed time is read: reading the lines and the parser loop.
+    Stages in the background threads, decompression, encoding of the spans into Arrow tables
+    with the pipeline (see pipeline.py) and Parquet writing, overlap with the parser and are
+    reported separately. Parser thread waiting for them is decompress_wait, backend (the full
+    encoder queue) and writer_wait.'''
+
+REPORT_VERSION = 1
+# Parser thread stages, in the report order
+STAGES = ('read', 'decompress_wait', 'tokenize', 'ops', 'tracker', 'backend', 'batch2table',
+          'writer_wait')
+BACKGROUND = ('decompress', 'encode', 'parquet_write')
+
+class Profiler:
+    """Collects the stage times and record counts, see the module docstring"""
+    def __init__(self) -> None:
+        # {stage: nanoseconds}
+        self.stages: defaultdict[str, int] = defaultdict(int)
+        self.background: defaultdict[str, int] = defaultdict(int)
+        # {op_type: records}
+        self.counts: defaultdict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        # Time of the nested stages, per open stage
+        self._nested = [0]
+    def timed(self, stage: str, func):
+        """Wraps func into the timer of the parser thread stage"""
+        (clock, stages, nested) = (time.perf_counter_ns, self.stages, self._nested)
+        def wrapper(*args, **kwargs):
+            nested.append(0)
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                stages[stage] += elapsed - nested.pop()
+                nested[-1] += elapsed
+        return wrapper
+    def timed_background(self, stage: str, func):
+        """Wraps func into the timer of the background thread stage"""
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.background[stage] += time.perf_counter_ns() - start
+        return wrapper
+    def counted(self, func):
+        """Counts the calls of the ops factory by op_type"""
+        counts = self.counts
+        def wrapper(op_type, *args, **kwargs):
+            counts[op_type] += 1
+            return func(op_type, *args, **kwargs)
+        return wrapper
+    def instrument(self, tracker) -> None:
+        """Puts the timers around the tracker and its backend"""
+        tracker.profiler = self
+        tracker.ops_factory = self.counted(self.timed('ops', tracker.ops_factory))
+        for name in ('add_ops', 'reset'):
+            setattr(tracker, name, self.timed('tracker', getattr(tracker, name)))
+        db = tracker.db
+        if (backend := getattr(db, 'backend', None)) is not None:
+            # pipeline.PipelinedBackend: the backend runs in the encoder thread
+            for name in ('add_ops', 'flush', 'write_row_group'):
+                setattr(db, name, self.timed('backend', getattr(db, name)))
+            backend.add_ops = self.timed_background('encode', backend.add_ops)
+            self._instrument_writer(backend)
+            return
+        for (name, stage) in (('add_ops', 'backend'), ('flush', 'backend'),
+                              ('write_row_group', 'backend'), ('_batch2table', 'batch2table'),
+                              ('_wait_writer', 'writer_wait')):
+            if hasattr(db, name):
+                setattr(db, name, self.timed(stage, getattr(db, name)))
+        self._instrument_writer(db)
+    def _instrument_writer(self, backend) -> None:
+        """Row groups and closing of the files, in the writer thread of backend.arrow"""
+        for name in ('flush_batches', '_close_file'):
+            if hasattr(backend, name):
+                setattr(backend, name, self.timed_background('parquet_write',
+                                                             getattr(backend, name)))
+    def add_source(self, trace) -> None:
+        """Adds the decompression times of decompress.DecompressedFile"""
+        if hasattr(trace, 'decompress_ns'):
+            with self._lock:
+                self.background['decompress'] += trace.decompress_ns
+            self.stages['decompress_wait'] += trace.wait_ns
+    def take(self, fname: str, size: int, lines: int, errors: int, elapsed_ns: int) -> dict:
+        """Report entry of the file, with the times collected since the last take(). Clears
+            the collected times."""
+        with self._lock:
+            background = dict(self.background)
+            self.background.clear()
+        stages = dict(self.stages)
+        stages['read'] = max(0, elapsed_ns - sum(stages.values()))
+        entry = make_entry(fname, size, lines, errors, elapsed_ns / 1e9,
+                           {k: v / 1e9 for (k, v) in stages.items()},
+                           {k: v / 1e9 for (k, v) in background.items()}, dict(self.counts))
+        self.stages.clear()
+        self.counts.clear()
+        return entry
+
+def make_entry(fname: Optional[str], size: int, lines: int, errors: int, elapsed: float,
+               stages: dict, background: dict, counts: dict) -> dict:
+    elapsed = max(elapsed, 1e-9)
+    return {
+        'file': fname,
+        'bytes': size,
+        'lines': lines,
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'lines_per_s': lines / elapsed,
+        'mb_per_s': size / elapsed / 1e6,
+        'stages_s': {k: stages.get(k, 0.0) for k in STAGES},
+        'background_s': {k: background.get(k, 0.0) for k in BACKGROUND},
+        'counts': dict(sorted(counts.items())),
+    }
+
+def merge(entries: list[dict], fname: Optional[str] = None,
+          elapsed: Optional[float] = None) -> dict:
+    """Sums up the entries: chunks of one file, or all files. Elapsed is the wall clock of the
+        whole, sum of the entries if not set."""
+    (stages, background, counts) = (defaultdict(float), defaultdict(float), defaultdict(int))
+    for entry in entries:
+        for (src, dst) in ((entry['stages_s'], stages), (entry['background_s'], background),
+                           (entry['counts'], counts)):
+            for (key, value) in src.items():
+                dst[key] += value
+    if elapsed is None:
+        elapsed = sum(e['elapsed_s'] for e in entries)
+    return make_entry(fname, sum(e['bytes'] for e in entries), sum(e['lines'] for e in entries),
+                      sum(e['errors'] for e in entries), elapsed, stages, background, counts)
+
+def write_report(path: str, files: list[dict], total: dict, settings: dict) -> None:
+    """Writes the JSON report into path, '-' is stdout"""
+    import pyarrow
+    report = {
+        'version': REPORT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'pyarrow': pyarrow.__version__,
+        'settings': settings,
+        'files': files,
+        'total': total,
+    }
+    out = json.dumps(report, indent=1)
+    if path == '-':
+        print(out)
+        return
+    with open(path, 'w', encoding='utf-8') as fdesc:
+        fdesc.write(out + '\n')
+    print(f"profile written to {path}")
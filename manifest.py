@@ -0,0 +1,186 @@
+from dataclasses import asdict
+import datetime
+import hashlib
+import json
+import os
+from typing import Optional
+import pyarrow as pa
+import pyarrow.fs
+from trcsplit import Chunk
+
+__doc__ = '''Ingestion manifest: remembers which trace files, and how much of them, were written into
+    the output directory. For every input it records path, size, mtime, hash of the head of the
+    file and the committed byte offset and line, together with the parser state at that offset.
+    Reruns skip the unchanged files and process only the tail of the files that have grown.
+
+    Every task of the run writes its Parquet files under its own slot, "<prefix>.<slot>.<n>", and
+    takes span ids from its own range. Slots of the run are recorded as pending before the run
+    starts and cleared when the file is committed. Output of the pending slots, left behind by
+    the crashed run, is removed at the start of the next run, and the files are processed again
+    from the last committed offset. Entry of the file lists its committed slots too: file that
+    has to be processed from the start again (replaced, or compressed and changed) has the
+    output of these removed first, so that its rows are not there twice.
+
+    Uncompressed files are committed at the "=====" edges only, where no span is open. The rest
+    of the file after the last edge, the tail, is processed into its own slot. Its spans may
+    continue when the file grows, so the next run removes the output of the tail and processes
+    it again, from the parser state at the edge.
+
+    Manifest lives in the _manifest subdirectory, read_parquet('dbdir/*') does not see it.'''
+
+MANIFEST_DIR = '_manifest'
+MANIFEST_VERSION = 1
+# Uncompressed files are processed in chunks of about this size even without --split-size, every
+# chunk is committed when it and the ones before it are done. Crashed run loses at most a chunk.
+COMMIT_SIZE = 1 << 30
+# Hash covers the head of the file. Rotated or replaced file has a different head, the file
+# that just grows has not.
+HASH_BYTES = 1 << 20
+
+def head_hash(fname: str, size: int) -> str:
+    """blake2b of the first size bytes of the file"""
+    with open(fname, 'rb') as fdesc:
+        return hashlib.blake2b(fdesc.read(size)).hexdigest()
+
+def chunk2dict(chunk: Chunk) -> dict:
+    out = asdict(chunk)
+    if chunk.wall_clock is not None:
+        out['wall_clock'] = chunk.wall_clock.isoformat()
+    return out
+
+def dict2chunk(state: dict) -> Chunk:
+    chunk = Chunk(**state)
+    if chunk.wall_clock is not None:
+        chunk.wall_clock = datetime.datetime.fromisoformat(chunk.wall_clock)
+    return chunk
+
+class Manifest:
+    """Manifest of the output directory, see the module docstring. Not safe for the concurrent
+        runs against the same directory."""
+    def __init__(self, fs: pa.fs.FileSystem, dbdir: str, prefix: str) -> None:
+        self.fs = fs
+        self.dbdir = dbdir
+        self.prefix = prefix
+        self.path = f'{dbdir}/{MANIFEST_DIR}/{prefix}.json'
+        self.next_slot = 0
+        self.pending: list[int] = []
+        # {absolute path: entry}
+        self.files: dict[str, dict] = {}
+        # {absolute path: stat and head hash of the file when its tasks were planned}
+        self.planned: dict[str, dict] = {}
+        if self.fs.get_file_info(self.path).type == pa.fs.FileType.File:
+            with self.fs.open_input_stream(self.path) as fstream:
+                data = json.loads(fstream.read())
+            if data.get('version') != MANIFEST_VERSION:
+                raise ValueError(f"Unsupported manifest version {data.get('version')} in {self.path}")
+            self.next_slot = data['next_slot']
+            self.pending = data['pending']
+            self.files = data['files']
+    def save(self) -> None:
+        """Writes the manifest, through the temporary file."""
+        self.fs.create_dir(f'{self.dbdir}/{MANIFEST_DIR}')
+        data = {'version': MANIFEST_VERSION, 'next_slot': self.next_slot,
+                'pending': sorted(self.pending), 'files': self.files}
+        with self.fs.open_output_stream(f'{self.path}.tmp') as fstream:
+            fstream.write(json.dumps(data, indent=1).encode())
+        self.fs.move(f'{self.path}.tmp', self.path)
+    def clean_pending(self) -> list[str]:
+        """Removes output of the slots that were not committed, raw files and their span
+            summaries and histograms, in the flat or in the partitioned layout. Returns removed
+            files."""
+        if not self.pending:
+            return []
+        removed = self._remove_slots(self.pending)
+        self.pending = []
+        self.save()
+        return removed
+    def _remove_slots(self, slots: list[int]) -> list[str]:
+        """Removes output of the slots, returns removed files"""
+        removed = []
+        names = tuple(f'{self.prefix}.{slot}.' for slot in slots)
+        selector = pa.fs.FileSelector(self.dbdir, allow_not_found=True, recursive=True)
+        for info in self.fs.get_file_info(selector):
+            if info.type == pa.fs.FileType.File and info.base_name.startswith(names):
+                self.fs.delete_file(info.path)
+                removed.append(info.path)
+        return removed
+    def _restart(self, fname: str) -> None:
+        """Forgets the file and removes the output of its committed slots"""
+        entry = self.files.pop(fname)
+        if entry.get('slots'):
+            removed = self._remove_slots(entry['slots'])
+            print(f"   removed {len(removed)} files of the earlier runs")
+        self.save()
+    def reserve(self, count: int) -> int:
+        """Reserves count slots for the run, returns the first one."""
+        first = self.next_slot
+        self.next_slot += count
+        self.pending.extend(range(first, self.next_slot))
+        self.save()
+        return first
+    def resume_point(self, fname: str) -> Optional[Chunk]:
+        """Where to start processing the file: empty Chunk for the new or replaced file, parser
+            state at the committed offset if the file has grown. None if the file hasn't
+            changed since it was committed. Output of the file that is processed from the start
+            again is removed."""
+        path = os.path.abspath(fname)
+        entry = self.files.get(path)
+        if entry is None:
+            return Chunk(0, 0)
+        stat = os.stat(fname)
+        if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return None
+        if stat.st_size < entry['offset'] or head_hash(fname, entry['hash_bytes']) != entry['hash']:
+            print(f"{fname} has been replaced, processing from the start")
+            self._restart(path)
+            return Chunk(0, 0)
+        if entry['resume'] is None:
+            # Compressed file can't be resumed from the offset
+            print(f"{fname} has changed, processing from the start")
+            self._restart(path)
+            return Chunk(0, 0)
+        if entry.get('tail'):
+            removed = self._remove_slots(entry['tail'])
+            print(f"{fname} has grown, removed {len(removed)} files of its tail")
+            entry['slots'] = [slot for slot in entry['slots'] if slot not in entry['tail']]
+            entry['tail'] = []
+            self.save()
+        return dict2chunk(entry['resume'])
+    def plan(self, fname: str, offset: int) -> None:
+        """Takes the size, mtime and head hash of the file when its tasks are planned, up to
+            offset. commit() records these, not the state of the file that may have changed
+            while it was processed."""
+        stat = os.stat(fname)
+        hash_bytes = min(offset, HASH_BYTES)
+        self.planned[os.path.abspath(fname)] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': head_hash(fname, hash_bytes),
+            'hash_bytes': hash_bytes,
+        }
+    def commit(self, fname: str, slots: list[int], resume: Optional[Chunk], line: int,
+               tail: Optional[list[int]] = None) -> None:
+        """Records that the file is processed up to the resume point, and output of the slots
+            is complete. resume is the parser state at the offset, None for the compressed
+            files: these are processed up to the size they had when they were planned. tail is
+            the slot of the rest of the uncompressed file after the offset, given when the whole
+            file is done."""
+        path = os.path.abspath(fname)
+        planned = self.planned[path]
+        offset = planned['size'] if resume is None else resume.start
+        tail = tail or []
+        earlier = self.files.get(path, {}).get('slots', [])
+        self.files[path] = {
+            # Size of the file when it is done, the next run skips it if it hasn't changed
+            'size': planned['size'] if resume is None or tail else offset,
+            'mtime_ns': planned['mtime_ns'],
+            'hash': planned['hash'],
+            'hash_bytes': planned['hash_bytes'],
+            'offset': offset,
+            'line': line,
+            'resume': chunk2dict(resume) if resume is not None else None,
+            'slots': earlier + slots + tail,
+            'tail': tail,
+        }
+        self.pending = [slot for slot in self.pending if slot not in slots + tail]
+        self.save()
@@ -1,304 +1,320 @@
-from dataclasses import dataclass, asdict
-import datetime
-import re
 from sys import exception
 from traceback import print_exception
 from typing import Any, Optional
+from time_tracker import from_us, to_us
+from tokenizer import decode_pairs, decode_wait, to_str
 
 __doc__ = """
     Contains classes representing the various operations/lines in the trace file.
     Some classes handle multiple operations, for brevity.
+    Params can be bytes, as they come from the tokenizer, or str.
 """
 
-wait_matcher = re.compile(r""" nam='(.*)' ela= (\d+) (.*) tim=(\d+)""")
+# Fields of the record, in the astuple() and PARQUET_SCHEMA order, with the defaults. Field names
+# correspond 1:1 to the contents of the trace file, except:
+#   * sql_id is called sqlid in PARSING IN CURSOR event
+#   * span_id is synthetically generated, it has no counterpart in the trace file
+#   * ts is the timestamp found here and there in the trace file, in microseconds since the epoch.
+#     Generated for all operations when the line is parsed.
+#   * lobtype is 'type' in the trace file. Renamed to avoid data type clash with 'type' parameter
+#     in CLOSE.
+FIELDS: tuple[tuple[str, Any], ...] = (
+    ('span_id', 0),
+    ('sql_id', ''),
+    ('cursor', ''),
+    ('op_type', ''),
+    ('c', 0),
+    ('e', 0),
+    ('p', 0),
+    ('cr', 0),
+    ('cu', 0),
+    ('mis', 0),
+    ('r', 0),
+    ('dep', 0),
+    ('og', 0),
+    ('plh', 0),
+    ('tim', 0),
+    ('type', 0),
+    ('name', ''),
+    ('raw', ''),
+    ('fname', ''),
+    ('line', 0),
+    ('ts', None),
+    ('len', 0),
+    ('uid', 0),
+    ('oct', 0),
+    ('lid', 0),
+    ('hv', 0),
+    ('ad', ''),
+    ('rlbk', 0),
+    ('rd_only', 0),
+    ('lobtype', ''),
+    ('bytes', 0),
+    ('sid', ''),
+    ('client_id', ''),
+    ('service_name', ''),
+    ('module', ''),
+    ('action', ''),
+    ('container_id', 0),
+    ('err', 0),
+)
+FIELD_NAMES: tuple[str, ...] = tuple(name for (name, _) in FIELDS)
+DEFAULTS: list = [default for (_, default) in FIELDS]
+# {field name: index in the record}
+INDEX: dict[str, int] = {name: idx for (idx, name) in enumerate(FIELD_NAMES)}
+(SPAN_ID, SQL_ID, OP_TYPE, TIM, RAW, TS) = (INDEX['span_id'], INDEX['sql_id'], INDEX['op_type'],
+                                             INDEX['tim'], INDEX['raw'], INDEX['ts'])
+# fmeta keys of the file and session level fields
+FMETA_FIELDS: tuple[tuple[str, int], ...] = (
+    ('FILE_NAME', INDEX['fname']),
+    ('LINE_COUNT', INDEX['line']),
+    ('SID', INDEX['sid']),
+    ('CLIENT ID', INDEX['client_id']),
+    ('SERVICE NAME', INDEX['service_name']),
+    ('MODULE', INDEX['module']),
+    ('ACTION', INDEX['action']),
+    ('CONTAINER ID', INDEX['container_id']),
+)
 
-@dataclass(init=True, kw_only=True)
-class DatabaseOp:
-    """Container for the various fields in the trace files. Field names correspond 1:1 to the
-       contents of the trace file, except: 
-           * sql_id is called sqlid in PARSING IN CURSOR event
-           * span_id is synthetically generated, it has no counterpart in the trace file
-           * ts is the timestamp found here and there in the trace file. Can be generated
-             for all operations.
-           * lobtype is 'type' in the trace file. Renamed to avoid data type clash with 'type'
-             parameter in CLOSE.
-           """
-    span_id: int = 0
-    sql_id: str = ''
-    cursor: str = ''
-    op_type: str = ''
-    c: int = 0
-    e: int = 0
-    p: int = 0
-    cr: int = 0
-    cu: int = 0
-    mis: int = 0
-    r: int = 0
-    dep: int = 0
-    og: int = 0
-    plh: int = 0
-    tim: int = 0
-    type: int = 0
-    name: str = ''
-    raw: str = ''
-    fname: str = ''
-    line: int = 0
-    ts: datetime.datetime = None
-    len: int = 0
-    uid: int = 0
-    oct: int = 0
-    lid: int = 0
-    hv: int = 0
-    ad: str = ''
-    rlbk: int = 0
-    rd_only: int = 0
-    lobtype: str = ''
-    bytes: int = 0
-    sid: str = ''
-    client_id: str = ''
-    service_name: str = ''
-    module: str = ''
-    action: str = ''
-    container_id: int = 0
-    err: int = 0
+def wait_fields(params) -> dict:
+    """Parses WAIT: event name, elapsed time and tim. Everything is kept in raw, too."""
+    out = {'raw': to_str(params)}
+    if (wait := decode_wait(out['raw'])) is not None:
+        (out['name'], out['e'], out['tim']) = wait
+    return out
+
+def raw_fields(params) -> dict:
+    """STAT and BINDS are persisted as-is"""
+    return {'raw': to_str(params)}
+
+def xctend_fields(params) -> dict:
+    return dict(decode_pairs(params, ', '))
+
+def exec_fields(params) -> dict:
+    return dict(decode_pairs(params))
+
+def pic_fields(params, fmeta) -> dict:
+    """Parses PARSING IN CURSOR. Broken items are logged and ignored, this allows us to capture
+        args of the lines from PIC."""
+    out = {}
+    params = to_str(params)
+    for item in params.split(' '):
+        try:
+            if len(item):
+                key = item.split('=')
+                if key[0] == 'sqlid':
+                    out['sql_id'] = key[1].strip("'")
+                elif key[0] == 'ad':
+                    out[key[0]] = key[1].strip("'")
+                else:
+                    out[key[0]] = int(key[1])
+        except (IndexError, ValueError):
+            print(f"Pic: got exception at line {fmeta['LINE_COUNT']}, offending line: {params}")
+            print_exception(exception())
+    out['raw'] = ''
+    return out
+
+def lob_fields(params) -> dict:
+    out = {}
+    for item in to_str(params).split(','):
+        if len(item):
+            key = item.split('=')
+            if key[0] == 'type':
+                out['lobtype'] = key[1]
+            else:
+                out[key[0]] = int(key[1])
+    return out
+
+def error_fields(op_type: str, params, fmeta) -> dict:
+    """ERROR and PARSE ERROR. Broken items are logged and ignored."""
+    out = {}
+    params = to_str(params)
+    for item in params.split(' '):
+        try:
+            if len(item):
+                key = item.split('=')
+                out[key[0]] = int(key[1])
+        except (IndexError, ValueError):
+            print(f"Error: got exception at line {fmeta['LINE_COUNT']}, offending line: "
+                f"{params}")
+            print_exception(exception())
+    if op_type == 'PARSE ERROR':
+        out['raw'] = ''
+    return out
 
 class Ops:
     """
-        Base class for various operations.
+        Base class for various operations. Fields are kept in one list, in the FIELDS order,
+        and are accessed as attributes: ops.tim, ops.raw. Fields parsed from the line are set
+        first, then ts is taken from ts_callback (TimeTracker.get_ts), in the parse order.
     """
-    def __init__(self, op_type: str, cursor: str, *args) -> None:
-
-        (fmeta, ts_callback) = args
-        self.dbop = DatabaseOp(op_type = op_type,
-            cursor = cursor,
-            fname = fmeta['FILE_NAME'],
-            line = fmeta['LINE_COUNT'],
-            sid = fmeta['SID'],
-            client_id = fmeta['CLIENT ID'],
-            service_name = fmeta['SERVICE NAME'],
-            module = fmeta['MODULE'],
-            action = fmeta['ACTION'],
-            container_id = fmeta['CONTAINER ID']
-        )
-
-        self.ts_callback = ts_callback
-    def __getattr__(self, name: str) -> Any:
-        """Redirects attributes to self.dbop."""
-        if name == 'sqlid':
-            return self.dbop.sql_id
-        if name in self.dbop.__dict__:
-            return self.dbop.__dict__[name]
-        raise AttributeError(f"Wrong attribute: {name}")
+    __slots__ = ('values',)
+    def __init__(self, op_type: str, cursor: str, fmeta: dict, ts_callback,
+                 fields: Optional[dict] = None) -> None:
+        values = DEFAULTS.copy()
+        values[OP_TYPE] = op_type
+        values[INDEX['cursor']] = cursor
+        for (key, idx) in FMETA_FIELDS:
+            values[idx] = fmeta[key]
+        self.values = values
+        if fields:
+            self.update(fields)
+        if ts_callback is not None:
+            values[TS] = ts_callback(values[TIM])
+    def update(self, fields: dict) -> None:
+        """Sets the fields parsed from the line. Keys that are not in FIELDS are ignored."""
+        (values, index) = (self.values, INDEX)
+        for (key, value) in fields.items():
+            if (idx := index.get(key)) is not None:
+                values[idx] = value
+    @property
+    def sqlid(self) -> str:
+        return self.values[SQL_ID]
+    @property
+    def dbop(self) -> 'Ops':
+        """Fields used to be in the separate DatabaseOp object, now they are in the Ops"""
+        return self
     def astuple(self, span_id: int, sql_id: str) -> tuple:
-        """ Generates list that is used to persist Ops in the database. Children are supposed to 
-            override this."""
-        self.dbop.span_id = span_id
-        self.dbop.sql_id = sql_id
-        if self.dbop.ts is None and self.ts_callback is not None:
-            self.dbop.ts = self.ts_callback(self.dbop.tim)
-        return (
-            self.dbop.span_id,
-            self.dbop.sql_id,
-            self.dbop.cursor,
-            self.dbop.op_type,
-            self.dbop.c,
-            self.dbop.e,
-            self.dbop.p,
-            self.dbop.cr,
-            self.dbop.cu,
-            self.dbop.mis,
-            self.dbop.r,
-            self.dbop.dep,
-            self.dbop.og,
-            self.dbop.plh,
-            self.dbop.tim,
-            self.dbop.type,
-            self.dbop.name,
-            self.dbop.raw,
-            self.dbop.fname,
-            self.dbop.line,
-            self.dbop.ts,
-            self.dbop.len,
-            self.dbop.uid,
-            self.dbop.oct,
-            self.dbop.lid,
-            self.dbop.hv,
-            self.dbop.ad,
-            self.dbop.rlbk,
-            self.dbop.rd_only,
-            self.dbop.lobtype,
-            self.dbop.bytes,
-            self.dbop.sid,
-            self.dbop.client_id,
-            self.dbop.service_name,
-            self.dbop.module,
-            self.dbop.action,
-            self.dbop.container_id,
-            self.dbop.err,
-        )
+        """ Generates list that is used to persist Ops in the database."""
+        values = self.values
+        values[SPAN_ID] = span_id
+        values[SQL_ID] = sql_id
+        return tuple(values)
     def to_dict(self, span_id: int, sql_id: str) -> dict:
-        """Returns DatabaseOp as a dict."""
-        out = asdict(self.dbop)
+        """Returns fields as a dict, ts as datetime."""
+        out = dict(zip(FIELD_NAMES, self.values))
 
         out['sql_id'] = sql_id
         out['span_id'] = span_id
         if out['op_type'] == 'PIC':
             out['op_type']= 'PARSING IN CURSOR'
-        if self.dbop.ts is None and self.ts_callback is not None:
-            out['ts'] = self.ts_callback(self.dbop.tim)
+        out['ts'] = from_us(out['ts'])
 
         return out
-    def add_line(self, line: str) -> None:
-        """Adds another line to the container."""
-        self.dbop.__dict__['raw'] = "".join((self.dbop.__dict__['raw'], line))
+    def add_line(self, line) -> None:
+        """Adds another line (str or bytes) to the container."""
+        self.values[RAW] = "".join((self.values[RAW], to_str(line)))
+    def drop_raw(self) -> None:
+        """Raw text is not captured by the ingest profile"""
+        self.values[RAW] = ''
+
+def _field(idx: int) -> property:
+    def fget(self):
+        return self.values[idx]
+    def fset(self, value) -> None:
+        self.values[idx] = value
+    return property(fget, fset)
+
+for (_idx, _name) in enumerate(FIELD_NAMES):
+    setattr(Ops, _name, _field(_idx))
 
 class Wait(Ops):
     """ Handles WAIT lines. Wait event name is parsed out, everything else is persisted as-is."""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, ts_callback) = args
-        super().__init__(op_type, cursor, fmeta, ts_callback)
-        self.dbop.__dict__['raw'] = params
-        match = wait_matcher.match(params)
-        if match:
-            self.dbop.__dict__['name'] = match.group(1).strip("'")
-            self.dbop.__dict__['e'] = int(match.group(2))
-
-            self.dbop.__dict__['tim'] = int(match.group(4))
-            self.__slots__ = (op_type, cursor, 'raw', 'name', 'e', 'tim')
+        super().__init__(op_type, cursor, fmeta, ts_callback, wait_fields(params))
     def __str__(self) -> str:
         return f"{self.cursor}: {self.op_type} {self.raw}"
 
 class Stat(Ops):
     """ Execuion plan and statistics(STAT). Persisted as-is."""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, ts_callback) = args
-        super().__init__(op_type, cursor, fmeta, ts_callback)
-        self.dbop.__dict__['raw'] = params
+        super().__init__(op_type, cursor, fmeta, ts_callback, raw_fields(params))
     def __str__(self) -> str:
         return f"{self.cursor}: {self.op_type} {self.raw}"
 
 class Meta(Ops):
     """ Handles trace file header lines and lines that start with stars (***). These lines contain
         wall clock readings, these are persisted in ts2."""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, name, ts2) = args
         super().__init__(op_type, cursor, fmeta, None)
-        self.dbop.__dict__['name'] = name
-        self.dbop.__dict__['raw'] = params
-        self.dbop.__dict__['ts'] = ts2
+        self.values[INDEX['name']] = name
+        self.values[RAW] = params
+        self.values[TS] = to_us(ts2)
     def __str__(self) -> str:
         if self.op_type == 'HEADER':
-            return f"{self.dbop.name}: {self.dbop.raw}"
-        return f"*** {self.dbop.name}:({self.dbop.raw}) {self.dbop.ts}"
+            return f"{self.name}: {self.raw}"
+        return f"*** {self.name}:({self.raw}) {from_us(self.ts)}"
 
 class Binds(Ops):
     """ Bind values. Everything is persisted as-is, in one string."""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, ts_callback) = args
-        super().__init__(op_type, cursor, fmeta, ts_callback)
-        self.dbop.__dict__['raw'] = params
+        super().__init__(op_type, cursor, fmeta, ts_callback, raw_fields(params))
     def __str__(self) -> str:
-        return f"{self.dbop.cursor}: {self.dbop.op_type} {self.dbop.raw}"
+        return f"{self.cursor}: {self.op_type} {self.raw}"
 
 class Xctend(Ops):
     """ Commits (XCTEND)."""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, ts_callback) = args
-        super().__init__(op_type, cursor, fmeta, ts_callback)
-        for item in params.split(', '):
-            key = item.split('=')
-            self.dbop.__dict__[key[0]] = int(key[1])
+        super().__init__(op_type, cursor, fmeta, ts_callback, xctend_fields(params))
     def __str__(self) -> str:
-        return f"XCTEND rlbk={self.dbop.rlbk}, rd_only={self.dbop.rd_only}, tim={self.dbop.tim}"
+        return f"XCTEND rlbk={self.rlbk}, rd_only={self.rd_only}, tim={self.tim}"
 
 class Pic(Ops):
     """ PARSE IN CURSOR lines. SQL statement is persisted as one string, in `raw` field"""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, ts_callback) = args
-        super().__init__(op_type, cursor, fmeta, ts_callback)
-        for item in params.split(' '):
-            # In case of broken line just ignore it. This allows us to capture args of the lines
-            # From PIC
-            try:
-                if len(item):
-                    key = item.split('=')
-                    if key[0] == 'sqlid':
-                        self.dbop.__dict__['sql_id'] = key[1].strip("'")
-                    elif key[0] == 'ad':
-                        self.dbop.__dict__[key[0]] = key[1].strip("'")
-                    else:
-                        self.dbop.__dict__[key[0]] = int(key[1])
-            except (IndexError, ValueError):
-                print(f"Pic: got exception at line {fmeta['LINE_COUNT']}, offending line: {params}")
-                print_exception(exception())
-        self.dbop.__dict__['raw'] = ''
+        super().__init__(op_type, cursor, fmeta, ts_callback, pic_fields(params, fmeta))
     def __str__(self) -> str:
-        return (f"PARSING IN CURSOR len={self.dbop.len} dep={self.dbop.dep} uid={self.dbop.uid} "
-                f"oct={self.dbop.oct} lid={self.dbop.lid} tim={self.dbop.tim} hv={self.dbop.hv} "
-                f"ad={self.dbop.ad} sqlid={self.dbop.sql_id}\n{self.dbop.raw}\nEND OF STMT")
+        return (f"PARSING IN CURSOR len={self.len} dep={self.dep} uid={self.uid} "
+                f"oct={self.oct} lid={self.lid} tim={self.tim} hv={self.hv} "
+                f"ad={self.ad} sqlid={self.sql_id}\n{self.raw}\nEND OF STMT")
 
 class Lob(Ops):
     """ Various LOB* operations."""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, ts_callback) = args
-        super().__init__(op_type, cursor, fmeta, ts_callback)
-        for item in params.split(','):
-            if len(item):
-                key = item.split('=')
-                if key[0] == 'type':
-                    self.dbop.__dict__['lobtype'] = key[1]
-                else:
-                    self.dbop.__dict__[key[0]] = int(key[1])
+        super().__init__(op_type, cursor, fmeta, ts_callback, lob_fields(params))
     def __str__(self) -> str:
-        return (f"{self.dbop.op_type}: type={self.dbop.type},bytes={self.dbop.r},c={self.dbop.c},"
-                f"e={self.dbop.e},p={self.dbop.p},cr={self.dbop.cr},cu={self.dbop.cu},"
-                f"tim={self.dbop.tim}")
+        return (f"{self.op_type}: type={self.type},bytes={self.r},c={self.c},"
+                f"e={self.e},p={self.p},cr={self.cr},cu={self.cu},"
+                f"tim={self.tim}")
 
 class Exec(Ops):
     """ Events related to the database client calls (EXEC, FETCH, PARSE, CLOSE). These have similar
         enough properties."""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, ts_callback) = args
-        super().__init__(op_type, cursor, fmeta, ts_callback)
-        for item in params.split(','):
-            if len(item):
-                key = item.split('=')
-                self.dbop.__dict__[key[0]] = int(key[1])
+        super().__init__(op_type, cursor, fmeta, ts_callback, exec_fields(params))
     def __str__(self) -> str:
-        return (f"{self.dbop.cursor}: {self.dbop.op_type} "
-                f"c={self.dbop.c},e={self.dbop.e},p={self.dbop.p},cr={self.dbop.cr},"
-                f"cu={self.dbop.cu},mis={self.dbop.mis},r={self.dbop.r},"
-                f"dep={self.dbop.dep},og={self.dbop.og},plh={self.dbop.plh},"
-                f"tim={self.dbop.tim},fname={self.dbop.fname},line={self.dbop.line}")
+        return (f"{self.cursor}: {self.op_type} "
+                f"c={self.c},e={self.e},p={self.p},cr={self.cr},"
+                f"cu={self.cu},mis={self.mis},r={self.r},"
+                f"dep={self.dep},og={self.og},plh={self.plh},"
+                f"tim={self.tim},fname={self.fname},line={self.line}")
 
 class Error(Ops):
     """Covers ERROR and PARSE ERROR calls."""
+    __slots__ = ()
     def __init__(self, op_type: str, cursor: str, params: str, *args) -> None:
         (fmeta, ts_callback) = args
-        super().__init__(op_type, cursor, fmeta, ts_callback)
-        for item in params.split(' '):
-            try:
-                if len(item):
-                    key = item.split('=')
-                    self.dbop.__dict__[key[0]] = int(key[1])
-            except (IndexError, ValueError):
-                print(f"Error: got exception at line {fmeta['LINE_COUNT']}, offending line: "
-                    f"{params}")
-                print_exception(exception())
-        if op_type == 'PARSE ERROR':
-            self.dbop.__dict__['raw'] = ''
+        super().__init__(op_type, cursor, fmeta, ts_callback,
+                         error_fields(op_type, params, fmeta))
     def __str__(self) -> str:
-        str0 = f"{self.dbop.op_type} {self.dbop.cursor}:"
-        if self.dbop.op_type == 'ERROR':
-            return str0 + f"err={self.dbop.err} tim={self.dbop.tim}"
-        return str0 + (f"len={self.dbop.len} dep={self.dbop.dep} uid={self.dbop.uid} "
-                     f"oct={self.dbop.oct} lid={self.dbop.lid} tim={self.dbop.tim} "
-                     f"err={self.dbop.err}")
+        str0 = f"{self.op_type} {self.cursor}:"
+        if self.op_type == 'ERROR':
+            return str0 + f"err={self.err} tim={self.tim}"
+        return str0 + (f"len={self.len} dep={self.dep} uid={self.uid} "
+                     f"oct={self.oct} lid={self.lid} tim={self.tim} "
+                     f"err={self.err}")
 
 def ops_factory(op_type: str, cursor: str, params: str, *args, **kwargs) -> Ops:
     """
         Factory method for operations.
-        Expected args are fmeta (dict) and ts_callback (Callable[[int], datetime.datetime]).
+        Expected args are fmeta (dict) and ts_callback (Callable[[int], int], the tim to
+        microseconds since the epoch).
         Optional kwargs are name (str) and ts2 (datetime.datetime)
     """
     ops: Optional[Ops] = None
@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+from typing import Optional
+
+__doc__ = '''Pipeline stages of trc2db. Reading and decompression of the compressed files run in
+    their own threads already, see decompress.py. Parser and CallTracker share the state line by
+    line and stay in the main thread. Spans dumped by the tracker go to the encoder thread in
+    batches, through the bounded queue. The encoder turns them into Arrow tables and hands these
+    to the Parquet writer of the backend.
+
+    When the encoder or the writer fall behind, the queue fills up and the parser waits, so the
+    memory is bounded by the queue depth. Stage counts how long the producer stalled on the full
+    queue and the consumer waited on the empty one.'''
+
+# Batches in the queue
+QUEUE_DEPTH = 8
+# Spans in one batch
+BATCH_SPANS = 512
+
+_STOP = object()
+
+class Stage:
+    """Runs func on the items of the bounded queue in the background thread. Thread is started
+        by the first put() and stopped by drain(), so the idle stage holds no thread. Exception
+        in func is raised by the next put() or drain()."""
+    def __init__(self, name: str, func, depth: int = QUEUE_DEPTH) -> None:
+        self.name = name
+        self.func = func
+        self.depth = depth
+        self.queue: queue.Queue = queue.Queue(depth)
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[BaseException] = None
+        self.items = 0
+        self.max_depth = 0
+        # Producer waiting for the space in the queue, consumer waiting for the items
+        self.stall_ns = 0
+        self.idle_ns = 0
+    def _run(self) -> None:
+        (get, clock) = (self.queue.get, time.perf_counter_ns)
+        while True:
+            start = clock()
+            item = get()
+            self.idle_ns += clock() - start
+            if item is _STOP:
+                return
+            if self.error is None:
+                try:
+                    self.func(item)
+                except BaseException as ex: # pylint: disable=broad-exception-caught
+                    self.error = ex
+    def _check(self) -> None:
+        if self.error is not None:
+            (ex, self.error) = (self.error, None)
+            raise RuntimeError(f"{self.name} stage failed: {ex!r}") from ex
+    def put(self, item) -> None:
+        """Queues the item, waits if the queue is full"""
+        self._check()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self.thread.start()
+        start = time.perf_counter_ns()
+        self.queue.put(item)
+        self.stall_ns += time.perf_counter_ns() - start
+        self.items += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+    def drain(self) -> None:
+        """Waits until the queued items are processed and stops the thread"""
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+        self._check()
+    def stats(self) -> dict:
+        return {'items': self.items, 'depth': self.depth, 'max_depth': self.max_depth,
+                'stall_s': self.stall_ns / 1e9, 'idle_s': self.idle_ns / 1e9}
+
+class PipelinedBackend:
+    """Backend wrapper: spans are passed to the backend in the encoder stage. Span ids are
+        generated in the calling thread, the rest of the attributes come from the backend."""
+    def __init__(self, backend, depth: int = QUEUE_DEPTH, batch_spans: int = BATCH_SPANS) -> None:
+        self.backend = backend
+        self.batch_spans = batch_spans
+        self.stage = Stage('encoder', self._encode, depth)
+        self._batch: list = []
+    def __getattr__(self, name: str):
+        return getattr(self.backend, name)
+    def get_span_id(self) -> int:
+        return self.backend.get_span_id()
+    def _encode(self, batch: list) -> None:
+        add_ops = self.backend.add_ops
+        for (span_id, sql_id, ops) in batch:
+            add_ops(span_id, sql_id, ops)
+    def add_ops(self, span_id: int, sql_id: str, ops) -> None:
+        self._batch.append((span_id, sql_id, ops))
+        if len(self._batch) >= self.batch_spans:
+            self.stage.put(self._batch)
+            self._batch = []
+    def flush(self) -> None:
+        """Passes the rest of the spans to the backend, waits for the stage and flushes the
+            backend"""
+        if self._batch:
+            self.stage.put(self._batch)
+            self._batch = []
+        self.stage.drain()
+        self.backend.flush()
+    def write_row_group(self) -> None:
+        """Same as flush(), but the files of the backend stay open"""
+        if self._batch:
+            self.stage.put(self._batch)
+            self._batch = []
+        self.stage.drain()
+        self.backend.write_row_group()
+
+def merge_stats(entries: list[dict]) -> dict:
+    """Sums up the stats of the stages, max_depth is the maximum"""
+    out: dict = {}
+    for entry in entries:
+        for (key, value) in entry.items():
+            out[key] = max(out.get(key, 0), value) if key in ('depth', 'max_depth') \
+                else out.get(key, 0) + value
+    return out
+
+def format_stats(stats: dict) -> str:
+    return (f"encoder queue max {stats['max_depth']}/{stats['depth']} batches, parser stalled "
+            + f"{stats['stall_s']:.1f} s, encoder idle {stats['idle_s']:.1f} s")
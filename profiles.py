@@ -0,0 +1,52 @@
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from typing import Optional
+import zlib
+
+__doc__ = '''Ingest profiles: which record types and columns are captured from the trace file.
+    Record types in skip are dropped by the parser, without creating the ops for them: BINDS
+    blocks and STAT lines are most of the bytes of the level 12 traces. Record types in no_raw
+    are captured without the raw text.
+
+    Bind sample keeps the BINDS of the fraction of spans, whatever the profile. Sample is
+    deterministic: it is decided by the hash of the file name and line number of the BINDS
+    line, so the same spans are sampled in every run, with or without splitting.'''
+
+@dataclass(frozen=True)
+class Profile:
+    """Profile, see the module docstring"""
+    name: str
+    skip: frozenset = field(default_factory=frozenset)
+    no_raw: frozenset = field(default_factory=frozenset)
+    # Fraction of spans whose BINDS are kept, None: profile decides
+    bind_sample: Optional[float] = None
+
+    @cached_property
+    def checked(self) -> frozenset:
+        """Record types the parser has to ask captured() about"""
+        if self.bind_sample is None:
+            return self.skip
+        return self.skip | {'BINDS'}
+    def captured(self, op_type: str, fname: str, line: int) -> bool:
+        """Is the record at the line of the file captured"""
+        if op_type == 'BINDS' and self.bind_sample is not None:
+            return zlib.crc32(f'{fname}:{line}'.encode()) < self.bind_sample * (1 << 32)
+        return op_type not in self.skip
+
+PROFILES = {
+    # Everything, as before the profiles
+    'full': Profile('full'),
+    # Timings only: calls, waits and SQL text
+    'latency': Profile('latency', frozenset(('BINDS', 'STAT')), frozenset(('WAIT',))),
+    # Timings and execution plans
+    'plans': Profile('plans', frozenset(('BINDS',)), frozenset(('WAIT',))),
+}
+FULL = PROFILES['full']
+
+def get_profile(name: str = 'full', bind_sample: Optional[float] = None) -> Profile:
+    """Profile by name, with the bind sample"""
+    if name not in PROFILES:
+        raise ValueError(f"Unknown ingest profile {name}, expected one of {', '.join(PROFILES)}")
+    if bind_sample is not None and not 0 <= bind_sample <= 1:
+        raise ValueError(f"Bind sample has to be between 0 and 1, got {bind_sample}")
+    return replace(PROFILES[name], bind_sample=bind_sample)
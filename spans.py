@@ -0,0 +1,100 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+__doc__ = '''Span summary: one row per span, written next to the raw ops. Elapsed time is max(tim) -
+    min(tim) of the span, like in the v_elapsed_time view of summary.py, the rest are the sums of
+    the database calls and of the wait time by wait class. Rows of a span are always flushed in
+    the same table, so the summary is built from the table in the writer thread.
+
+    Spans live in the _spans subdirectory, under the same names as the raw files:
+    "<dbdir>/_spans/<prefix>.<n>" summarises "<dbdir>/<prefix>.<n>". read_parquet('dbdir/*') does
+    not see them.'''
+
+SPANS_DIR = '_spans'
+SPANS_SCHEMA_VERSION = '0.1'
+
+# Trace file has the wait event names only. Classes as in v$event_name, for the common events.
+# First matching prefix wins.
+WAIT_CLASSES: tuple[tuple[str, tuple[str, ...]], ...] = (
+    ('idle', ('SQL*Net message from client', 'PL/SQL lock timer', 'jobq slave wait')),
+    ('user_io', ('db file ', 'direct path read', 'direct path write', 'read by other session',
+                 'cell single block', 'cell multiblock', 'cell smart', 'cell list of blocks')),
+    ('commit', ('log file sync',)),
+    ('network', ('SQL*Net more data', 'SQL*Net message to', 'SQL*Net message from dblink',
+                 'SQL*Net vector data')),
+    ('application', ('enq: TX - row lock', 'enq: TM', 'enq: UL', 'enq: RO',
+                     'SQL*Net break/reset')),
+    ('concurrency', ('latch', 'library cache', 'cursor: ', 'buffer busy', 'row cache',
+                     'enq: TX - index contention')),
+    ('cluster', ('gc ',)),
+)
+CLASS_NAMES: tuple[str, ...] = tuple(name for (name, _) in WAIT_CLASSES) + ('other',)
+
+SPANS_SCHEMA = pa.schema([
+    ('span_id', pa.uint64()),
+    ('sql_id', pa.string()),
+    ('cursor_id', pa.string()),
+    ('client_id', pa.string()),
+    ('module', pa.string()),
+    ('ts', pa.timestamp('us')),
+    ('ela', pa.uint64()),
+    ('cpu_time', pa.uint64()),
+    ('ph_reads', pa.uint64()),
+    ('cr_reads', pa.uint64()),
+    ('current_reads', pa.uint64()),
+    ('rows_processed', pa.uint64()),
+    ('fetches', pa.uint64()),
+    *[(f'wait_{name}', pa.uint64()) for name in CLASS_NAMES],
+], metadata={'spans_schema_version': SPANS_SCHEMA_VERSION})
+
+# (column of the ops table, column of SPANS_SCHEMA)
+FIRST = (('sql_id', 'sql_id'), ('cursor_id', 'cursor_id'), ('client_id', 'client_id'),
+         ('module', 'module'))
+SUMS = (('cpu_time', 'cpu_time'), ('ph_reads', 'ph_reads'), ('cr_reads', 'cr_reads'),
+        ('current_reads', 'current_reads'), ('rows_processed', 'rows_processed'),
+        ('fetch', 'fetches'))
+
+def wait_class(name: str) -> str:
+    """Wait class of the event name, 'other' if not known"""
+    for (cls, prefixes) in WAIT_CLASSES:
+        if name.startswith(prefixes):
+            return cls
+    return 'other'
+
+def spans_table(tbl: pa.Table) -> pa.Table:
+    """Summarises the ops table, in backend.arrow.PARQUET_SCHEMA, into SPANS_SCHEMA. Elapsed time
+        and ts are taken from the ops with tim, spans without these have null ela and ts."""
+    timed = pc.fill_null(pc.not_equal(tbl['tim'], 0), False)
+    is_wait = pc.fill_null(pc.equal(tbl['ops'], 'WAIT'), False)
+    cols = {'span_id': tbl['span_id'],
+            'tim': pc.if_else(timed, tbl['tim'], None),
+            'ts': pc.if_else(timed, tbl['ts'], None),
+            'fetch': pc.cast(pc.equal(tbl['ops'], 'FETCH'), pa.uint64())}
+    # No 'first' for the dictionary columns
+    for (name, _) in FIRST:
+        cols[name] = tbl[name].cast(pa.string())
+    for (name, _) in SUMS[:-1]:
+        cols[name] = tbl[name]
+    # Class of each distinct event name, then of every row
+    events = pc.dictionary_encode(tbl['event_name']).combine_chunks()
+    classes = pa.array([CLASS_NAMES.index(wait_class(name))
+                        for name in events.dictionary.to_pylist()], pa.int8())
+    row_class = pc.take(classes, events.indices)
+    ela = pc.if_else(is_wait, tbl['elapsed_time'], 0)
+    for (idx, name) in enumerate(CLASS_NAMES):
+        cols[f'wait_{name}'] = pc.if_else(pc.fill_null(pc.equal(row_class, idx), False), ela, 0)
+    aggs = [(name, 'first') for (name, _) in FIRST] + [('tim', 'min'), ('tim', 'max'),
+                                                       ('ts', 'min')]
+    aggs += [(name, 'sum') for (name, _) in SUMS]
+    aggs += [(f'wait_{name}', 'sum') for name in CLASS_NAMES]
+    grouped = pa.table(cols).group_by('span_id', use_threads=False).aggregate(aggs)
+    out = {'span_id': grouped['span_id']}
+    for (name, column) in FIRST:
+        out[column] = grouped[f'{name}_first']
+    out['ts'] = grouped['ts_min']
+    out['ela'] = pc.subtract(grouped['tim_max'], grouped['tim_min'])
+    for (name, column) in SUMS:
+        out[column] = grouped[f'{name}_sum']
+    for name in CLASS_NAMES:
+        out[f'wait_{name}'] = grouped[f'wait_{name}_sum']
+    return pa.table(out).cast(SPANS_SCHEMA)
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3.12
 
 import argparse
+import datetime
+import glob
+import os
 import sys
 import duckdb as d
 from hdrh.histogram import HdrHistogram
 import tabulate
+from histograms import HIGHEST, HISTOGRAM_DIR, merge
+from spans import SPANS_DIR
 
 __doc__ = """Some examples what can be done with Oracle SQL tracec using Duckdb and Parquet."""
 
@@ -25,9 +30,31 @@ def thresold2pred(thresold):
         preds = (f"> {th[0]}")
     return preds
 
-def create_preds(fis):
-    """Turns parameters into SQL expressions."""
-    preds = set()
+def partition_preds(fis, partitions):
+    """Predicates on the date and hour partitions for the start and end filters. Span is in the
+        partition of its start, so the rows of the spans that started before start are left
+        out."""
+    preds = []
+    if 'date' not in partitions:
+        return preds
+    for (key, op) in (('start', '>'), ('end', '<')):
+        try:
+            moment = datetime.datetime.fromisoformat(fis[key])
+        except (KeyError, ValueError):
+            continue
+        if moment.tzinfo:
+            moment = moment.astimezone(datetime.timezone.utc)
+        day = f"DATE '{moment.date()}'"
+        if 'hour' in partitions:
+            preds.append(f"(date {op} {day} or (date = {day} and hour {op}= {moment.hour}))")
+        else:
+            preds.append(f"date {op}= {day}")
+    return preds
+
+def create_preds(fis, partitions=()):
+    """Turns parameters into SQL expressions. With the partitioned layout, adds the predicates
+        that prune the partitions."""
+    preds = set(partition_preds(fis, partitions))
     if 'start' in fis:
         preds.add(f"ts >= TIMESTAMP '{fis['start']}'")
     if 'end' in fis:
@@ -39,24 +66,105 @@ def create_preds(fis):
 
     return ' and '.join(preds)
 
+# Types of the partition columns, the rest are strings
+PARTITION_TYPES = {'date': 'DATE', 'hour': 'INTEGER'}
+
+def hive_options(partitions):
+    """read_parquet() options of the partitioned layout"""
+    if not partitions:
+        return 'hive_partitioning = false'
+    types = ', '.join(f"'{c}': {PARTITION_TYPES.get(c, 'VARCHAR')}" for c in partitions)
+    return f'hive_partitioning = true, hive_types = {{{types}}}'
+
+def read_parquet(path, partitions=()):
+    """read_parquet() of the files, with the partition columns if there are any"""
+    return f"read_parquet('{path}', {hive_options(partitions)})"
+
+def read_ops(dbdir, partitions=()):
+    """read_parquet() of the raw files. Columns are matched by name, so the files of the older
+        schema versions, with plain strings and 64 bit integers, can be read with the newer ones."""
+    return f"read_parquet('{dbdir}', union_by_name = true, {hive_options(partitions)})"
+
+def partition_columns(dbdir):
+    """Partition columns of the hive partitioned layout, see backend/arrow.py. Empty for the
+        flat layout."""
+    columns = []
+    path = dbdir
+    while dirs := sorted(e for e in os.listdir(path)
+                         if '=' in e and os.path.isdir(os.path.join(path, e))):
+        columns.append(dirs[0].split('=')[0])
+        path = os.path.join(path, dirs[0])
+    return columns
+
+def layout_glob(path, partitions=()):
+    """Glob of the files in path, in the flat or in the partitioned layout"""
+    return '/'.join([path] + ['*'] * (len(partitions) + 1))
+
+def layout_files(path, partitions=()):
+    """Files of layout_glob(), relative to path, without the sidecars"""
+    return {os.path.relpath(f, path) for f in glob.glob(layout_glob(path, partitions))
+            if os.path.isfile(f) and not os.path.relpath(f, path).startswith('_')}
+
+def sidecar_path(dbdir, subdir, partitions=()):
+    """Glob of the files in subdir that go with the raw files: span summaries or histograms.
+        None if some of the raw files have none, written by the older trc2db for example."""
+    sidecar_dir = os.path.join(dbdir, subdir)
+    if not os.path.isdir(sidecar_dir):
+        return None
+    raw = layout_files(dbdir, partitions)
+    covered = layout_files(sidecar_dir, partitions)
+    if not covered or not raw <= covered:
+        return None
+    return layout_glob(sidecar_dir, partitions)
+
+def spans_path(dbdir, partitions=()):
+    """Span summaries, see spans.py"""
+    return sidecar_path(dbdir, SPANS_DIR, partitions)
+
+def histograms_path(dbdir, partitions=()):
+    """Latency histograms, see histograms.py"""
+    return sidecar_path(dbdir, HISTOGRAM_DIR, partitions)
+
 class SummaryDuckdb:
-    """ Initializes Duckdb with wiews and runs queries."""
-    def __init__(self, dbdir, tabtype, tabsize, remove_idle):
+    """ Initializes Duckdb with wiews and runs queries. Elapsed time of the spans is taken from
+        the span summaries if these are given, and computed from the raw ops otherwise.
+        Percentiles without the filters are taken from the histograms if these are given.
+        With the partitioned layout, partitions are the partition columns: v_elapsed_time has
+        these, and the filters prune the partitions."""
+    def __init__(self, dbdir, tabtype, tabsize, remove_idle, spans=None, histograms=None,
+                 partitions=()):
         self.dbdir = dbdir
         self.tabtype = tabtype
         self.tabsize = tabsize
-        d.sql(f"""create or replace view v_elapsed_time as
+        self.remove_idle = remove_idle
+        self.histograms = histograms
+        self.partitions = tuple(partitions)
+        # Partition columns of the span are the same for its every row
+        extra = ''.join(f', {c}' for c in partitions if c != 'client_id')
+        if spans:
+            d.sql(f"""create or replace view v_elapsed_time as
+                select sql_id, span_id, ela, ts, client_id{extra}
+                from
+                    {read_parquet(spans, partitions)}
+                where
+                    ela is not null
+                    {"and cursor_id <> '#0'" if remove_idle else ""};
+              """)
+        else:
+            d.sql(f"""create or replace view v_elapsed_time as
                 select sql_id,
                     span_id,
                     max(tim) - min(tim) as ela,
                     first(ts order by ts) ts,
-                    first(client_id) client_id
+                    {"client_id" if "client_id" in partitions else "first(client_id) client_id"}
+                    {extra}
                 from
-                    read_parquet('{dbdir}')
+                    {read_ops(dbdir, partitions)}
                 where
                     tim is not null and tim <> 0
                     {"and cursor_id <> '#0'" if remove_idle else ""}
-                group by sql_id, span_id;
+                group by sql_id, span_id{extra}
+                    {", client_id" if "client_id" in partitions else ""};
               """)
         d.sql(f"""create or replace view cursor_elapsed_time as
                 select cursor_id,
@@ -64,15 +172,62 @@ class SummaryDuckdb:
                     max(tim) - min(tim) as ela,
                     first(ts order by ts) ts
                 from
-                    read_parquet('{dbdir}')
+                    {read_ops(dbdir, partitions)}
                 where
                     tim is not null
                 group by cursor_id, span_id;
               """)
 
+    def merge_histograms(self, kind, key=None):
+        """Merges the histograms of kind ('sql_id' or 'wait'), of one key or all of them.
+            Returns {key: (count, sum, max, HdrHistogram)}."""
+        res = d.sql(f"""select key, sum(count), sum(sum), max(max), list(digits), list(histogram)
+                        from {read_parquet(self.histograms, self.partitions)}
+                        where kind = '{kind}' {f"and key = '{key}'" if key else ''}
+                        group by key""").fetchall()
+        return {row[0]: (int(row[1]), int(row[2]), row[3],
+                         merge(zip(row[4], row[5]))) for row in res}
+    def summary_histograms(self):
+        """Rows of summary() from the histograms"""
+        stats = sorted(self.merge_histograms('sql_id').items(), key=lambda s: s[1][0])
+        texts = dict(d.sql(f"""select sql_id, any_value(event_raw)
+                               from {read_ops(self.dbdir, self.partitions)}
+                               where ops = 'PIC' group by sql_id""").fetchall())
+        # Values over the range of the histogram are clamped, percentiles of these are exact
+        exact = self.exact_percentiles([sql_id for (sql_id, (_, _, top, hist)) in stats
+                                        if top > hist.highest_trackable_value])
+        out = []
+        for (rownum, (sql_id, (execs, total, top, hist))) in enumerate(stats, 1):
+            text = texts.get(sql_id)
+            (median, p99) = exact.get(sql_id) or (min(hist.get_value_at_percentile(50), top),
+                                                  min(hist.get_value_at_percentile(99), top))
+            out.append((rownum, sql_id or 'NULL',
+                        text[:29].replace('\r', '').replace('\n', '') if text else 'NULL',
+                        execs, total, median, p99, top))
+        return out[::-1][:self.tabsize]
+    def exact_percentiles(self, sql_ids):
+        """Median and p99 of the sql_ids from v_elapsed_time, like summary() without the
+            histograms. Returns {sql_id: (median, p99)}."""
+        if not sql_ids:
+            return {}
+        preds = ['sql_id is null'] if None in sql_ids else []
+        if ids := [f"'{s}'" for s in sql_ids if s is not None]:
+            preds.append(f"sql_id in ({','.join(ids)})")
+        res = d.sql(f"""select sql_id, median(ela), percentile_disc(0.99) within group (order by ela)
+                        from v_elapsed_time
+                        where {' or '.join(preds)}
+                        group by sql_id""").fetchall()
+        return {row[0]: row[1:] for row in res}
     def summary(self, fis):
-        """Prints out list of SQL queries executed and some summary statistics."""
-        preds = create_preds(fis)
+        """Prints out list of SQL queries executed and some summary statistics. Without the
+            filters, percentiles come from the histograms if there are any."""
+        # sql_id histograms leave out the cursor #0
+        if self.histograms and self.remove_idle and not fis:
+            table = tabulate.tabulate(self.summary_histograms(), tablefmt=self.tabtype,
+                    headers=['#', 'sql_id', 'sql_text', 'executions', 'total(us)', 'median(us)', 'p99(us)', 'max(us)'])
+            print(table)
+            return
+        preds = create_preds(fis, self.partitions)
         filter_pred = f"""{'WHERE ' if preds else ''} {preds}"""
 
         query = f"""
@@ -107,7 +262,7 @@ class SummaryDuckdb:
                                     sql_id,
                                     any_value(event_raw) "sql_text"
                                 FROM
-                                    read_parquet ( '{self.dbdir}' )
+                                    {read_ops(self.dbdir, self.partitions)}
                                 WHERE
                                     ops = 'PIC'
                                 GROUP BY
@@ -151,7 +306,7 @@ class SummaryDuckdb:
                                     cursor_id,
                                     any_value(event_raw) "sql_text"
                                 FROM
-                                    read_parquet ( '{self.dbdir}' )
+                                    {read_ops(self.dbdir, self.partitions)}
                                 WHERE
                                     ops = 'PIC'
                                 GROUP BY
@@ -163,18 +318,22 @@ class SummaryDuckdb:
         print(res)
 
     def create_hdrh(self, sql_id, fname, fis):
-        preds = create_preds(fis)
-        res = d.sql(f"select ela from v_elapsed_time where sql_id = '{sql_id}' "
-                    +f"{'and' if preds else ''} {preds}").fetchall()
-        resp_hist = HdrHistogram(1, 1000000000, 1)
-        for ela in res:
-            resp_hist.record_value(ela[0])
+        if self.histograms and self.remove_idle and not fis:
+            merged = self.merge_histograms('sql_id', sql_id).get(sql_id)
+            resp_hist = merged[3] if merged else HdrHistogram(1, HIGHEST, 1)
+        else:
+            preds = create_preds(fis, self.partitions)
+            res = d.sql(f"select ela from v_elapsed_time where sql_id = '{sql_id}' "
+                        +f"{'and' if preds else ''} {preds}").fetchall()
+            resp_hist = HdrHistogram(1, HIGHEST, 1)
+            for ela in res:
+                resp_hist.record_value(ela[0])
         if not fname:
             fname = f"elapsed_{sql_id}.out"
         with open(fname, 'wb') as f:
             resp_hist.output_percentile_distribution(f, 1.0)
     def outliers(self, sql_id, thresold, fis, statistic='elapsed_time'):
-        preds = create_preds(fis)
+        preds = create_preds(fis, self.partitions)
         thresold_preds = thresold2pred(thresold)
         res = d.sql(f"""select
                             row_number() over(order by sum({statistic}) asc) rownum,
@@ -184,7 +343,7 @@ class SummaryDuckdb:
                             case when length(first(file_name)) > 30 then '<...>'||substr(first(file_name), length(first(file_name)) -35, 40) else first(file_name) end file_name,
                             first(line) "first line"
                         from
-                            read_parquet('{self.dbdir}')
+                            {read_ops(self.dbdir, self.partitions)}
                         {"where" if preds else ''}
                             {preds}
                         group by
@@ -197,7 +356,7 @@ class SummaryDuckdb:
                 headers=['#', 'cursor', statistic, 'timestamp', 'filename', 'first line#'])
         print(table)
     def waits(self, fis, thresold):
-        preds = create_preds(fis)
+        preds = create_preds(fis, self.partitions)
         inner_where = ''
         if thresold:
             inner_where = f" AND span_id in (select span_id from v_elapsed_time where ela > {thresold}) and cursor_id <> '#0'"
@@ -221,7 +380,7 @@ class SummaryDuckdb:
                                 ops,
                                 sql_id
                             FROM
-                                read_parquet ( '{self.dbdir}' )
+                                {read_ops(self.dbdir, self.partitions)}
                             WHERE
                                 ops = 'WAIT'
                                 {'AND' if preds else ''} {preds}
@@ -237,16 +396,20 @@ class SummaryDuckdb:
                 headers=['#', 'wait', 'count', 'sum(us)', 'median(us)', 'p99(us)', 'max(us)'])
         print(table)
     def wait_histogram(self, wait_name, fname):
-        res = d.sql(f"""select elapsed_time
-                        from
-                            read_parquet('{self.dbdir}')
-                        where
-                            ops = 'WAIT'
-                            and event_name = '{wait_name}'
-                    """).fetchall()
-        resp_hist = HdrHistogram(1, 1000000000, 1)
-        for ela in res:
-            resp_hist.record_value(ela[0])
+        if self.histograms:
+            merged = self.merge_histograms('wait', wait_name).get(wait_name)
+            resp_hist = merged[3] if merged else HdrHistogram(1, HIGHEST, 1)
+        else:
+            res = d.sql(f"""select elapsed_time
+                            from
+                                {read_ops(self.dbdir, self.partitions)}
+                            where
+                                ops = 'WAIT'
+                                and event_name = '{wait_name}'
+                        """).fetchall()
+            resp_hist = HdrHistogram(1, HIGHEST, 1)
+            for ela in res:
+                resp_hist.record_value(ela[0])
         if not fname:
             fname = 'wait_histogram'
         with open(fname, 'wb') as fdesc:
@@ -259,7 +422,7 @@ class SummaryDuckdb:
                             count(distinct cursor_id) cursors,
                             first(ts order by ts) "first timestamp",
                             last(ts order by ts) filter(ts is not null) "last timestamp"
-                        from read_parquet('{self.dbdir}')
+                        from {read_ops(self.dbdir, self.partitions)}
                     """)
         table = tabulate.tabulate(res.fetchall(), tablefmt=self.tabtype,
                 headers=['rows', 'files', "sql_id's", 'cursors', 'first_timestamp', 'last_timestamp'])
@@ -273,7 +436,7 @@ class SummaryDuckdb:
                             date_trunc('second', max(ts)) "last timestamp",
                             date_trunc('second', max(ts)) - date_trunc('second', min(ts)) "wallclock time in file",
                             cast(round((max(tim) - min(tim))/1000000) as integer) "elapsed(s)" 
-                        from read_parquet('{self.dbdir}')
+                        from {read_ops(self.dbdir, self.partitions)}
                         group by file_name order by count(*) desc
                         LIMIT {self.tabsize};
                     """)
@@ -288,7 +451,7 @@ class SummaryDuckdb:
                                 sum(cr_reads) cr_reads,
                                 sum(current_reads) current_reads,
                                 sum(rows_processed) rows_processed,
-                            from read_parquet('{self.dbdir}')
+                            from {read_ops(self.dbdir, self.partitions)}
                             where
                                 sql_id = '{sql_id}'
                             group by span_id
@@ -341,7 +504,7 @@ class SummaryDuckdb:
                                 max(elapsed_time) max_ela,
                                 case when ops = 'PIC' then 1 when ops = 'PARSE' then 2 when ops = 'EXEC' then 3
                                 when ops = 'WAIT' then 4 when ops = 'FETCH' then 5 else 6 end dummy
-                            from read_parquet('{self.dbdir}')
+                            from {read_ops(self.dbdir, self.partitions)}
                             where
                                 sql_id = '{sql_id}'
                                 and ops in ('PIC', 'PARSE', 'EXEC', 'CLOSE', 'WAIT', 'FETCH', 'ERROR')
@@ -445,7 +608,10 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
-    s = SummaryDuckdb(args.dbdir + '/*', args.table_type, args.table_size, args.remove_idle)
+    partitions = partition_columns(args.dbdir)
+    s = SummaryDuckdb(layout_glob(args.dbdir, partitions), args.table_type, args.table_size,
+                      args.remove_idle, spans_path(args.dbdir, partitions),
+                      histograms_path(args.dbdir, partitions), partitions)
 
     if args.action == 'summary':
         s.summary(filters)
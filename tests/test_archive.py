@@ -0,0 +1,117 @@
+import io
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+import duckdb as d
+import archive
+import trc2db
+import trcparser
+from call_tracker import CallTracker
+from tests.mock_backend import Backend
+from tests.test_trc2db import DummyArgs
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TRACES = ('tests/traces/mixed_execs.trc', 'tests/traces/lobs.trc', 'tests/traces/simple_trace.trc')
+
+class TestArchive(unittest.TestCase):
+    """Trace files in the tar and zip archives"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.expected = {}
+        for fname in TRACES:
+            tracker = CallTracker(Backend())
+            trcparser.process_file(tracker, fname)
+            tracker.flush()
+            self.expected[os.path.basename(fname)] = self.rows(tracker.db.batches)
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    def rows(self, batches):
+        """Rows without span id and file name"""
+        return sorted((b[1:18] + b[19:] for b in batches), key=repr)
+    def make(self, name, mode):
+        """Writes the traces into archive, under trace/ directory, with one extra file"""
+        fname = os.path.join(self.tmpdir.name, name)
+        if mode == 'zip':
+            with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as zfile:
+                for trace in TRACES:
+                    zfile.write(trace, f'trace/{os.path.basename(trace)}')
+                zfile.writestr('trace/alert.log', 'not a trace file\n')
+            return fname
+        if mode == 'w:zst':
+            buf = io.BytesIO()
+            self.fill_tar(tarfile.open(fileobj=buf, mode='w'))
+            with open(fname, 'wb') as fdesc:
+                fdesc.write(zstandard.ZstdCompressor().compress(buf.getvalue()))
+            return fname
+        self.fill_tar(tarfile.open(fname, mode))
+        return fname
+    def fill_tar(self, tar):
+        with tar:
+            for trace in TRACES:
+                tar.add(trace, f'trace/{os.path.basename(trace)}')
+            info = tarfile.TarInfo('trace/alert.log')
+            info.size = 17
+            tar.addfile(info, io.BytesIO(b'not a trace file\n'))
+    def archives(self):
+        out = [self.make('bundle.tar', 'w'), self.make('bundle.tar.gz', 'w:gz'),
+               self.make('bundle.tar.bz2', 'w:bz2'), self.make('bundle.zip', 'zip')]
+        if zstandard:
+            out.append(self.make('bundle.tar.zst', 'w:zst'))
+        return out
+    def test_members(self):
+        for fname in self.archives():
+            with self.subTest(fname):
+                self.assertIsNotNone(archive.archive_type(fname))
+                members = archive.list_members(fname, '*.trc')
+                self.assertEqual(len(members), 3)
+                self.assertEqual(sorted(members), sorted(
+                    (f'trace/{os.path.basename(t)}', os.path.getsize(t)) for t in TRACES))
+                for (name, trace) in archive.iter_members(fname, pattern='*.trc'):
+                    with open(name.replace(f'{fname}!trace/', 'tests/traces/'), 'rb') as fdesc:
+                        lines = fdesc.readlines()
+                    with trace:
+                        self.assertEqual(list(trace), lines)
+                # One member, through get_opener
+                name = f'{fname}!trace/lobs.trc'
+                tracker = CallTracker(Backend())
+                trcparser.process_file(tracker, name)
+                tracker.flush()
+                self.assertEqual(self.rows(tracker.db.batches), self.expected['lobs.trc'])
+                self.assertEqual({b[18] for b in tracker.db.batches if b[18]}, {name})
+        self.assertIsNone(archive.archive_type(TRACES[0]))
+        self.assertIsNone(archive.archive_type('tests/traces/two_statements_one_cursor.trc.gz'))
+    def test_plan_members(self):
+        fname = self.make('bundle.tar', 'w:')
+        self.assertEqual([len(m.names) for m in archive.plan_members(fname, '*.trc', 1)], [3])
+        self.assertEqual(len(archive.plan_members(fname, '*.trc', 2)), 3)
+        # Compressed tar is decompressed once, by one task
+        fname = self.make('bundle.tar.gz', 'w:gz')
+        for jobs in (1, 2):
+            self.assertEqual(archive.plan_members(fname, '*.trc', jobs),
+                             [archive.Members(None, os.path.getsize(fname))])
+        self.assertEqual(len(archive.plan_members(self.make('bundle.zip', 'zip'), None, 2)), 4)
+    def test_trc2db(self):
+        """All members end up in Parquet, with archive!member file names"""
+        total = sum(len(rows) for rows in self.expected.values())
+        for fname in self.archives():
+            for jobs in (1, 2):
+                with self.subTest(f'{fname} {jobs}'), tempfile.TemporaryDirectory() as db_dir:
+                    args = DummyArgs(dbdir=db_dir, trace_files=[fname], jobs=jobs,
+                                     member_glob='*.trc')
+                    trc2db.process_files(args)
+                    res = d.sql(f"select count(*), count(distinct file_name) from "
+                                +f"read_parquet('{db_dir}/*') where file_name is not null")
+                    self.assertEqual(res.fetchone(), (total, 3))
+                    res = d.sql(f"select distinct file_name from read_parquet('{db_dir}/*') "
+                                +"where file_name is not null")
+                    self.assertEqual({r[0] for r in res.fetchall()},
+                                     {f'{fname}!trace/{os.path.basename(t)}' for t in TRACES})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
+import glob
 from os import path
 import tempfile
 import unittest
 import datetime
+from urllib.parse import unquote
 import duckdb as d
-from backend.arrow import Backend, PARQUET_SCHEMA_VERSION
+import pyarrow as pa
+import pyarrow.parquet as pq
+from backend.arrow import Backend, ColumnBuffer, DICT_FIELDS, PARQUET_SCHEMA, \
+    PARQUET_SCHEMA_VERSION, SCHEMA_VERSION_KEY, WriterOptions, parse_column_compression, \
+    parse_partition_by
+import summary
 from call_tracker import CallTracker
 import trcparser
+from tests.test_columnar import parquet_rows
 
 class TestArrow(unittest.TestCase):
     """Tests for pyarrow backend."""
@@ -49,6 +57,152 @@ class TestArrow(unittest.TestCase):
             res = d.sql(f"select event_raw from read_parquet('{db_dir}/*') "
                         +"where ops = 'HEADER' and event_name = 'PARQUET_SCHEMA';")
             self.assertEqual(res.fetchone()[0], PARQUET_SCHEMA_VERSION)
+    def test_dictionary_columns(self):
+        """Repeated strings are buffered as dictionary arrays and written as dictionary columns"""
+        with tempfile.TemporaryDirectory() as db_dir:
+            dbs = Backend(db_dir, 'unittest')
+            tracker = CallTracker(dbs)
+            trcparser.process_file(tracker, 'tests/traces/lobs.trc')
+            tracker.reset()
+            dbs._buffer.seal()
+            tbl = pa.Table.from_batches(dbs._buffer.batches)
+            self.assertEqual(tbl.schema, PARQUET_SCHEMA)
+            waits = [name for (ops, name) in zip(tbl['ops'].to_pylist(),
+                                                 tbl['event_name'].to_pylist())
+                     if ops == 'WAIT']
+            self.assertEqual(len(waits), 26)
+            self.assertLess(len(tbl['event_name'].chunk(0).dictionary), len(waits))
+            self.assertTrue(pa.types.is_dictionary(tbl['file_name'].type))
+            dbs.flush()
+            self.assertEqual(pq.read_schema(f'{db_dir}/unittest.0'), PARQUET_SCHEMA)
+            group = pq.ParquetFile(f'{db_dir}/unittest.0').metadata.row_group(0)
+            encodings = {group.column(i).path_in_schema: group.column(i).encodings
+                         for i in range(group.num_columns)}
+            for name in ('tim', 'ts', 'line'):
+                self.assertIn('DELTA_BINARY_PACKED', encodings[name])
+            self.assertIn('RLE_DICTIONARY', encodings['event_name'])
+        self.assertEqual(len(DICT_FIELDS), sum(pa.types.is_dictionary(f.type) for f in PARQUET_SCHEMA))
+
+    def test_blocks(self):
+        """Ops are buffered in blocks of fixed size, output doesn't depend on it"""
+        with tempfile.TemporaryDirectory() as db_dir, tempfile.TemporaryDirectory() as small_dir:
+            tracker = CallTracker(Backend(db_dir, 'unittest'))
+            trcparser.process_file(tracker, 'tests/traces/lobs.trc')
+            tracker.flush()
+            dbs = Backend(small_dir, 'unittest')
+            dbs._buffer = ColumnBuffer(7)
+            tracker = CallTracker(dbs)
+            trcparser.process_file(tracker, 'tests/traces/lobs.trc')
+            tracker.reset()
+            self.assertEqual([b.num_rows for b in dbs._buffer.batches], [7] * 8)
+            self.assertEqual(len(dbs._buffer), 58)
+            tracker.flush()
+            self.assertEqual(parquet_rows(small_dir), parquet_rows(db_dir))
+
+    def test_row_groups(self):
+        """Row groups end at the span boundary, files roll over at the file size"""
+        trace = 'tests/traces/mixed_execs.trc'
+        with tempfile.TemporaryDirectory() as db_dir, tempfile.TemporaryDirectory() as small_dir:
+            tracker = CallTracker(Backend(db_dir, 'unittest'))
+            trcparser.process_file(tracker, trace)
+            tracker.flush()
+            self.assertEqual(pq.ParquetFile(f'{db_dir}/unittest.0').num_row_groups, 1)
+
+            dbs = Backend(small_dir, 'unittest', options=WriterOptions(row_group_size=10,
+                                                                       file_size=12000))
+            tracker = CallTracker(dbs)
+            trcparser.process_file(tracker, trace)
+            tracker.flush()
+            # Every file has the schema version record, these take span ids, too
+            def rows(dbdir):
+                return sorted((r[1:] for r in parquet_rows(dbdir) if r[16] != 'PARQUET_SCHEMA'),
+                              key=repr)
+            self.assertEqual(rows(small_dir), rows(db_dir))
+            files = sorted(glob.glob(f'{small_dir}/unittest.*'))
+            self.assertGreater(len(files), 1)
+            self.assertGreater(pq.ParquetFile(files[0]).num_row_groups, 1)
+            spans = []
+            for fname in files:
+                meta = pq.read_metadata(fname)
+                self.assertEqual(meta.metadata[SCHEMA_VERSION_KEY], PARQUET_SCHEMA_VERSION.encode())
+                self.assertEqual(d.sql(f"select count(*) from read_parquet('{fname}') "
+                                       +"where event_name = 'PARQUET_SCHEMA'").fetchone()[0], 1)
+                # Spans are not split between the files
+                file_spans = d.sql(f"select distinct span_id from read_parquet('{fname}') "
+                                   +"where ops <> 'HEADER'").fetchall()
+                spans += file_spans
+            self.assertEqual(len(spans), len(set(spans)))
+            self.assertIsNotNone(summary.spans_path(small_dir))
+            self.assertIsNotNone(summary.histograms_path(small_dir))
+
+    def test_partitions(self):
+        """Hive partitioned layout has the same rows as the flat one, spans are not split"""
+        traces = ('tests/traces/simple_trace.trc', 'tests/traces/lobs.trc',
+                  'tests/traces/two_statements_one_cursor.trc', 'tests/traces/mixed_execs.trc',
+                  'tests/traces/no_timezone.trc')
+        keys = parse_partition_by('date,hour,service_name')
+        with tempfile.TemporaryDirectory() as db_dir, tempfile.TemporaryDirectory() as part_dir:
+            for (dbdir, options) in ((db_dir, WriterOptions()),
+                                     (part_dir, WriterOptions(partition_by=keys))):
+                tracker = CallTracker(Backend(dbdir, 'unittest', options=options))
+                for trace in traces:
+                    trcparser.process_file(tracker, trace)
+                tracker.flush()
+            self.assertEqual(summary.partition_columns(part_dir), list(keys))
+            def rows(pattern):
+                return sorted(d.sql(f"""select * exclude (span_id)
+                                        from read_parquet('{pattern}', hive_partitioning = false)
+                                        where event_name is distinct from 'PARQUET_SCHEMA'
+                                     """).fetchall(), key=repr)
+            self.assertEqual(rows(summary.layout_glob(part_dir, keys)), rows(f'{db_dir}/*'))
+            files = [path.join(part_dir, f) for f in summary.layout_files(part_dir, keys)]
+            self.assertGreater(len({path.dirname(f) for f in files}), 3)
+            for fname in files:
+                (date, hour, service) = [unquote(p.split('=')[1])
+                                         for p in fname.split('/')[-4:-1]]
+                # Partition of the span is that of its start and its first row
+                res = d.sql(f"""select strftime(min(ts) filter (tim <> 0), '%Y-%m-%d %H'),
+                                    first(service_name)
+                                from read_parquet('{fname}')
+                                where ops <> 'HEADER' or event_name <> 'PARQUET_SCHEMA'
+                                group by span_id""").fetchall()
+                for (start, first) in res:
+                    self.assertEqual(start or '__HIVE_DEFAULT_PARTITION__ __HIVE_DEFAULT_PARTITION__',
+                                     f'{date} {hour}')
+                    self.assertEqual(first or '__HIVE_DEFAULT_PARTITION__', service)
+            self.assertEqual(summary.spans_path(part_dir, keys),
+                             summary.layout_glob(f'{part_dir}/_spans', keys))
+            self.assertIsNotNone(summary.histograms_path(part_dir, keys))
+        for spec in ('date,minute', 'date,date'):
+            with self.assertRaises(ValueError):
+                parse_partition_by(spec)
+
+    def test_compression(self):
+        """zstd by default, codec and level can be set per column"""
+        def codecs(fname):
+            meta = pq.read_metadata(fname).row_group(0)
+            return {meta.column(i).path_in_schema: meta.column(i).compression
+                    for i in range(meta.num_columns)}
+        with tempfile.TemporaryDirectory() as db_dir:
+            tracker = CallTracker(Backend(db_dir, 'unittest'))
+            trcparser.process_file(tracker, 'tests/traces/lobs.trc')
+            tracker.flush()
+            self.assertEqual(set(codecs(f'{db_dir}/unittest.0').values()), {'ZSTD'})
+        overrides = parse_column_compression('event_raw=gzip:9,ops=none')
+        self.assertEqual(overrides, {'event_raw': ('gzip', 9), 'ops': ('none', None)})
+        with tempfile.TemporaryDirectory() as db_dir:
+            options = WriterOptions(compression='lz4', column_compression=overrides)
+            tracker = CallTracker(Backend(db_dir, 'unittest', options=options))
+            trcparser.process_file(tracker, 'tests/traces/lobs.trc')
+            tracker.flush()
+            out = codecs(f'{db_dir}/unittest.0')
+            self.assertEqual((out['event_raw'], out['ops'], out['sql_id']),
+                             ('GZIP', 'UNCOMPRESSED', 'LZ4'))
+            self.assertEqual(d.sql(f"select count(*) from read_parquet('{db_dir}/*')").fetchone()[0],
+                             59)
+        for spec in ('xxx=zstd', 'ops=xxx', 'ops=snappy:1'):
+            with self.assertRaises(ValueError):
+                parse_column_compression(spec)
 
     def test_make_set_fs(self):
         """Checks if Backend creates the directory. Setting unsupported or non-existing file
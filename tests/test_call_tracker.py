@@ -1,8 +1,22 @@
+import collections
 import unittest
 from call_tracker import CallTracker
+from ops import ops_factory
+import trcparser
 from tests.mock_backend import Backend
 import tests.test_constants as test_constants
 
+def execute(tracker, cursor, tim, op_type='EXEC'):
+    params = f'c=1,e=1,p=0,cr=0,cu=0,mis=0,r=0,dep=0,og=1,plh=0,tim={tim}'
+    tracker.add_ops(cursor, ops_factory(op_type, cursor, params, test_constants.FMETA,
+                                        test_constants.TS_CALLBACK))
+
+def spans(batches):
+    out = collections.defaultdict(list)
+    for row in batches:
+        out[row[0]].append(row[1:])
+    return sorted(map(repr, out.values()))
+
 class TestCallTracker(unittest.TestCase):
     def setUp(self):
         dbs = Backend()
@@ -118,6 +132,64 @@ class TestCallTracker(unittest.TestCase):
 
         self.tracker.flush()
         self.assertEqual(len(self.tracker.db.batches), 2)
+    def test_max_cursors(self):
+        tracker = CallTracker(Backend(), max_cursors=2)
+        for (cursor, tim) in (('#1001', 1000), ('#1002', 1001), ('#1001', 1002), ('#1003', 1003)):
+            execute(tracker, cursor, tim)
+        # #1001 was used after #1002, so #1002 is the least recently used
+        self.assertEqual(tracker.evictions, {'idle': 0, 'lru': 1})
+        self.assertEqual(sorted(tracker.latest_cursors), ['#1001', '#1003'])
+        self.assertEqual([row[14] for row in tracker.db.batches], [1000, 1001])
+        tracker.flush()
+        self.assertEqual(len(tracker.db.batches), 4)
+    def test_idle_tim(self):
+        tracker = CallTracker(Backend(), idle_tim=100)
+        execute(tracker, '#1001', 1000)
+        execute(tracker, '#1002', 1050)
+        execute(tracker, '#1002', 1100, 'FETCH')
+        self.assertEqual(tracker.evictions['idle'], 0)
+        execute(tracker, '#1002', 1101, 'FETCH')
+        self.assertEqual(tracker.evictions, {'idle': 1, 'lru': 0})
+        self.assertEqual(list(tracker.latest_cursors), ['#1002'])
+        self.assertEqual([row[14] for row in tracker.db.batches], [1000])
+        # sql_id of the evicted cursor is remembered
+        self.assertIn('#1001', tracker.cursors)
+    def test_idle_order(self):
+        """Cursor without tim is never idle. Idle cursor is found even if it was used after the
+            busy one, by the line without tim."""
+        tracker = CallTracker(Backend(), idle_tim=100)
+        execute(tracker, '#1000', 0)
+        execute(tracker, '#1001', 1000)
+        execute(tracker, '#1002', 1050)
+        execute(tracker, '#1001', 0, 'FETCH')
+        execute(tracker, '#1003', 1101)
+        self.assertEqual(tracker.evictions, {'idle': 1, 'lru': 0})
+        self.assertEqual(sorted(tracker.latest_cursors), ['#1000', '#1002', '#1003'])
+        self.assertEqual([row[14] for row in tracker.db.batches], [1000, 0])
+    def test_max_sql_ids(self):
+        """sql_ids of the evicted cursors are forgotten over max_sql_ids"""
+        tracker = CallTracker(Backend(), max_cursors=1)
+        tracker.max_sql_ids = 2
+        for (idx, cursor) in enumerate(('#1001', '#1002', '#1003', '#1004')):
+            execute(tracker, cursor, 1000 + idx)
+        self.assertEqual(list(tracker.cursors), ['#1003', '#1004'])
+        self.assertEqual(tracker.evictions, {'idle': 0, 'lru': 3})
+    def test_limits_same_spans(self):
+        """Limits that are not hit don't change the output, tight limits keep all the rows"""
+        fname = 'tests/traces/mixed_execs.trc'
+        runs = []
+        for limits in ({}, {'max_cursors': 1000, 'idle_tim': 10**12}, {'max_cursors': 1},
+                       {'idle_tim': 1}):
+            tracker = CallTracker(Backend(), **limits)
+            trcparser.process_file(tracker, fname)
+            tracker.flush()
+            runs.append((tracker.db.batches, tracker.evictions))
+        self.assertEqual(spans(runs[1][0]), spans(runs[0][0]))
+        self.assertEqual(runs[1][1], {'idle': 0, 'lru': 0})
+        for (batches, evictions) in runs[2:]:
+            self.assertGreater(sum(evictions.values()), 0)
+            self.assertEqual(sorted(map(repr, (row[1:] for row in batches))),
+                             sorted(map(repr, (row[1:] for row in runs[0][0]))))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import glob
+import tempfile
+import unittest
+import pyarrow.parquet as pq
+from backend.arrow import Backend, ColumnarBackend, ColumnBuffer
+from call_tracker import CallTracker
+from columnar import Row, row_factory
+import trcparser
+from tests import test_constants
+
+def parquet_rows(db_dir) -> list:
+    tbl = pq.read_table(db_dir)
+    return sorted(zip(*[c.to_pylist() for c in tbl.columns]), key=repr)
+
+class TestColumnar(unittest.TestCase):
+    """Columnar engine should produce the same Parquet files as Ops."""
+    def test_row_factory(self):
+        fmeta = test_constants.FMETA
+        row = row_factory('WAIT', test_constants.CURSOR, b" nam='db file sequential read' ela= 403 "
+                          + b"file#=414 block#=2682927 blocks=1 obj#=89440 tim=5793512314261", fmeta,
+                          test_constants.TS_CALLBACK)
+        self.assertIsInstance(row, Row)
+        self.assertEqual(row.op_type, 'WAIT')
+        self.assertEqual(row.cursor, test_constants.CURSOR)
+        self.assertEqual((row['name'], row['e'], row['tim']),
+                         ('db file sequential read', 403, 5793512314261))
+        self.assertEqual(row['session'][0], 'trace.trc')
+
+        row = row_factory('PARSING IN CURSOR', test_constants.CURSOR, "len=80 dep=0 uid=331 "
+                          + "oct=3 lid=331 tim=7104844976089 hv=1167462720 ad='9d4125228' "
+                          + "sqlid='6v48b7j2tc4a0'", fmeta, test_constants.TS_CALLBACK)
+        self.assertEqual(row.op_type, 'PIC')
+        self.assertEqual(row.sqlid, '6v48b7j2tc4a0')
+        row.add_line(b'select 1 from dual\n')
+        self.assertEqual(row['raw'], 'select 1 from dual\n')
+
+        with self.assertRaises(ValueError):
+            row_factory('EXEC', test_constants.CURSOR, 'c=x,e=1', fmeta,
+                        test_constants.TS_CALLBACK)
+        with self.assertRaises(AttributeError):
+            row_factory('XXX', test_constants.CURSOR, '', fmeta, test_constants.TS_CALLBACK)
+
+    def test_same_as_ops(self):
+        for fname in sorted(glob.glob('tests/traces/*.trc*')):
+            with self.subTest(fname=fname), tempfile.TemporaryDirectory() as ops_dir, \
+                    tempfile.TemporaryDirectory() as col_dir:
+                tracker = CallTracker(Backend(ops_dir, 'unittest'))
+                try:
+                    expected = trcparser.process_file(tracker, fname)
+                except ValueError as ex:
+                    expected = repr(ex)
+                tracker.flush()
+
+                dbs = ColumnarBackend(col_dir, 'unittest')
+                # Small blocks, so that sealing is exercised
+                dbs._buffer = ColumnBuffer(7)
+                tracker = CallTracker(dbs, row_factory)
+                try:
+                    result = trcparser.process_file(tracker, fname)
+                except ValueError as ex:
+                    result = repr(ex)
+                tracker.flush()
+
+                self.assertEqual(result, expected)
+                self.assertEqual(parquet_rows(col_dir), parquet_rows(ops_dir))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,6 @@
 import unittest
 from current_statement import CurrentStatement
 from ops import ops_factory
-from tests.mock_backend import Backend
 from tests.test_constants import CURSOR, FMETA, TRACKED_OPS, UNTRACKED_OPS, WRONG_CURSOR
 
 class TestCurrentStatement(unittest.TestCase):
@@ -10,7 +9,6 @@ class TestCurrentStatement(unittest.TestCase):
         self.cstat = CurrentStatement(CURSOR, None)
     def test_to_list(self):
         """Check if to_list returns correct # of elements."""
-        self.cstat.dbs = Backend()
         for ops in TRACKED_OPS.values():
             self.cstat.add_ops(ops)
         out = self.cstat.to_list(1)
@@ -0,0 +1,83 @@
+import bz2
+import gzip
+import lzma
+import os
+import tempfile
+import unittest
+import zlib
+import decompress
+import trcparser
+from call_tracker import CallTracker
+from decompress import DecompressedFile
+from tests.mock_backend import Backend
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+TRACE = 'tests/traces/mixed_execs.trc'
+
+def members(data, compress, size=1000):
+    """Compresses data into independent members of size bytes"""
+    return b''.join(compress(data[i:i + size]) for i in range(0, len(data), size))
+
+class TestDecompress(unittest.TestCase):
+    def setUp(self):
+        with open(TRACE, 'rb') as fdesc:
+            self.data = fdesc.read()
+        self.lines = self.data.splitlines(keepends=True)
+        self.tmpdir = tempfile.TemporaryDirectory()
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    def check(self, name, content, fmt, segment_size=100, lines=None):
+        fname = os.path.join(self.tmpdir.name, name)
+        with open(fname, 'wb') as fdesc:
+            fdesc.write(content)
+        for threads in (1, 3):
+            with DecompressedFile(fname, 'rb', fmt, threads, segment_size) as trace:
+                self.assertEqual(list(trace), self.lines if lines is None else lines,
+                                 f'{name} {threads}')
+        return fname
+    def test_formats(self):
+        self.check('single.gz', gzip.compress(self.data), 'gzip')
+        self.check('multi.gz', members(self.data, gzip.compress) + b'\0' * 8, 'gzip')
+        self.check('single.bz2', bz2.compress(self.data), 'bzip2')
+        self.check('multi.bz2', members(self.data, bz2.compress), 'bzip2')
+        self.check('multi.xz', members(self.data, lzma.compress), 'xz')
+        self.check('legacy.lzma', lzma.compress(self.data, lzma.FORMAT_ALONE), 'lzma')
+        self.check('empty.gz', b'', 'gzip', lines=[])
+    @unittest.skipUnless(zstandard, 'zstandard is not installed')
+    def test_zstd(self):
+        cctx = zstandard.ZstdCompressor()
+        fname = self.check('multi.zst', members(self.data, cctx.compress), 'zstd')
+        self.assertEqual(trcparser.get_opener(fname).keywords['fmt'], 'zstd')
+        # Seekable zstd has the seek table in the skippable frame at the end
+        skippable = b'\x5e\x2a\x4d\x18' + (5).to_bytes(4, 'little') + b'\x00' * 5
+        self.check('seekable.zst', members(self.data, cctx.compress) + skippable, 'zstd')
+    def test_false_header(self):
+        """Member header in the compressed data, it is not the start of the member."""
+        stored = zlib.compressobj(0, zlib.DEFLATED, 31)
+        fake = self.data[:500] + b'\x1f\x8b\x08' * 100 + b'\n'
+        content = stored.compress(fake) + stored.flush() + members(self.data, gzip.compress)
+        for segment_size in (10, 400):
+            # 400: segment that starts at the false header covers the start of real members
+            self.check('fake.gz', content, 'gzip', segment_size,
+                       fake.splitlines(keepends=True) + self.lines)
+    def test_truncated(self):
+        fname = os.path.join(self.tmpdir.name, 'truncated.gz')
+        with open(fname, 'wb') as fdesc:
+            fdesc.write(gzip.compress(self.data)[:-100])
+        with self.assertRaises(EOFError):
+            with DecompressedFile(fname, 'rb', 'gzip') as trace:
+                list(trace)
+    def test_process_file(self):
+        """Parser gets the same lines from the segmented file"""
+        fname = self.check('multi.gz', members(self.data, gzip.compress), 'gzip')
+        for name in (TRACE, fname):
+            with self.subTest(name):
+                self.assertEqual(trcparser.process_file(CallTracker(Backend()), name),
+                                 (len(self.lines), 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+import duckdb
+import pyarrow.parquet as pq
+import trcparser
+from backend.arrow import INPROGRESS_DIR, Backend as ArrowBackend, WriterOptions
+from call_tracker import CallTracker
+from tests.mock_backend import Backend
+
+TRACE = 'tests/traces/mixed_execs.trc'
+
+def normalize(batches):
+    """Drops span id and file name, these differ between the runs"""
+    return sorted((b[1:18] + b[19:] for b in batches), key=str)
+
+class FlushCounter(Backend):
+    """Mock backend that counts the flushes"""
+    def __init__(self):
+        super().__init__()
+        self.flushes = 0
+    def flush(self):
+        self.flushes += 1
+
+def write_slowly(fname, lines, mode='ab', step=20, rotate=None):
+    """Appends lines to the file in small steps, last line in two pieces. If rotate is set,
+        moves the file away and starts writing rotate to the new file."""
+    with open(fname, mode) as fdesc:
+        for i in range(0, len(lines), step):
+            fdesc.writelines(lines[i:i + step - 1])
+            last = lines[i + step - 1:i + step]
+            if last:
+                fdesc.write(last[0][:3])
+                fdesc.flush()
+                time.sleep(0.01)
+                fdesc.write(last[0][3:])
+            fdesc.flush()
+            time.sleep(0.01)
+    if rotate:
+        os.rename(fname, fname + '.1')
+        time.sleep(0.1)
+        write_slowly(fname, rotate, 'wb', step)
+
+class TestFollow(unittest.TestCase):
+    def setUp(self):
+        with open(TRACE, 'rb') as fdesc:
+            self.lines = fdesc.readlines()
+        tracker = CallTracker(Backend())
+        trcparser.process_file(tracker, TRACE)
+        tracker.flush()
+        self.expected = normalize(tracker.db.batches)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmpdir.name, 'follow.trc')
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    def follow(self, writer, **kwargs):
+        tracker = CallTracker(FlushCounter())
+        writer.start()
+        (lines, errors) = trcparser.follow_file(tracker, self.fname, poll_interval=0.01,
+                                                idle_timeout=0.5, **kwargs)
+        writer.join()
+        tracker.flush()
+        return (tracker.db, lines, errors)
+    def test_growing_file(self):
+        writer = threading.Thread(target=write_slowly, args=(self.fname, self.lines))
+        (db, lines, errors) = self.follow(writer, flush_lines=50)
+        self.assertEqual(lines, len(self.lines))
+        self.assertEqual(errors, 0)
+        self.assertEqual(normalize(db.batches), self.expected)
+        self.assertGreaterEqual(db.flushes, len(self.lines)//50)
+    def test_flush_interval(self):
+        writer = threading.Thread(target=write_slowly, args=(self.fname, self.lines))
+        (db, _, _) = self.follow(writer, flush_interval=0.05)
+        self.assertGreater(db.flushes, 2)
+    def test_rotation(self):
+        writer = threading.Thread(target=write_slowly, args=(self.fname, self.lines),
+                                  kwargs={'rotate': self.lines})
+        (db, lines, _) = self.follow(writer)
+        self.assertEqual(lines, 2*len(self.lines))
+        self.assertEqual(normalize(db.batches), sorted(self.expected*2, key=str))
+    def test_truncation(self):
+        with open(self.fname, 'wb') as fdesc:
+            fdesc.writelines(self.lines)
+        def truncate():
+            time.sleep(0.2)
+            write_slowly(self.fname, self.lines, 'wb')
+        (db, lines, _) = self.follow(threading.Thread(target=truncate))
+        self.assertEqual(lines, 2*len(self.lines))
+        self.assertEqual(normalize(db.batches), sorted(self.expected*2, key=str))
+    def parquet_files(self, file_age):
+        """Follows the growing file into Parquet, returns the rows of every file"""
+        with tempfile.TemporaryDirectory() as db_dir:
+            tracker = CallTracker(ArrowBackend(db_dir, 'follow',
+                                               options=WriterOptions(file_age=file_age)))
+            writer = threading.Thread(target=write_slowly, args=(self.fname, self.lines))
+            writer.start()
+            trcparser.follow_file(tracker, self.fname, flush_lines=20, poll_interval=0.01,
+                                  idle_timeout=0.5)
+            writer.join()
+            tracker.flush()
+            return [pq.ParquetFile(os.path.join(db_dir, name)).metadata
+                    for name in sorted(os.listdir(db_dir)) if name.startswith('follow.')]
+    def test_parquet_row_groups(self):
+        """Flushes are row groups of the open file, not files of their own"""
+        files = self.parquet_files(60)
+        self.assertEqual(len(files), 1)
+        self.assertGreater(files[0].num_row_groups, 2)
+        # Schema version record
+        self.assertEqual(files[0].num_rows, len(self.expected) + 1)
+    def test_parquet_roll_interval(self):
+        """Files are closed when they get older than file_age"""
+        files = self.parquet_files(0.05)
+        self.assertGreater(len(files), 1)
+        self.assertEqual(sum(f.num_rows for f in files), len(self.expected) + len(files))
+    def test_parquet_open_file(self):
+        """Open file is out of the reach of readers until it is closed"""
+        with tempfile.TemporaryDirectory() as db_dir:
+            done = CallTracker(ArrowBackend(db_dir, 'done'))
+            trcparser.process_file(done, TRACE)
+            done.flush()
+            count = f"select count(*) from read_parquet('{db_dir}/*')"
+            (rows,) = duckdb.sql(count).fetchone()
+            inprogress = os.path.join(db_dir, INPROGRESS_DIR)
+            during = []
+            def write_and_read():
+                write_slowly(self.fname, self.lines)
+                for _ in range(100):
+                    if os.listdir(inprogress):
+                        break
+                    time.sleep(0.01)
+                during.append((os.listdir(inprogress), duckdb.sql(count).fetchone()[0]))
+            tracker = CallTracker(ArrowBackend(db_dir, 'follow',
+                                               options=WriterOptions(file_age=60)))
+            writer = threading.Thread(target=write_and_read)
+            writer.start()
+            trcparser.follow_file(tracker, self.fname, flush_lines=20, poll_interval=0.01,
+                                  idle_timeout=1)
+            writer.join()
+            tracker.flush()
+            self.assertEqual(during, [(['follow.0'], rows)])
+            self.assertEqual(os.listdir(inprogress), [])
+            self.assertEqual(duckdb.sql(count).fetchone()[0], 2*rows)
@@ -0,0 +1,70 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+import duckdb as d
+import instrumentation
+import trc2db
+from tests.test_trc2db import DummyArgs
+
+TRACES = ('tests/traces/two_statements_one_cursor.trc.gz', 'tests/traces/mixed_execs.trc')
+
+class TestInstrumentation(unittest.TestCase):
+    """--profile report"""
+    def test_nested(self):
+        """Nested stages are subtracted"""
+        profiler = instrumentation.Profiler()
+        inner = profiler.timed('backend', lambda: time.sleep(0.02))
+        outer = profiler.timed('tracker', lambda: (time.sleep(0.01), inner()))
+        outer()
+        entry = profiler.take('x', 0, 0, 0, 50_000_000)
+        self.assertGreaterEqual(entry['stages_s']['backend'], 0.02)
+        self.assertLess(entry['stages_s']['tracker'], 0.02)
+        self.assertGreaterEqual(entry['stages_s']['tracker'], 0.01)
+        self.assertAlmostEqual(sum(entry['stages_s'].values()), 0.05, places=3)
+        self.assertEqual(profiler.stages, {})
+    def test_report(self):
+        for (engine, jobs, depth) in (('ops', 1, 0), ('columnar', 2, 0), ('ops', 1, 2)):
+            with self.subTest(engine=engine, jobs=jobs, depth=depth), \
+                    tempfile.TemporaryDirectory() as tmpdir:
+                report = os.path.join(tmpdir, 'profile.json')
+                args = DummyArgs(dbdir=os.path.join(tmpdir, 'out'), trace_files=TRACES,
+                                 engine=engine, jobs=jobs, profile=report, pipeline_depth=depth)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    trc2db.process_files(args)
+                with open(report, encoding='utf-8') as fdesc:
+                    out = json.load(fdesc)
+                self.assertEqual(out['version'], instrumentation.REPORT_VERSION)
+                self.assertEqual(out['settings']['engine'], engine)
+                self.assertEqual(sorted(f['file'] for f in out['files']), sorted(TRACES))
+                total = out['total']
+                self.assertEqual(total['bytes'], sum(os.path.getsize(f) for f in TRACES))
+                self.assertEqual(total['lines'], sum(f['lines'] for f in out['files']))
+                self.assertEqual(list(total['stages_s']), list(instrumentation.STAGES))
+                gzipped = [f for f in out['files'] if f['file'].endswith('.gz')][0]
+                self.assertGreater(gzipped['background_s']['decompress'], 0)
+                self.assertGreater(total['stages_s']['tokenize'], 0)
+                self.assertGreater(total['background_s']['parquet_write'], 0)
+                self.assertEqual(total['background_s']['encode'] > 0, depth > 0)
+                # Records per type are the rows in the Parquet files
+                rows = dict(d.sql(f"select ops, count(*) from read_parquet('{args.dbdir}/*') "
+                                  + "where event_name is distinct from 'PARQUET_SCHEMA' "
+                                  + "group by ops").fetchall())
+                counts = total['counts']
+                self.assertEqual(counts.get('EXEC'), rows['EXEC'])
+                self.assertEqual(counts.get('WAIT'), rows['WAIT'])
+                self.assertEqual(sum(counts.values()), sum(rows.values()))
+    def test_stdout(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            args = DummyArgs(dbdir=tmpdir, trace_files=TRACES[1:], profile='-')
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                trc2db.process_files(args)
+        report = json.loads(out.getvalue()[out.getvalue().index('\n{') + 1:])
+        self.assertEqual(report['total']['lines'], report['files'][0]['lines'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import duckdb as d
+import trc2db
+import trcsplit
+from manifest import Manifest, MANIFEST_DIR
+from spans import SPANS_DIR
+from tests.test_trc2db import DummyArgs
+
+TRACE = 'tests/traces/mixed_execs.trc'
+
+class TestManifest(unittest.TestCase):
+    """Reruns with the ingestion manifest"""
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dbdir = os.path.join(self.tmpdir.name, 'out')
+        self.fname = os.path.join(self.tmpdir.name, 'trace.trc')
+        with open(TRACE, 'rb') as fdesc:
+            self.data = fdesc.read()
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    def run_trc2db(self, **kwargs):
+        args = DummyArgs(dbdir=self.dbdir, manifest=True, trace_files=[self.fname], **kwargs)
+        trc2db.process_files(args)
+    def rows(self, where="event_name is distinct from 'PARQUET_SCHEMA'"):
+        res = d.sql(f"select count(*), count(distinct span_id) from read_parquet('{self.dbdir}/*') "
+                    +f"where {where};")
+        return res.fetchone()
+    def manifest(self):
+        with open(f'{self.dbdir}/{MANIFEST_DIR}/unittest.json', encoding='utf-8') as fdesc:
+            return json.load(fdesc)
+    def test_skip_unchanged(self):
+        shutil.copy(TRACE, self.fname)
+        self.run_trc2db()
+        expected = self.rows()
+        entry = self.manifest()['files'][os.path.abspath(self.fname)]
+        # Committed at the last "=====" line, the rest is the tail
+        edge = self.data.rindex(b'\n=====================') + 1
+        self.assertEqual((entry['size'], entry['offset']), (len(self.data), edge))
+        self.assertEqual(entry['line'], self.data[:edge].count(b'\n'))
+        self.run_trc2db()
+        self.run_trc2db(jobs=2)
+        self.assertEqual(self.rows(), expected)
+        self.assertEqual(self.manifest()['pending'], [])
+    def test_appended_tail(self):
+        """File that grows is processed in pieces, result is the same as in one go."""
+        shutil.copy(TRACE, self.fname)
+        self.run_trc2db()
+        expected = self.rows()
+        # Wall clock depends on the order of span dumps, it is left out like in test_trcsplit
+        query = (f"select line, ops, sql_id, elapsed_time from read_parquet('{self.dbdir}/*') "
+                 +"where line is not null order by line")
+        expected_rows = d.sql(query).fetchall()
+        shutil.rmtree(self.dbdir)
+
+        # Cut at the "=====" line, and in the middle of the line after that
+        cut = self.data.index(b'\n=====================', len(self.data)//2) + 1
+        with open(self.fname, 'wb') as fdesc:
+            fdesc.write(self.data[:cut + 30])
+        self.run_trc2db()
+        self.assertEqual(self.manifest()['files'][os.path.abspath(self.fname)]['offset'], cut)
+        with open(self.fname, 'ab') as fdesc:
+            fdesc.write(self.data[cut + 30:])
+        self.run_trc2db(split_size=1)
+        self.assertEqual(self.rows(), expected)
+        # sql_id's continue from the resume point
+        self.assertEqual(d.sql(query).fetchall(), expected_rows)
+    def spans(self):
+        """Content of every span, wall clock left out"""
+        query = (f"select string_agg(concat_ws('|', line, ops, sql_id, elapsed_time, event_raw), "
+                 +f"'\\n' order by line) as span from read_parquet('{self.dbdir}/*') "
+                 +"where line is not null group by span_id order by span")
+        return d.sql(query).fetchall()
+    def test_cut_inside_span(self):
+        """File cut inside the span, in the PARSING IN CURSOR or in the BINDS is processed in
+            two runs like in one"""
+        for (trace, line) in ((TRACE, 40), (TRACE, 25), (TRACE, 74),
+                              ('tests/traces/simple_trace_2x.trc', 27)):
+            with self.subTest(f'{trace}:{line}'):
+                shutil.rmtree(self.dbdir, ignore_errors=True)
+                shutil.copy(trace, self.fname)
+                self.run_trc2db()
+                expected = (self.rows(), self.spans())
+                shutil.rmtree(self.dbdir)
+                with open(trace, 'rb') as fdesc:
+                    lines = fdesc.readlines()
+                with open(self.fname, 'wb') as fdesc:
+                    fdesc.writelines(lines[:line])
+                self.run_trc2db()
+                with open(self.fname, 'ab') as fdesc:
+                    fdesc.writelines(lines[line:])
+                self.run_trc2db()
+                self.assertEqual((self.rows(), self.spans()), expected)
+    def test_replaced_file(self):
+        """Rows of the replaced file are replaced too"""
+        shutil.copy(TRACE, self.fname)
+        self.run_trc2db()
+        shutil.copy('tests/traces/lobs.trc', self.fname)
+        self.run_trc2db()
+        replaced = self.rows()
+        shutil.rmtree(self.dbdir)
+        self.run_trc2db()
+        self.assertEqual(replaced, self.rows())
+    def test_changed_compressed(self):
+        """Compressed file that has grown is processed from the start, without the rows of the
+            earlier run"""
+        gzipped = 'tests/traces/two_statements_one_cursor.trc.gz'
+        shutil.copy(gzipped, self.fname)
+        self.run_trc2db()
+        (rows, spans) = self.rows()
+        with open(self.fname, 'ab') as fdesc, open(gzipped, 'rb') as member:
+            fdesc.write(member.read())
+        self.run_trc2db()
+        self.assertEqual(self.rows(), (2 * rows, 2 * spans))
+    def test_planned_size(self):
+        """File that grows while it is processed is committed with the size it was planned
+            with, the rest is picked up by the next run."""
+        shutil.copy('tests/traces/two_statements_one_cursor.trc.gz', self.fname)
+        size = os.path.getsize(self.fname)
+        process_one = trc2db.process_one
+        def grow(*args):
+            out = process_one(*args)
+            with open(self.fname, 'ab') as fdesc, \
+                    open('tests/traces/two_statements_one_cursor.trc.gz', 'rb') as member:
+                fdesc.write(member.read())
+            return out
+        with mock.patch.object(trc2db, 'process_one', grow):
+            self.run_trc2db()
+        entry = self.manifest()['files'][os.path.abspath(self.fname)]
+        self.assertEqual((entry['size'], entry['offset']), (size, size))
+    def test_chunk_commits(self):
+        """Chunks are committed as they are done, crashed run is resumed from the last
+            committed chunk"""
+        shutil.copy(TRACE, self.fname)
+        self.run_trc2db()
+        expected = self.rows()
+        shutil.rmtree(self.dbdir)
+        process_one = trc2db.process_one
+        def crash(args, fname, worker_id, chunk=None):
+            if worker_id == 2:
+                raise KeyboardInterrupt()
+            return process_one(args, fname, worker_id, chunk)
+        with mock.patch.object(trc2db, 'COMMIT_SIZE', 1), \
+                mock.patch.object(trc2db, 'process_one', crash), \
+                self.assertRaises(KeyboardInterrupt):
+            self.run_trc2db()
+        chunks = trcsplit.plan_chunks(self.fname, 1)
+        entry = self.manifest()['files'][os.path.abspath(self.fname)]
+        self.assertEqual((entry['offset'], entry['slots']), (chunks[2].start, [0, 1]))
+        self.assertEqual(self.manifest()['pending'], list(range(2, len(chunks))))
+        with mock.patch.object(trc2db, 'COMMIT_SIZE', 1):
+            self.run_trc2db()
+        self.assertEqual(self.rows(), expected)
+        self.assertTrue(os.path.exists(f'{self.dbdir}/unittest.0.0'))
+        self.assertEqual(self.manifest()['pending'], [])
+    def test_interrupted_run(self):
+        """Output of the slots that were not committed is removed."""
+        shutil.copy(TRACE, self.fname)
+        self.run_trc2db()
+        expected = self.rows()
+        manifest = Manifest(trc2db.get_manifest(DummyArgs(dbdir=self.dbdir, manifest=True)).fs,
+                            self.dbdir, 'unittest')
+        slot = manifest.reserve(1)
+        shutil.copy(f'{self.dbdir}/unittest.0.0', f'{self.dbdir}/unittest.{slot}.0')
+        shutil.copy(f'{self.dbdir}/{SPANS_DIR}/unittest.0.0',
+                    f'{self.dbdir}/{SPANS_DIR}/unittest.{slot}.0')
+        self.assertGreater(self.rows()[0], expected[0])
+        self.run_trc2db()
+        self.assertEqual(self.rows(), expected)
+        self.assertFalse(os.path.exists(f'{self.dbdir}/unittest.{slot}.0'))
+        self.assertFalse(os.path.exists(f'{self.dbdir}/{SPANS_DIR}/unittest.{slot}.0'))
+    def test_interrupted_partitions(self):
+        """Output of the pending slots is removed from the partitioned layout, too"""
+        shutil.copy(TRACE, self.fname)
+        self.run_trc2db(partition_by='date,hour')
+        manifest = Manifest(trc2db.get_manifest(DummyArgs(dbdir=self.dbdir, manifest=True)).fs,
+                            self.dbdir, 'unittest')
+        slot = manifest.reserve(1)
+        copies = []
+        for fname in glob.glob(f'{self.dbdir}/**/unittest.0.0', recursive=True):
+            copies.append(f'{os.path.dirname(fname)}/unittest.{slot}.0')
+            shutil.copy(fname, copies[-1])
+        # Raw file, span summary and histograms
+        self.assertEqual(len(copies), 3)
+        self.run_trc2db(partition_by='date,hour')
+        for fname in copies:
+            self.assertFalse(os.path.exists(fname))
+        self.assertTrue(glob.glob(f'{self.dbdir}/date=*/hour=*/unittest.0.0'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
-import datetime
 import unittest
 from backend import arrow
+from ops import ops_factory
 from tests import test_constants
+from time_tracker import from_us
 
 class TestOps(unittest.TestCase):
     def test_init(self):
@@ -49,9 +50,10 @@ class TestOps(unittest.TestCase):
 
     def test_astuple(self):
         sql_id = 'abc123'
-        ops = test_constants.TRACKED_OPS['EXEC']
-        today = datetime.datetime.now()
-        ops.ts_callback = lambda x: today
+        fmeta = test_constants.FMETA
+        # Wall clock is taken when the ops is created, from the tim
+        ops = ops_factory('EXEC', test_constants.CURSOR, 'c=1,e=2,p=3,cr=4,cu=5,mis=0,r=6,dep=0,'
+                          + 'og=1,plh=7,tim=5793512315335', fmeta, lambda tim: tim + 1)
         lst = ops.astuple(0, sql_id)
         self.assertEqual(len(lst), len(arrow.PARQUET_SCHEMA))
         self.assertEqual(lst[0], 0)
@@ -74,8 +76,8 @@ class TestOps(unittest.TestCase):
         self.assertEqual(lst[17], '')
         self.assertEqual(lst[18], test_constants.FMETA['FILE_NAME'])
         self.assertEqual(lst[19], test_constants.FMETA['LINE_COUNT'])
-        # ts2
-        self.assertEqual(lst[20], today)
+        # ts
+        self.assertEqual(lst[20], 5793512315336)
 
     def test_str(self):
         ops = test_constants.TRACKED_OPS['WAIT']
@@ -112,11 +114,10 @@ class TestOps(unittest.TestCase):
         self.assertEqual(ops.r, d['r'])
 
         ops = test_constants.TRACKED_OPS['PIC']
-        ops.dbop.ts = None
         d = ops.to_dict(span_id, test_constants.CURSOR)
         self.assertEqual('PARSING IN CURSOR', d['op_type'])
-        # If ts is not set, to_dict generates it from the callback
-        self.assertIsNotNone(d['ts'])
+        # ts is datetime in the dict
+        self.assertEqual(d['ts'], from_us(test_constants.TS_CALLBACK(ops.tim)))
 
 if __name__ == '__main__':
     unittest.main()
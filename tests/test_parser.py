@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 import trcparser
 from call_tracker import CallTracker
@@ -183,11 +185,50 @@ class TestParser(unittest.TestCase):
         with self.assertRaises(ValueError):
             trcparser.init_fmeta('')
 
+    def test_mapped_file(self):
+        fname = 'tests/traces/simple_trace.trc'
+        self.assertIs(trcparser.get_opener(fname), trcparser.MappedFile)
+        self.assertIsNot(trcparser.get_opener('tests/traces/two_statements_one_cursor.trc.gz'),
+                         trcparser.MappedFile)
+        with open(fname, 'rb') as fdesc:
+            lines = fdesc.readlines()
+        with trcparser.MappedFile(fname) as trace:
+            self.assertEqual(list(trace), lines)
+        start = len(lines[0]) + len(lines[1])
+        end = start + len(lines[2]) + 1
+        with trcparser.MappedFile(fname, 'rb', start, end) as trace:
+            self.assertEqual(list(trace), lines[2:4])
+        with self.assertRaises(ValueError):
+            trcparser.MappedFile(fname, 'rt')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            empty = os.path.join(tmpdir, 'empty.trc')
+            open(empty, 'wb').close()
+            with trcparser.MappedFile(empty) as trace:
+                self.assertEqual(list(trace), [])
+            self.assertEqual(trcparser.process_file(self.tracker, empty), (0, 0))
+
     def test_malformed_stat(self):
         '''Test that we survive malformed exec'''
         (lines, err) = trcparser.process_file(self.tracker, 'tests/traces/malformed_stat.trc')
         self.assertEqual(lines, 36)
         self.assertEqual(err, 1)
+    def test_invalid_utf8(self):
+        '''Invalid UTF-8 in bind value is replaced, CRLF line endings are translated'''
+        with open('tests/traces/simple_trace.trc', 'rb') as fdesc:
+            trace = fdesc.read().replace(b'value=111242892', b'value=\xff\xfe111')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for (name, content) in (('utf8.trc', trace), ('crlf.trc', trace.replace(b'\n', b'\r\n'))):
+                fname = os.path.join(tmpdir, name)
+                with open(fname, 'wb') as fdesc:
+                    fdesc.write(content)
+                tracker = CallTracker(Backend())
+                (lines, err) = trcparser.process_file(tracker, fname)
+                tracker.flush()
+                self.assertEqual((lines, err), (51, 0))
+                binds = [b for b in tracker.db.batches if b[3] == 'BINDS']
+                self.assertEqual(len(binds), 1)
+                self.assertIn('value=\ufffd\ufffd111\n', binds[0][17])
+                self.assertNotIn('\r', ''.join(b[17] for b in tracker.db.batches if b[17]))
 
 if __name__ == '__main__':
     unittest.main()
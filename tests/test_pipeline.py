@@ -0,0 +1,67 @@
+import contextlib
+import glob
+import io
+import tempfile
+import threading
+import unittest
+from backend.arrow import Backend
+from call_tracker import CallTracker
+import pipeline
+import trc2db
+import trcparser
+from tests.test_trc2db import DummyArgs
+from tests.test_columnar import parquet_rows
+
+class TestPipeline(unittest.TestCase):
+    """Encoder stage between CallTracker and the backend"""
+    def test_backpressure(self):
+        """Producer waits when the queue is full"""
+        release = threading.Event()
+        done = []
+        stage = pipeline.Stage('test', lambda item: (release.wait(), done.append(item)), 2)
+        threading.Timer(0.05, release.set).start()
+        # Stage is stuck on the first item, the rest fill the queue
+        for item in range(4):
+            stage.put(item)
+        stage.drain()
+        self.assertEqual(done, [0, 1, 2, 3])
+        stats = stage.stats()
+        self.assertEqual(stats['items'], 4)
+        self.assertEqual(stats['max_depth'], 2)
+        self.assertGreater(stats['stall_s'], 0.02)
+        self.assertIsNone(stage.thread)
+    def test_error(self):
+        """Exception in the stage is raised in the producer"""
+        stage = pipeline.Stage('test', lambda item: 1 / item)
+        stage.put(0)
+        with self.assertRaises(RuntimeError):
+            stage.drain()
+        # Stage can be used again
+        stage.put(1)
+        stage.drain()
+    def test_same_output(self):
+        """Pipelined output is the same as the sequential one"""
+        traces = sorted(glob.glob('tests/traces/*.trc')) + ['tests/traces/mixed_execs.trc.bz2']
+        rows = []
+        for depth in (0, 2):
+            with self.subTest(depth=depth), tempfile.TemporaryDirectory() as db_dir:
+                args = DummyArgs(dbdir=db_dir, trace_files=traces, pipeline_depth=depth)
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    trc2db.process_files(args)
+                rows.append(parquet_rows(db_dir))
+                self.assertEqual('Pipeline: encoder queue max' in out.getvalue(), depth > 0)
+        self.assertEqual(rows[1], rows[0])
+        # One span per batch
+        with tempfile.TemporaryDirectory() as db_dir:
+            db = pipeline.PipelinedBackend(Backend(db_dir, 'unittest'), 1, 1)
+            tracker = CallTracker(db)
+            with contextlib.redirect_stdout(io.StringIO()):
+                for fname in traces:
+                    trcparser.process_file(tracker, fname)
+            tracker.flush()
+            self.assertGreater(db.stage.stats()['items'], 100)
+            self.assertEqual(parquet_rows(db_dir), rows[0])
+
+if __name__ == '__main__':
+    unittest.main()
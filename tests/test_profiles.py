@@ -0,0 +1,74 @@
+import tempfile
+import unittest
+import pyarrow.parquet as pq
+from backend.arrow import ColumnarBackend
+from call_tracker import CallTracker
+from columnar import row_factory
+from profiles import get_profile
+import trcparser
+from tests.mock_backend import Backend
+
+TRACE = 'tests/traces/two_statements_one_cursor.trc'
+(OP_TYPE, RAW, LINE) = (3, 17, 19)
+
+def run(profile=None, fname=TRACE) -> list:
+    tracker = CallTracker(Backend()) if profile is None else CallTracker(Backend(), profile=profile)
+    trcparser.process_file(tracker, fname)
+    tracker.flush()
+    return tracker.db.batches
+
+def lines(batches, op_type) -> list:
+    return [row[LINE] for row in batches if row[OP_TYPE] == op_type]
+
+class TestProfiles(unittest.TestCase):
+    """Ingest profiles"""
+    def test_full(self):
+        self.assertEqual(run(get_profile('full')), run())
+    def test_latency(self):
+        full = run()
+        batches = run(get_profile('latency'))
+        self.assertEqual(lines(batches, 'BINDS'), [])
+        self.assertEqual(lines(batches, 'STAT'), [])
+        self.assertGreater(len(lines(full, 'STAT')), 0)
+        self.assertTrue(all(row[RAW] == '' for row in batches if row[OP_TYPE] == 'WAIT'))
+        # Rest is the same
+        for op_type in ('PIC', 'EXEC', 'FETCH', 'WAIT', 'CLOSE'):
+            self.assertEqual(lines(batches, op_type), lines(full, op_type))
+        self.assertEqual([row[RAW] for row in batches if row[OP_TYPE] == 'PIC'],
+                         [row[RAW] for row in full if row[OP_TYPE] == 'PIC'])
+    def test_plans(self):
+        full = run()
+        batches = run(get_profile('plans'))
+        self.assertEqual(lines(batches, 'BINDS'), [])
+        self.assertEqual(lines(batches, 'STAT'), lines(full, 'STAT'))
+    def test_bind_sample(self):
+        full = lines(run(fname='tests/traces/mixed_execs.trc'), 'BINDS')
+        self.assertEqual(len(full), 4)
+        for (name, sample, expected) in (('latency', 1.0, full), ('full', 0.0, [])):
+            with self.subTest(name=name, sample=sample):
+                batches = run(get_profile(name, sample), 'tests/traces/mixed_execs.trc')
+                self.assertEqual(lines(batches, 'BINDS'), expected)
+        profile = get_profile('latency', 0.5)
+        sampled = lines(run(profile, 'tests/traces/mixed_execs.trc'), 'BINDS')
+        self.assertEqual(sampled, [line for line in full
+                                   if profile.captured('BINDS', 'tests/traces/mixed_execs.trc', line)])
+        self.assertEqual(lines(run(profile, 'tests/traces/mixed_execs.trc'), 'BINDS'), sampled)
+        with self.assertRaises(ValueError):
+            get_profile('latency', 1.5)
+        with self.assertRaises(ValueError):
+            get_profile('nosuchprofile')
+    def test_columnar(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tracker = CallTracker(ColumnarBackend(tmpdir, 'profile'), row_factory,
+                                  get_profile('latency'))
+            trcparser.process_file(tracker, TRACE)
+            tracker.flush()
+            tbl = pq.read_table(tmpdir).to_pydict()
+        self.assertNotIn('BINDS', tbl['ops'])
+        self.assertNotIn('STAT', tbl['ops'])
+        waits = [raw for (ops, raw) in zip(tbl['ops'], tbl['event_raw']) if ops == 'WAIT']
+        self.assertGreater(len(waits), 0)
+        self.assertTrue(all(not raw for raw in waits))
+
+if __name__ == '__main__':
+    unittest.main()
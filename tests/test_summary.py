@@ -1,6 +1,21 @@
+import contextlib
+import io
+import glob
+import os
+import re
+import tempfile
 import unittest
+from unittest import mock
 import datetime
+import duckdb as d
+import pyarrow as pa
+import pyarrow.parquet as pq
 import summary
+import trc2db
+import histograms
+from backend.arrow import PARQUET_SCHEMA
+from spans import SPANS_DIR, wait_class
+from tests.test_trc2db import DummyArgs
 
 class TestSummary(unittest.TestCase):
     def test_create_preds(self):
@@ -33,5 +48,155 @@ class TestSummary(unittest.TestCase):
 
         preds = summary.thresold2pred('')
         self.assertEqual(preds, '')
+    def test_spans(self):
+        """Elapsed times from the span summaries are the same as from the raw ops"""
+        traces = sorted(glob.glob('tests/traces/*.trc')) + ['tests/traces/mixed_execs.trc.bz2']
+        query = "select sql_id, span_id, ela, ts from v_elapsed_time order by span_id"
+        with tempfile.TemporaryDirectory() as db_dir:
+            args = DummyArgs(dbdir=db_dir, trace_files=traces, jobs=2)
+            with contextlib.redirect_stdout(io.StringIO()):
+                trc2db.process_files(args)
+            spans = summary.spans_path(db_dir)
+            self.assertEqual(spans, f'{db_dir}/{SPANS_DIR}/*')
+            for remove_idle in (True, False):
+                summary.SummaryDuckdb(f'{db_dir}/*', 'simple', 10, remove_idle)
+                expected = d.sql(query).fetchall()
+                summary.SummaryDuckdb(f'{db_dir}/*', 'simple', 10, remove_idle, spans)
+                self.assertEqual(d.sql(query).fetchall(), expected)
+            self.assertGreater(len(expected), 40)
+            # Waits by class add up to the waits of the span
+            res = d.sql(f"""select sum(elapsed_time) from read_parquet('{db_dir}/*')
+                            where ops = 'WAIT' group by span_id order by span_id""").fetchall()
+            cols = ' + '.join(c for c in d.sql(f"select * from read_parquet('{spans}')").columns
+                              if c.startswith('wait_'))
+            res2 = d.sql(f"""select {cols} from read_parquet('{spans}')
+                            where {cols} > 0 order by span_id""").fetchall()
+            self.assertEqual(res2, res)
+            # Raw file without the summary
+            os.remove(glob.glob(f'{db_dir}/{SPANS_DIR}/*')[0])
+            self.assertIsNone(summary.spans_path(db_dir))
+    def test_schema_versions(self):
+        """Files of the schema 0.4, with plain strings and 64 bit integers, are read with the
+            newer ones"""
+        old = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_dictionary(f.type)
+                         else pa.field(f.name, pa.uint64()) if f.name in ('line', 'plh', 'hv')
+                         else f for f in PARQUET_SCHEMA])
+        traces = sorted(glob.glob('tests/traces/*.trc'))
+        with tempfile.TemporaryDirectory() as db_dir:
+            args = DummyArgs(dbdir=db_dir, trace_files=traces, jobs=2)
+            with contextlib.redirect_stdout(io.StringIO()):
+                trc2db.process_files(args)
+            def report():
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    smry = summary.SummaryDuckdb(f'{db_dir}/*', 'simple', 10, True)
+                    smry.summary({})
+                    smry.summary({'client_id': 'superdry'})
+                return out.getvalue()
+            expected = report()
+            files = sorted(glob.glob(f'{db_dir}/*.*'))
+            self.assertGreater(len(files), 1)
+            pq.write_table(pq.read_table(files[0]).cast(old), files[0])
+            self.assertEqual(pq.read_schema(files[0]).field('sql_id').type, pa.string())
+            self.assertEqual(report(), expected)
+    def test_partitions(self):
+        """Partitioned layout gives the same summaries as the flat one, filters prune the
+            partitions"""
+        traces = sorted(glob.glob('tests/traces/*.trc'))
+        filters = ({}, {'start': '2023-05-19T03:00', 'end': '2023-05-19T04:00'},
+                   {'start': '2024-01-01'}, {'client_id': 'superdry'})
+        with tempfile.TemporaryDirectory() as db_dir:
+            reports = []
+            for (dbdir, partition_by) in ((f'{db_dir}/flat', ''), (f'{db_dir}/hive', 'date,hour')):
+                args = DummyArgs(dbdir=dbdir, trace_files=traces, jobs=2, partition_by=partition_by)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    trc2db.process_files(args)
+                partitions = summary.partition_columns(dbdir)
+                smry = summary.SummaryDuckdb(summary.layout_glob(dbdir, partitions), 'simple', 30,
+                                             True, summary.spans_path(dbdir, partitions),
+                                             summary.histograms_path(dbdir, partitions),
+                                             partitions)
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out):
+                    for fis in filters:
+                        smry.summary(fis)
+                        smry.waits(fis, None)
+                # Order and row numbers of the ties are not defined
+                reports.append(sorted(line.split()[1:] for line in out.getvalue().splitlines()))
+            self.assertEqual(partitions, ['date', 'hour'])
+            self.assertEqual(reports[0], reports[1])
+            preds = summary.create_preds(filters[1], partitions)
+            plan = d.sql(f"""explain analyze select count(*) from v_elapsed_time
+                             where {preds}""").fetchall()[0][1]
+            (scanned, total) = re.search(r'Scanning Files: (\d+)/(\d+)', plan).groups()
+            self.assertLess(int(scanned), int(total))
+    def test_histograms(self):
+        """Counts, sums and max from the histograms are the same as from the raw ops,
+            percentiles are within the precision"""
+        traces = sorted(glob.glob('tests/traces/*.trc')) + ['tests/traces/mixed_execs.trc.bz2']
+        with tempfile.TemporaryDirectory() as db_dir:
+            args = DummyArgs(dbdir=db_dir, trace_files=traces, jobs=2, histogram_digits=3)
+            with contextlib.redirect_stdout(io.StringIO()):
+                trc2db.process_files(args)
+            hists = summary.histograms_path(db_dir)
+            self.assertIsNotNone(hists)
+            summ = summary.SummaryDuckdb(f'{db_dir}/*', 'simple', 100, True, None, hists)
+            expected = {row[0]: row[1:] for row in d.sql(
+                """select sql_id, count(*), sum(ela), max(ela),
+                       percentile_disc(0.5) within group (order by ela)
+                   from v_elapsed_time group by sql_id""").fetchall()}
+            merged = summ.merge_histograms('sql_id')
+            self.assertEqual(set(merged), set(expected))
+            for (sql_id, (count, total, top, hist)) in merged.items():
+                self.assertEqual((count, total, top), expected[sql_id][:3])
+                median = hist.get_value_at_percentile(50)
+                self.assertLessEqual(abs(median - expected[sql_id][3]), max(1, median / 100))
+            rows = summ.summary_histograms()
+            self.assertEqual(rows[0][3], max(e[0] for e in expected.values()))
+            waits = dict(d.sql(f"""select event_name, count(*) from read_parquet('{db_dir}/*')
+                                   where ops = 'WAIT' group by event_name""").fetchall())
+            self.assertEqual({k: v[0] for (k, v) in summ.merge_histograms('wait').items()}, waits)
+    def test_long_spans(self):
+        """Percentiles of the spans over 1000 seconds match the exact ones, also when the spans
+            are over the range of the histogram"""
+        traces = sorted(glob.glob('tests/traces/*.trc'))
+        for highest in (histograms.HIGHEST, 1000000):
+            with self.subTest(highest=highest), tempfile.TemporaryDirectory() as db_dir, \
+                    mock.patch.object(histograms, 'HIGHEST', highest):
+                args = DummyArgs(dbdir=db_dir, trace_files=traces)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    trc2db.process_files(args)
+                summ = summary.SummaryDuckdb(f'{db_dir}/*', 'simple', 100, True,
+                                             summary.spans_path(db_dir),
+                                             summary.histograms_path(db_dir))
+                # Both NULL and '' are shown as NULL, executions tell them apart
+                exact = {row[:2]: row[2:] for row in d.sql(
+                    """select coalesce(nullif(sql_id, ''), 'NULL'), count(*), median(ela),
+                           percentile_disc(0.99) within group (order by ela)
+                       from v_elapsed_time group by sql_id""").fetchall()}
+                rows = summ.summary_histograms()
+                self.assertGreater(max(p99 for (_, p99) in exact.values()), 1000000000)
+                self.assertEqual(len(rows), len(exact))
+                for (_, sql_id, _, execs, _, median, p99, _) in rows:
+                    self.assertLessEqual(abs(p99 - exact[sql_id, execs][1]), max(1, p99 / 100))
+                    if p99 > highest:
+                        self.assertEqual((median, p99), exact[sql_id, execs])
+    def test_merge_precision(self):
+        """Histograms of different precision merge into the finer one"""
+        coarse = histograms.new_histogram(1)
+        fine = histograms.new_histogram(3)
+        coarse.record_value(1234)
+        fine.record_value(1234)
+        merged = histograms.merge([(1, coarse.encode()), (3, fine.encode())])
+        self.assertEqual(merged.get_total_count(), 2)
+        self.assertEqual(merged.significant_figures, 3)
+        self.assertIsNone(histograms.merge([]))
+    def test_wait_class(self):
+        self.assertEqual(wait_class('db file sequential read'), 'user_io')
+        self.assertEqual(wait_class('SQL*Net message from client'), 'idle')
+        self.assertEqual(wait_class('SQL*Net message to client'), 'network')
+        self.assertEqual(wait_class('enq: TX - row lock contention'), 'application')
+        self.assertEqual(wait_class('no such event'), 'other')
+
 if __name__ == '__main__':
     unittest.main()
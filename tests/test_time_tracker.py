@@ -1,7 +1,7 @@
 import unittest
 from datetime import datetime
-from datetime import timedelta
-from time_tracker import TimeTracker
+from datetime import timedelta, timezone
+from time_tracker import TimeTracker, from_us, to_us
 
 TIM0 = 7795634107774
 
@@ -12,24 +12,23 @@ class TestTimeTracker(unittest.TestCase):
         self.assertIs(tracker.wall_clock, None)
         self.assertIs(tracker.first_tim, None)
         self.assertIs(tracker.current_tim, None)
-        self.assertEqual(tracker.tim_delta, timedelta())
     def test_reset(self):
         tracker = TimeTracker()
         clock = datetime.today()
         tracker.reset(clock)
         self.assertEqual(tracker.wall_clock, clock)
+        self.assertEqual(tracker.wall_clock_us, to_us(clock))
 
         # TimeTracker.reset() sets *tim* properties to None
-        tracker.get_wc(TIM0)
+        tracker.get_ts(TIM0)
         tracker.reset(clock)
         self.assertIs(tracker.first_tim, None)
         self.assertIs(tracker.current_tim, None)
-        self.assertEqual(tracker.tim_delta, timedelta())
-    def test_get_wc(self):
+    def test_get_ts(self):
         tracker = TimeTracker()
 
         # wall clock hasn't been set yet, so there's nothing to return
-        nothing = tracker.get_wc(TIM0)
+        nothing = tracker.get_ts(TIM0)
         self.assertEqual(nothing, None)
 
         # 2023-05-18T13:56:18.679265+02:00
@@ -37,29 +36,35 @@ class TestTimeTracker(unittest.TestCase):
         tracker.reset(clock)
 
         # First tim hasn't been set, so expect back wall_clock
-        ret = tracker.get_wc(None)
-        self.assertEqual(clock, ret)
+        ret = tracker.get_ts(None)
+        self.assertEqual(to_us(clock), ret)
+        self.assertEqual(tracker.get_ts(0), ret)
 
-        clock0 = tracker.get_wc(TIM0)
-        self.assertEqual(clock, clock0)
+        clock0 = tracker.get_ts(TIM0)
+        self.assertEqual(to_us(clock), clock0)
         self.assertEqual(tracker.first_tim, TIM0)
         self.assertEqual(tracker.current_tim, TIM0)
-        self.assertEqual(tracker.tim_delta, timedelta())
 
         # Now that first_tim is set, expect back previous wall clock
-        ret = tracker.get_wc(None)
-        self.assertEqual(clock, ret)
+        ret = tracker.get_ts(None)
+        self.assertEqual(clock0, ret)
 
         tim1 = 7795634107865
-        delta = timedelta(microseconds = tim1 - TIM0)
-        clock1 = tracker.get_wc(tim1)
-        self.assertEqual(clock1, clock0 + delta)
+        clock1 = tracker.get_ts(tim1)
+        self.assertEqual(clock1, clock0 + tim1 - TIM0)
         self.assertEqual(tracker.first_tim, TIM0)
         self.assertEqual(tracker.current_tim, tim1)
-        self.assertEqual(tracker.tim_delta, delta)
 
-        # Still expect previous wc reading
-        ret = tracker.get_wc(None)
-        self.assertEqual(clock0 + delta, ret)
+        # Still expect previous wc reading, also for tim=0 of the lines without tim
+        self.assertEqual(tracker.get_ts(None), clock1)
+        self.assertEqual(tracker.get_ts(0), clock1)
+    def test_us(self):
+        clock = datetime(2023, 5, 18, 13, 56, 18, 679265, tzinfo=timezone(timedelta(hours=2)))
+        self.assertEqual(from_us(to_us(clock)), clock)
+        self.assertEqual(from_us(to_us(clock)).tzinfo, timezone.utc)
+        # Naive is UTC
+        self.assertEqual(to_us(datetime(1970, 1, 1, 0, 0, 1)), 1000000)
+        self.assertIsNone(to_us(None))
+        self.assertIsNone(from_us(None))
 if __name__ == '__main__':
     unittest.main()
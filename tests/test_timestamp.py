@@ -0,0 +1,58 @@
+import glob
+import pickle
+import re
+import unittest
+from timestamp import TimestampParser, strptime_timestamp
+
+TIMESTAMP = re.compile(rb'''^\*\*\* .*?(\d{4}-\d\d-\d\dT[^ \n]*)''')
+
+class TestTimestamp(unittest.TestCase):
+    """TimestampParser gives the same results as strptime"""
+    def assertSame(self, parser, instr):
+        expected = strptime_timestamp(instr)
+        out = parser(instr)
+        self.assertEqual(out, expected)
+        self.assertIs(out.tzinfo, expected.tzinfo)
+        self.assertEqual(out.fold, expected.fold)
+        self.assertEqual(pickle.dumps(out), pickle.dumps(expected))
+    def test_traces(self):
+        """Every timestamp in the test traces, no_timezone.trc too"""
+        timestamps = []
+        for fname in glob.glob('tests/traces/*.trc'):
+            with open(fname, 'rb') as fdesc:
+                timestamps.extend(m.group(1).decode() for line in fdesc
+                                  if (m := TIMESTAMP.match(line)) is not None)
+        self.assertIn('2023-05-19T05:28:00.339263', timestamps)
+        parser = TimestampParser()
+        for instr in timestamps + timestamps:
+            with self.subTest(instr=instr):
+                self.assertSame(parser, instr)
+        self.assertEqual(parser.misses, len(set(timestamps)))
+        self.assertEqual(parser.hits, 2*len(timestamps) - len(set(timestamps)))
+    def test_odd_shapes(self):
+        parser = TimestampParser()
+        for instr in ('2023-05-19T05:28:00.339263+00:00', '2023-12-31T23:59:59.999999+05:45',
+                      '0001-01-01T00:00:00.000000+00:00', '2023-05-19T05:28:00.3+02:00',
+                      '2023-05-19T05:28:00.339+02:00', '2023-05-19T05:28:00.33926'):
+            with self.subTest(instr=instr):
+                self.assertSame(parser, instr)
+    def test_errors(self):
+        """Errors come from strptime"""
+        parser = TimestampParser()
+        for instr in ('2023-13-19T05:28:00.339263+02:00', '2023-05-19T05:28:00.339263+24:00',
+                      '2023-05-19T05:28:00.339263-02:00', '2023-05-19T05:28:00+02:00', 'garbage',
+                      '0001-01-01T00:00:00.000000+01:00'):
+            with self.subTest(instr=instr):
+                with self.assertRaises(Exception) as expected:
+                    strptime_timestamp(instr)
+                with self.assertRaises(type(expected.exception)) as out:
+                    parser(instr)
+                self.assertEqual(str(out.exception), str(expected.exception))
+    def test_cache_size(self):
+        parser = TimestampParser(cache_size=2)
+        for sec in range(10):
+            parser(f'2023-05-19T05:28:0{sec}.339263+02:00')
+        self.assertLessEqual(len(parser.cache), 2)
+
+if __name__ == '__main__':
+    unittest.main()
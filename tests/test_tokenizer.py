@@ -0,0 +1,60 @@
+import unittest
+import tokenizer
+from tokenizer import tokenize, decode_wait, decode_pairs
+
+class TestTokenizer(unittest.TestCase):
+    def test_calls(self):
+        line = b'WAIT #140641987987624: nam=\'SQL*Net message to client\' ela= 1 driver id=1413697536 #bytes=1 p3=0 obj#=-1 tim=5793511831311\n'
+        self.assertEqual(tokenize(line), (tokenizer.CALL, 'WAIT', '#140641987987624',
+            b" nam='SQL*Net message to client' ela= 1 driver id=1413697536 #bytes=1 p3=0 obj#=-1 tim=5793511831311"))
+        line = b'FETCH #140641987987624:c=0,e=2,p=0,cr=0,cu=0,mis=0,r=0,dep=0,og=1,plh=0,tim=5793511831300\n'
+        self.assertEqual(tokenize(line)[:3], (tokenizer.CALL, 'FETCH', '#140641987987624'))
+        line = b'STAT #140641987987624 id=1 cnt=1 pid=0\n'
+        self.assertEqual(tokenize(line), (tokenizer.CALL, 'STAT', '#140641987987624',
+                                          b'id=1 cnt=1 pid=0'))
+        self.assertEqual(tokenize(b'CLOSE #1:c=0,e=4,dep=0,type=3,tim=5\n'),
+                         (tokenizer.CALL, 'CLOSE', '#1', b'c=0,e=4,dep=0,type=3,tim=5'))
+        self.assertEqual(tokenize(b'PARSE ERROR #1:len=2 dep=0 uid=1 oct=3 lid=1 tim=5 err=923\n'),
+                         (tokenizer.CALL, 'PARSE ERROR', '#1', b'len=2 dep=0 uid=1 oct=3 lid=1 tim=5 err=923'))
+        self.assertEqual(tokenize(b'PARSING IN CURSOR #1 len=2 sqlid=\'abc\'\n'),
+                         (tokenizer.CALL, 'PARSING IN CURSOR', '#1', b"len=2 sqlid='abc'"))
+        self.assertEqual(tokenize(b'ERROR #1:err=1 tim=5\n')[:3], (tokenizer.CALL, 'ERROR', '#1'))
+
+    def test_other(self):
+        self.assertEqual(tokenize(b'=====================\n'), (tokenizer.RES,))
+        self.assertEqual(tokenize(b'*** 2023-05-19T05:28:00.339263+02:00\n'),
+                         (tokenizer.DATE, '2023-05-19T05:28:00.339263+02:00'))
+        self.assertEqual(tokenize(b'*** SERVICE NAME:(test) 2023-05-19T05:28:00.339263+02:00\n'),
+                         (tokenizer.STARS, 'SERVICE NAME', 'test', '2023-05-19T05:28:00.339263+02:00'))
+        self.assertEqual(tokenize(b'XCTEND rlbk=0, rd_only=1, tim=5\n'),
+                         (tokenizer.XLOB, 'XCTEND', b'rlbk=0, rd_only=1, tim=5'))
+        self.assertEqual(tokenize(b'LOBREAD: type=PERSISTENT LOB,bytes=1,c=0,e=1,p=0,cr=0,cu=0,tim=5\n')[:2],
+                         (tokenizer.XLOB, 'LOBREAD'))
+        self.assertEqual(tokenize(b'CLID:   P\n'), (tokenizer.HEADER, 'CLID', 'P'))
+        self.assertEqual(tokenize(b'Oracle process number: 42\n'),
+                         (tokenizer.HEADER, 'Oracle process number', '42'))
+        self.assertIsNone(tokenize(b'select 1 from dual\n'))
+        self.assertIsNone(tokenize(b'Exec something\n'))
+        self.assertIsNone(tokenize(b'WAIT #abc: nam=x\n'))
+
+    def test_decode_wait(self):
+        self.assertEqual(decode_wait(" nam='log file sync' ela= 12 p1=0 p2=0 tim=34"),
+                         ('log file sync', 12, 34))
+        self.assertEqual(decode_wait(" nam='a' ela= b' ela= 12 x tim=34"), ("a' ela= b", 12, 34))
+        self.assertIsNone(decode_wait(" nam='a' ela= x"))
+
+    def test_decode_pairs(self):
+        self.assertEqual(decode_pairs('c=0,e=1,p=2'), [('c', 0), ('e', 1), ('p', 2)])
+        self.assertEqual(decode_pairs('rlbk=0, rd_only=1', ', '), [('rlbk', 0), ('rd_only', 1)])
+        self.assertEqual(decode_pairs('c=0,e=1,'), [('c', 0), ('e', 1)])
+        self.assertEqual(decode_pairs(b'c=0,e=1,p=2'), [('c', 0), ('e', 1), ('p', 2)])
+        self.assertEqual(decode_pairs(b'rlbk=0, rd_only=1', ', '), [('rlbk', 0), ('rd_only', 1)])
+        with self.assertRaises(ValueError):
+            decode_pairs('c=0,e=x')
+        with self.assertRaises(ValueError):
+            decode_pairs(b'c=0,e=\xff')
+
+    def test_invalid_utf8(self):
+        self.assertEqual(tokenize(b'*** MODULE NAME:(\xff) 2023-05-19T05:28:00.339263+02:00\n')[2],
+                         '\ufffd')
+        self.assertEqual(tokenizer.to_str(b'a\xffb'), 'a\ufffdb')
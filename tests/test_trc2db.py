@@ -17,6 +17,30 @@ class DummyArgs:
     orphans: bool() = True
     fstype: str() = 'local'
     fsopts: dict = field(default_factory=dict)
+    jobs: int = 1
+    split_size: int = 0
+    engine: str = 'ops'
+    follow: bool = False
+    flush_interval: float = 5.0
+    flush_lines: int = 100000
+    follow_idle: float = 0
+    roll_interval: float = 300
+    manifest: bool = False
+    decompress_threads: int = 0
+    member_glob: str = None
+    ingest_profile: str = 'full'
+    bind_sample: float = None
+    profile: str = None
+    max_cursors: int = 0
+    idle_gap: float = 0
+    pipeline_depth: int = 0
+    histogram_digits: int = 2
+    row_group_size: int = 262144
+    file_size: float = 256
+    compression: str = 'zstd'
+    compression_level: int = None
+    column_compression: str = ''
+    partition_by: str = ''
 
 class TestTrc2db(unittest.TestCase):
     """Tests for trc2db.py"""
@@ -51,6 +75,19 @@ class TestTrc2db(unittest.TestCase):
 
             res = d.sql(f"select count(distinct file_name) from read_parquet('{pfile}');")
             self.assertEqual(res.fetchone()[0], 4)
+    def test_process_files_columnar(self):
+        """Columnar engine, sequential and parallel."""
+        for jobs in (1, 2):
+            with tempfile.TemporaryDirectory() as db_dir:
+                args = DummyArgs(dbdir=db_dir, engine='columnar', jobs=jobs, trace_files=(
+                    'tests/traces/two_statements_one_cursor.trc.gz',
+                    'tests/traces/mixed_execs.trc.bz2',
+                    'tests/traces/lobread.trc.xz',
+                    'tests/traces/lobread.trc.lzma'))
+                trc2db.process_files(args)
+                res = d.sql(f"select count(*) from read_parquet('{db_dir}/*') "
+                            +"where event_name is distinct from 'PARQUET_SCHEMA';")
+                self.assertEqual(res.fetchone()[0], 282)
     def test_process_one_file_check_result(self):
         """High level test for process_file. Checks if data in the Parquet file is correct"""
         with tempfile.TemporaryDirectory() as db_dir:
@@ -86,5 +123,26 @@ class TestTrc2db(unittest.TestCase):
             res = d.sql(f"select line from read_parquet('{pfile}') where ops = 'PIC';")
             out = {l[0] for l in res.fetchall()}
             self.assertTrue(out >= {30, 46, 68})
+    def test_process_files_parallel(self):
+        """Parallel workers write their own files, span ids must not overlap."""
+        trace_files = ('tests/traces/two_statements_one_cursor.trc.gz',
+                'tests/traces/mixed_execs.trc.bz2',
+                'tests/traces/lobread.trc.xz',
+                'tests/traces/lobread.trc.lzma')
+        with tempfile.TemporaryDirectory() as db_dir:
+            args = DummyArgs(dbdir=db_dir, trace_files=trace_files, jobs=2)
+            trc2db.process_files(args)
+            res = d.sql(f"select count(*) from read_parquet('{db_dir}/*') "
+                        +"where event_name is distinct from 'PARQUET_SCHEMA';")
+            self.assertEqual(res.fetchone()[0], 282)
+
+            res = d.sql(f"select count(distinct file_name) from read_parquet('{db_dir}/*') "
+                        +"where file_name is not null;")
+            self.assertEqual(res.fetchone()[0], 4)
+
+            res = d.sql(f"select count(distinct span_id), count(distinct (span_id, file_name)) "
+                        +f"from read_parquet('{db_dir}/*') where file_name is not null;")
+            (span_ids, file_spans) = res.fetchone()
+            self.assertEqual(span_ids, file_spans)
 if __name__ == '__main__':
     unittest.main()
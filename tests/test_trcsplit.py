@@ -0,0 +1,106 @@
+import collections
+import os
+import tempfile
+import unittest
+import trcparser
+import trcsplit
+from call_tracker import CallTracker
+from tests.mock_backend import Backend
+
+class TestTrcsplit(unittest.TestCase):
+    """Tests for splitting trace files into chunks."""
+    def spans(self, batches):
+        """Groups rows by span, span_id itself is replaced by the content of the span."""
+        spans = collections.defaultdict(list)
+        for row in batches:
+            spans[row[0]].append(row[1:])
+        return sorted((sorted(rows, key=repr) for rows in spans.values()), key=repr)
+    def process(self, fname, chunks):
+        tracker = CallTracker(Backend())
+        for chunk in chunks:
+            trcparser.process_file(tracker, fname, False, chunk)
+            tracker.flush()
+        return tracker.db.batches
+    def test_plan_chunks(self):
+        fname = 'tests/traces/mixed_execs.trc'
+        chunks = trcsplit.plan_chunks(fname, 1)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[0].start, 0)
+        for (prev, chunk) in zip(chunks, chunks[1:]):
+            self.assertEqual(prev.end, chunk.start)
+        with open(fname, 'rb') as fdesc:
+            data = fdesc.read()
+        self.assertEqual(chunks[-1].end, len(data))
+        self.assertEqual(chunks[1].line, data[:chunks[1].start].count(b'\n'))
+        self.assertTrue(data[chunks[1].start:].startswith(b'====================='))
+        self.assertEqual(chunks[1].cursors, {})
+        self.assertEqual(chunks[3].cursors['#140386304541280'], '6v48b7j2tc4a0')
+        self.assertIsNone(chunks[1].wall_clock)
+        self.assertIsNotNone(chunks[3].wall_clock)
+        self.assertIsNotNone(chunks[3].first_tim)
+    def test_same_as_sequential(self):
+        """Chunked parse produces the same spans as the sequential one."""
+        for fname in ('tests/traces/two_statements_one_cursor.trc',
+                        'tests/traces/mixed_execs.trc', 'tests/traces/lobs.trc',
+                        'tests/traces/simple_trace_2x.trc'):
+            sequential = self.process(fname, [None])
+            chunked = self.process(fname, trcsplit.plan_chunks(fname, 1))
+            self.assertEqual(self.spans(sequential), self.spans(chunked), fname)
+    def test_resume_point(self):
+        """Processing resumed from the end of the first chunk is the same as chunked."""
+        for fname in ('tests/traces/mixed_execs.trc', 'tests/traces/simple_trace_2x.trc'):
+            chunks = trcsplit.plan_chunks(fname, 1)
+            tracker = CallTracker(Backend())
+            resume = []
+            trcparser.process_file(tracker, fname, False, chunks[0],
+                        on_end=lambda tr, fmeta: resume.append(chunks[0].resume_point(tr, fmeta)))
+            tracker.flush()
+            self.assertEqual(resume[0].start, chunks[1].start)
+            self.assertEqual(resume[0].line, chunks[1].line)
+            self.assertEqual(resume[0].cursors, chunks[1].cursors)
+            rest = trcsplit.plan_chunks(fname, 1, resume[0])
+            self.assertEqual([c.start for c in rest], [c.start for c in chunks[1:]])
+            for chunk in rest:
+                trcparser.process_file(tracker, fname, False, chunk)
+                tracker.flush()
+            resumed = tracker.db.batches
+            self.assertEqual(self.spans(self.process(fname, chunks)), self.spans(resumed), fname)
+    def test_timless_line_after_edge(self):
+        """Line without tim right after the edge gets the wall clock of the latest tim, like in
+            the sequential parse."""
+        with open('tests/traces/simple_trace_2x.trc', 'rb') as fdesc:
+            head = fdesc.read().split(b'\n=====================\n')[0]
+        cursor = b'#140641987987624'
+        trace = head + b'\n=====================\n' \
+            + b'EXEC ' + cursor + b':c=1,e=1,p=0,cr=0,cu=0,mis=0,r=0,dep=0,og=1,plh=1,tim=1000\n' \
+            + b'EXEC ' + cursor + b':c=1,e=1,p=0,cr=0,cu=0,mis=0,r=0,dep=0,og=1,plh=1,tim=5000\n' \
+            + b'=====================\n' \
+            + b'STAT ' + cursor + b" id=1 cnt=1 pid=0 pos=1 obj=0 op='FAST DUAL  (cr=0 pr=0 " \
+            + b"pw=0 str=1 time=1 us cost=2 size=0 card=1)'\n" \
+            + b'EXEC ' + cursor + b':c=1,e=1,p=0,cr=0,cu=0,mis=0,r=0,dep=0,og=1,plh=1,tim=9000\n'
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'timless.trc')
+            with open(fname, 'wb') as fdesc:
+                fdesc.write(trace)
+            chunks = trcsplit.plan_chunks(fname, 1)
+            self.assertEqual(len(chunks), 3)
+            self.assertEqual((chunks[2].first_tim, chunks[2].current_tim), (1000, 5000))
+            sequential = self.process(fname, [None])
+            self.assertEqual(self.spans(sequential), self.spans(self.process(fname, chunks)))
+    def test_last_edge(self):
+        """With last_edge the last chunk starts at the last "=====" line"""
+        fname = 'tests/traces/mixed_execs.trc'
+        with open(fname, 'rb') as fdesc:
+            data = fdesc.read()
+        edge = data.rindex(b'\n=====') + 1
+        chunks = trcsplit.plan_chunks(fname, 1 << 30, last_edge=True)
+        self.assertEqual([(c.start, c.end) for c in chunks], [(0, edge), (edge, len(data))])
+        self.assertEqual(chunks[1].cursors, trcsplit.plan_chunks(fname, 1)[-1].cursors)
+    def test_unsafe_edge(self):
+        """Chunk can't start after PARSE ERROR, "=====" would be part of the error text."""
+        buf = b'x\nPARSE ERROR #1:len=1 dep=0 uid=1 oct=3 lid=1 tim=1 err=942\nselect\n' \
+                + b'=====================\nEXEC #2:c=1,e=1,tim=2\n=====================\n'
+        self.assertEqual(trcsplit._find_edges(buf, len(buf), 1), [buf.rindex(b'=' * 21)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,36 +1,51 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+def to_us(wall_clock: Optional[datetime]) -> Optional[int]:
+    '''Microseconds since the epoch. Naive datetime is taken as UTC, like pyarrow does.'''
+    if wall_clock is None:
+        return None
+    if wall_clock.tzinfo is None:
+        wall_clock = wall_clock.replace(tzinfo=timezone.utc)
+    return (wall_clock - EPOCH) // MICROSECOND
+
+def from_us(us: Optional[int]) -> Optional[datetime]:
+    '''Reverse of to_us(), returns UTC datetime'''
+    if us is None:
+        return None
+    return EPOCH + timedelta(microseconds=us)
+
 class TimeTracker:
     '''TimeTracker keeps track of the wall clock and time deltas between database
-       calls. It generates wall clock readings.'''
+       calls. It generates wall clock readings, in microseconds since the epoch.
+
+       Segment starts with the wall clock from the *** line, and is anchored to the first tim
+       after it. get_ts() is called when the line is parsed, so the readings do not depend
+       on when the ops are written.'''
     wall_clock: Optional[datetime] = None
+    wall_clock_us: Optional[int] = None
     first_tim: Optional[int] = None
     current_tim: Optional[int] = None
-    tim_delta: timedelta = timedelta()
 
     def reset(self, wallclock: datetime) -> None:
         '''Sets new wall clock reading and resets rest of the variables '''
         self.wall_clock: datetime = wallclock
+        self.wall_clock_us = to_us(wallclock)
         self.first_tim = None
         self.current_tim = None
-        self.tim_delta: timedelta = timedelta()
-    def get_wc(self, tim: int) -> datetime:
-        ''' Gets new wall clock reading for the tim'''
-        if not self.wall_clock:
-            print(f"wall_clock hasn't been set, tim = {tim}")
+    def get_ts(self, tim: Optional[int]) -> Optional[int]:
+        ''' Wall clock reading for the tim, in microseconds since the epoch. Lines without tim
+            (0 or None) get the reading of the latest tim in the segment.'''
+        if self.wall_clock_us is None:
             return None
-
-        if tim is None:
-            if self.first_tim is not None:
-                return self.wall_clock + self.tim_delta
-            return self.wall_clock
-
-        if not self.first_tim:
+        if not tim:
+            if self.first_tim is None:
+                return self.wall_clock_us
+            return self.wall_clock_us + self.current_tim - self.first_tim
+        if self.first_tim is None:
             self.first_tim = tim
-            self.current_tim = tim
-            return self.wall_clock
-
         self.current_tim = tim
-        self.tim_delta = timedelta(microseconds = self.current_tim - self.first_tim)
-        return self.wall_clock + self.tim_delta
+        return self.wall_clock_us + tim - self.first_tim
@@ -0,0 +1,71 @@
+import datetime
+import re
+from zoneinfo import ZoneInfo
+
+__doc__ = '''Parser for the timestamps of the *** lines. Trace files have the timestamps in one
+    shape, 2023-05-19T05:28:00.339263+02:00 or without the time zone, and connection pools emit
+    thousands of them per minute. TimestampParser takes them apart with one regex, keeps the
+    time zone offsets in a table and remembers the recently parsed strings. Everything that
+    doesn't have the usual shape goes through strptime(), so the results and errors are the same
+    as from strptime_timestamp().'''
+
+UTC = ZoneInfo('UTC')
+TIMEZONE_MATCHER = re.compile(r'''(?:.*)\+(\d\d:\d\d)''')
+ISO_MATCHER = re.compile(r'''(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)\.(\d{6})(\+\d\d:\d\d)?''',
+                         re.ASCII)
+# Parsed strings that are remembered
+CACHE_SIZE = 4096
+
+def strptime_timestamp(instr: str) -> datetime.datetime:
+    """Checks if input has a time zone or not, and adjusts the format accordingly."""
+    tz_match = TIMEZONE_MATCHER.match(instr)
+    if tz_match:
+        date_format = '%Y-%m-%dT%H:%M:%S.%f%z'
+    else:
+        date_format = '%Y-%m-%dT%H:%M:%S.%f'
+    return datetime.datetime.strptime(instr, date_format).astimezone(tz=UTC)
+
+class TimestampParser:
+    """Parses the timestamps into datetime in UTC. Timestamp without the time zone is in the
+        local time, like in strptime_timestamp()."""
+    def __init__(self, cache_size: int = CACHE_SIZE) -> None:
+        self.cache_size = cache_size
+        self.cache: dict[str, datetime.datetime] = {}
+        # {'+02:00': timedelta}
+        self.offsets: dict[str, datetime.timedelta] = {}
+        self.hits = 0
+        self.misses = 0
+    def __call__(self, instr: str) -> datetime.datetime:
+        if (out := self.cache.get(instr)) is not None:
+            self.hits += 1
+            return out
+        self.misses += 1
+        out = self.parse(instr)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[instr] = out
+        return out
+    def offset(self, tzstr: str) -> datetime.timedelta:
+        """Offset for '+HH:MM'"""
+        if (out := self.offsets.get(tzstr)) is None:
+            (hours, minutes) = (int(tzstr[1:3]), int(tzstr[4:6]))
+            if hours > 23 or minutes > 59:
+                raise ValueError(f"Invalid time zone offset {tzstr}")
+            out = datetime.timedelta(hours=hours, minutes=minutes)
+            self.offsets[tzstr] = out
+        return out
+    def parse(self, instr: str) -> datetime.datetime:
+        """Parses the timestamp, without the cache"""
+        match = ISO_MATCHER.fullmatch(instr)
+        if match is None:
+            return strptime_timestamp(instr)
+        (year, month, day, hour, minute, second, micro, tzstr) = match.groups()
+        try:
+            if tzstr is None:
+                return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute),
+                                         int(second), int(micro)).astimezone(tz=UTC)
+            return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute),
+                                     int(second), int(micro), UTC) - self.offset(tzstr)
+        except (ValueError, OverflowError):
+            # Out of range values, strptime() has its own error message
+            return strptime_timestamp(instr)
@@ -0,0 +1,200 @@
+import re
+import sys
+from typing import Optional
+
+__doc__ = '''Splits the lines of the trace file into tokens. Instead of trying all the regular
+    expressions in turn, tokenize() dispatches on the first byte of the line to the decoder
+    of that record type. WAIT and FETCH lines are the bulk of the trace, these get the shortest
+    path: one dictionary lookup and one anchored match.
+
+    Lines are bytes, as read from the file. Numeric key=value pairs are parsed straight from bytes,
+    only the fields that end up as strings are decoded. Invalid UTF-8 in them is replaced, it does
+    not stop the processing of the file. Cursors and wait event names repeat on every line, these
+    are interned, so that the records share one copy of the string.'''
+
+PIC_MATCHER = re.compile(rb'''^END OF STMT(.*)''')
+
+# 2023-05-19T05:28:00.339263+02:00
+DATE_MATCHER = re.compile(rb'''^\*{3} (\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}\+\d\d:\d\d)''')
+
+STARS_MATCHER = re.compile(rb'''^\*\*\* (SESSION ID:|CLIENT ID:|SERVICE NAME:|MODULE NAME:'''
+        +rb'''|ACTION NAME:|CLIENT DRIVER:|CONTAINER ID:|CLIENT IP:|CONNECTION ID:)(\(.*\)) (.*)''')
+CALL_MATCHER = re.compile(rb'''^(PARSE|EXEC|FETCH|WAIT|CLOSE|STAT|ERROR|PARSING IN CURSOR|BINDS|PARSE ERROR) (#\d+)(:| )(.*)''')
+XLOB_MATCHER = re.compile(rb'''^(LOB[A-Z]+|XCTEND):* (.*)''')
+
+FILE_HEADER_MATCHER = re.compile(rb'''^(Build label|ORACLE_HOME|System name'''
+                        +rb'''|Node name|Release|Version|Machine|CLID|Instance name'''
+                        +rb'''|Instance number|Database name|Database unique name'''
+                        +rb'''|Database unique id'''
+                        +rb'''|Redo thread mounted by this instance|Oracle process number'''
+                        +rb'''|Unix process pid):\s+(.*)''')
+
+WAIT_MATCHER = re.compile(r""" nam='(.*)' ela= (\d+) (.*) tim=(\d+)""")
+
+# Token kinds. Tokens are tuples, first element is the kind.
+CALL = 0 # (CALL, op_type, cursor, params)
+XLOB = 1 # (XLOB, op_type, params)
+RES = 2 # (RES,)
+DATE = 3 # (DATE, timestamp)
+STARS = 4 # (STARS, name, value, timestamp)
+HEADER = 5 # (HEADER, name, value)
+
+TOKEN_RES = (RES,)
+
+def to_str(value) -> str:
+    """Decodes bytes from the trace file, invalid UTF-8 is replaced. Strings are returned as-is."""
+    if isinstance(value, bytes):
+        return value.decode('utf_8', 'replace')
+    return value
+
+# Decoded keys and op types, there are only handful of these. Caches are capped in case of
+# garbage in the file.
+MAX_KEYS = 1000
+_NAMES: dict = {}
+# {tuple of keys in the line: tuple of decoded keys}
+_KEYS: dict = {}
+
+def _name(value) -> str:
+    if (name := _NAMES.get(value)) is None:
+        name = to_str(value)
+        if len(_NAMES) < MAX_KEYS:
+            _NAMES[value] = name
+    return name
+
+def _call(line: bytes) -> Optional[tuple]:
+    """Generic decoder for the database calls."""
+    if (m := CALL_MATCHER.match(line)) is not None:
+        return (CALL, _name(m.group(1)), sys.intern(m.group(2).decode('ascii')), m.group(4))
+    return None
+
+def _fast_call(op_type: str, sep: str = ':'):
+    """Returns decoder for the call with the cursor followed by a separator, like
+        'WAIT #123: nam=...' or 'FETCH #123:c=0,e=1...'. Anchored pattern without alternation
+        is much cheaper than CALL_MATCHER. Falls back to the generic decoder if the line does not
+        look as expected."""
+    match = re.compile(op_type.encode() + rb' (#\d+)' + sep.encode() + b'(.*)').match
+    def decoder(line: bytes) -> Optional[tuple]:
+        if (m := match(line)) is not None:
+            return (CALL, op_type, sys.intern(m[1].decode('ascii')), m[2])
+        return _call(line)
+    return decoder
+
+def _header(line: bytes) -> Optional[tuple]:
+    if (m := FILE_HEADER_MATCHER.match(line)) is not None:
+        return (HEADER, _name(m.group(1)), to_str(m.group(2)))
+    return None
+
+def _stars(line: bytes) -> Optional[tuple]:
+    if (m := DATE_MATCHER.match(line)) is not None:
+        return (DATE, m.group(1).decode('ascii'))
+    if (m := STARS_MATCHER.match(line)) is not None:
+        return (STARS, _name(m.group(1).strip(b':')), to_str(m.group(2).strip(b'()')),
+                to_str(m.group(3)))
+    return None
+
+def _xlob(line: bytes) -> Optional[tuple]:
+    if (m := XLOB_MATCHER.match(line)) is not None:
+        return (XLOB, _name(m.group(1)), m.group(2))
+    return None
+
+def _res(line: bytes) -> Optional[tuple]:
+    if line.startswith(b'====================='):
+        return TOKEN_RES
+    return None
+
+_wait = _fast_call('WAIT')
+_fetch = _fast_call('FETCH')
+_exec = _fast_call('EXEC')
+_parse = _fast_call('PARSE')
+_close = _fast_call('CLOSE')
+_stat = _fast_call('STAT', ' ')
+_binds = _fast_call('BINDS')
+
+def _e(line: bytes) -> Optional[tuple]:
+    if line.startswith(b'EXEC'):
+        return _exec(line)
+    return _call(line)
+
+def _p(line: bytes) -> Optional[tuple]:
+    if line[4:6] == b'E ':
+        return _parse(line)
+    return _call(line)
+
+def _s(line: bytes) -> Optional[tuple]:
+    if line.startswith(b'STAT'):
+        return _stat(line)
+    return _header(line)
+
+def _b(line: bytes) -> Optional[tuple]:
+    if line.startswith(b'BINDS'):
+        return _binds(line)
+    return _header(line)
+
+def _c(line: bytes) -> Optional[tuple]:
+    if line.startswith(b'CLOSE'):
+        return _close(line)
+    return _header(line)
+
+# Indexing bytes gives int
+DISPATCH = {
+    ord('W'): _wait,
+    ord('F'): _fetch,
+    ord('E'): _e,
+    ord('P'): _p,
+    ord('C'): _c,
+    ord('S'): _s,
+    ord('B'): _b,
+    ord('*'): _stars,
+    ord('='): _res,
+    ord('L'): _xlob,
+    ord('X'): _xlob,
+}
+for _letter in b'ONRVMIDU':
+    DISPATCH[_letter] = _header
+
+def tokenize(line: bytes) -> Optional[tuple]:
+    """Turns the line into token, returns None for the lines that are not recognized.
+        Params of the CALL and XLOB tokens are left as bytes."""
+    if (decoder := DISPATCH.get(line[0])) is not None:
+        return decoder(line)
+    return None
+
+def decode_wait(params: str) -> Optional[tuple]:
+    """Decodes parameters of the WAIT: " nam='...' ela= 1 ... tim=2". Returns (name, ela, tim),
+        or None if line is malformed."""
+    ela = params.rfind("' ela= ")
+    tim = params.rfind(' tim=')
+    if params.startswith(" nam='") and 0 < ela < tim:
+        try:
+            ela_end = params.index(' ', ela + 7)
+            if ela_end < tim:
+                return (sys.intern(params[6:ela].strip("'")), int(params[ela + 7:ela_end]),
+                        int(params[tim + 5:]))
+        except ValueError:
+            pass
+    if (m := WAIT_MATCHER.match(params)) is not None:
+        return (sys.intern(m.group(1).strip("'")), int(m.group(2)), int(m.group(4)))
+    return None
+
+def decode_pairs(params, sep: str = ',') -> list:
+    """Decodes key=value pairs, like "c=0,e=1,p=0", from str or bytes. Values are expected to be
+        integers, throws ValueError or IndexError otherwise."""
+    if isinstance(params, bytes):
+        (sep, eq) = (sep.encode(), b'=')
+    else:
+        eq = '='
+    items = params.replace(eq, sep).split(sep)
+    if len(items) % 2 == 0:
+        # Lines of the same type have the same keys, these are decoded once
+        keys = tuple(items[::2])
+        if (names := _KEYS.get(keys)) is None:
+            names = tuple(map(_name, keys))
+            if len(_KEYS) < MAX_KEYS:
+                _KEYS[keys] = names
+        return list(zip(names, map(int, items[1::2])))
+    out = []
+    for item in params.split(sep):
+        if len(item):
+            key = item.split(eq)
+            out.append((_name(key[0]), int(key[1])))
+    return out
@@ -1,54 +1,368 @@
 #!/usr/bin/env python3.12
 
 import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+import os
 import time
+from typing import Optional
+import archive
+import decompress
+import histograms
 import trcparser
+import trcsplit
 from call_tracker import CallTracker
+from columnar import row_factory
+import instrumentation
+from manifest import Manifest, COMMIT_SIZE
+import pipeline
+from profiles import get_profile, PROFILES
 
 __doc__ = """Turn Oracle SQL trace files into Parquet, or inserts them into a Oracle database,
             or sends them to the OTLP-capable tracing aggregator."""
 
-def get_backend(args):
-    """Inspects arguments and initialises suitable backend."""
+# Span ids generated by one parallel worker occupy their own range of 2^40 ids
+WORKER_SPAN_ID_BITS = 40
+# Limits of the open spans in follow mode, the tracker of the endless trace must not grow forever
+FOLLOW_MAX_CURSORS = 10000
+FOLLOW_IDLE_GAP = 600
+
+def get_backend(args, worker_id=None):
+    """Inspects arguments and initialises suitable backend. Parallel workers pass worker_id,
+        which keeps their Parquet files and span ids apart from other workers."""
     backend = None
+    verbose = worker_id is None
     if args.db == 'oracle':
-        print('Using backend: oracle')
+        if verbose:
+            print('Using backend: oracle')
         from backend.oracle import Backend
         backend = Backend()
     elif args.db == 'parquet':
-        print('Using backend: arrow/parquet')
-        from backend.arrow import Backend
-        backend = Backend(args.dbdir, args.file_prefix)
+        if verbose:
+            print('Using backend: arrow/parquet')
+        if args.engine == 'columnar':
+            from backend.arrow import ColumnarBackend as Backend
+        else:
+            from backend.arrow import Backend
+        from backend.arrow import WriterOptions, parse_column_compression, parse_partition_by
+        options = WriterOptions(row_group_size=args.row_group_size,
+                                file_size=int(args.file_size * 1024 * 1024),
+                                file_age=args.roll_interval if args.follow else 0,
+                                compression=args.compression,
+                                compression_level=args.compression_level,
+                                column_compression=parse_column_compression(
+                                    args.column_compression),
+                                partition_by=parse_partition_by(args.partition_by))
+        if worker_id is None:
+            backend = Backend(args.dbdir, args.file_prefix,
+                              histogram_digits=args.histogram_digits, options=options)
+        else:
+            backend = Backend(args.dbdir, f'{args.file_prefix}.{worker_id}',
+                                worker_id << WORKER_SPAN_ID_BITS, args.histogram_digits, options)
         backend.set_fs(args.fstype, args.fsopts)
     elif args.db == 'otlp':
-        print('Using OTLP exporter')
+        if verbose:
+            print('Using OTLP exporter')
         from backend.otlp import Backend
         backend = Backend(args.traceid)
-    else:
+    elif verbose:
         print('Using backend: None')
     return backend
 
+def get_tracker(args, worker_id=None) -> CallTracker:
+    """Initialises the backend and the tracker for the engine."""
+    backend = get_backend(args, worker_id)
+    profile = get_profile(args.ingest_profile, args.bind_sample)
+    limits = {'max_cursors': args.max_cursors, 'idle_tim': int(args.idle_gap * 1000000)}
+    if args.engine == 'columnar':
+        tracker = CallTracker(backend, row_factory, profile, **limits)
+    else:
+        tracker = CallTracker(backend, profile=profile, **limits)
+    if args.pipeline_depth and args.db == 'parquet':
+        tracker.db = pipeline.PipelinedBackend(backend, args.pipeline_depth)
+    if args.profile:
+        instrumentation.Profiler().instrument(tracker)
+    return tracker
+
+def run_stats(tracker) -> dict:
+    """Counters of the tracker and the pipeline"""
+    stage = getattr(tracker.db, 'stage', None)
+    return {'evicted': sum(tracker.evictions.values()),
+            'pipeline': stage.stats() if stage is not None else None}
+
+def print_pipeline(stats: list[dict]) -> None:
+    """Queue depth and stall times of the pipeline, summed up over the workers"""
+    stats = [s['pipeline'] for s in stats if s['pipeline']]
+    if stats:
+        print(f"Pipeline: {pipeline.format_stats(pipeline.merge_stats(stats))}")
+
+def take_profile(tracker, fname, size, lines, errors, elapsed) -> Optional[dict]:
+    """Profile of the file with --profile, see instrumentation.py"""
+    if tracker.profiler is None:
+        return None
+    return tracker.profiler.take(fname, size, lines, errors, elapsed)
+
+def write_profile(args, files: list[dict], elapsed: float) -> None:
+    """Writes the --profile report, elapsed is the wall clock of the run in seconds"""
+    settings = {key: getattr(args, key) for key in ('db', 'engine', 'jobs', 'split_size',
+                                                    'ingest_profile', 'bind_sample',
+                                                    'decompress_threads', 'max_cursors',
+                                                    'idle_gap', 'pipeline_depth',
+                                                    'histogram_digits', 'row_group_size',
+                                                    'file_size', 'compression',
+                                                    'compression_level', 'column_compression',
+                                                    'partition_by')}
+    total = instrumentation.merge(files, elapsed=elapsed)
+    instrumentation.write_report(args.profile, files, total, settings)
+
+def get_manifest(args) -> Optional[Manifest]:
+    """Manifest of the output directory, if it is enabled. Only the parquet backend has one."""
+    if not args.manifest or args.db != 'parquet':
+        return None
+    from backend.arrow import get_fs
+    return Manifest(get_fs(args.fstype, args.fsopts), args.dbdir, args.file_prefix)
+
+def process_one(args, fname, worker_id, chunk=None) -> tuple:
+    """Runs in the worker process: processes one file or chunk of it with its own tracker and
+        backend. Returns file name, line and error count, bytes processed, elapsed
+        nanoseconds, the parser state at the end of the chunk (None without the chunk), the
+        profile with --profile and run_stats()."""
+    start = time.time_ns()
+    if args.decompress_threads:
+        decompress.THREADS = args.decompress_threads
+    tracker = get_tracker(args, worker_id)
+    if isinstance(chunk, archive.Members):
+        (lines, errors) = process_archive(args, tracker, fname, chunk.names)
+        tracker.flush()
+        elapsed = time.time_ns() - start
+        return (fname, lines, errors, chunk.size, elapsed, None,
+                take_profile(tracker, fname, chunk.size, lines, errors, elapsed),
+                run_stats(tracker))
+    resume = [None]
+    on_end = None
+    if chunk:
+        on_end = lambda tr, fmeta: resume.append(chunk.resume_point(tr, fmeta))
+    (lines, errors) = trcparser.process_file(tracker, fname, args.orphans, chunk, on_end=on_end)
+    tracker.flush()
+    elapsed = time.time_ns() - start
+    (size, lines) = (os.path.getsize(fname), lines)
+    if chunk:
+        (size, lines) = (chunk.end - chunk.start, lines - chunk.line)
+    return (fname, lines, errors, size, elapsed, resume[-1],
+            take_profile(tracker, fname, size, lines, errors, elapsed),
+            run_stats(tracker))
+
+def process_archive(args, tracker, fname, names=None, verbose=False) -> tuple:
+    """Processes members of the archive: the ones in names, or the ones that match
+        --member-glob. Returns line and error count."""
+    (lines, errors) = (0, 0)
+    for (name, trace) in archive.iter_members(fname, names, args.member_glob):
+        if verbose:
+            print(f"   processing member {name}")
+        (member_lines, member_errors) = trcparser.process_file(tracker, name, args.orphans,
+                                                                trace=trace)
+        lines += member_lines
+        errors += member_errors
+    return (lines, errors)
+
+def plan_tasks(args, manifest: Optional[Manifest] = None) -> list[tuple]:
+    """Splits the work into tasks: (file name, chunk, size). Large uncompressed files are
+        split into chunks if --split-size is set. Members of the archives are split between the
+        tasks, chunk is archive.Members then. With the manifest, unchanged files are skipped
+        and uncompressed files that have grown are processed from the committed offset, up to
+        the last complete line, in chunks of COMMIT_SIZE without --split-size. The last chunk,
+        the tail, starts at the last "=====" edge."""
+    tasks = []
+    split_size = args.split_size * 1024 * 1024
+    for fname in args.trace_files:
+        size = os.path.getsize(fname)
+        if manifest is not None and (first := manifest.resume_point(fname)) is None:
+            print(f"skipping {fname}, not changed since the last run")
+            continue
+        if archive.archive_type(fname) is not None:
+            if manifest is not None:
+                manifest.plan(fname, size)
+            for members in archive.plan_members(fname, args.member_glob, args.jobs):
+                tasks.append((fname, members, members.size))
+            continue
+        mapped = trcparser.get_opener(fname) is trcparser.MappedFile
+        if manifest is not None and mapped:
+            end = trcsplit.last_line_end(fname)
+            if end <= first.start:
+                print(f"skipping {fname}, no complete lines since the last run")
+                continue
+            manifest.plan(fname, end)
+            chunks = trcsplit.plan_chunks(fname, split_size or COMMIT_SIZE, first, end,
+                                          last_edge=True)
+            tasks.extend((fname, chunk, chunk.end - chunk.start) for chunk in chunks)
+            continue
+        if manifest is not None:
+            manifest.plan(fname, size)
+        if split_size and size > 2 * split_size and mapped:
+            for chunk in trcsplit.plan_chunks(fname, split_size):
+                tasks.append((fname, chunk, chunk.end - chunk.start))
+        else:
+            tasks.append((fname, None, size))
+    return tasks
+
+def run_tasks(args, tasks: list[tuple], first_id: int = 0):
+    """Yields (worker_id, result of process_one()) for the tasks. With --jobs tasks are fanned
+        out to the process pool, largest first. Task gets worker_id first_id + its index."""
+    if args.jobs <= 1:
+        for (worker_id, (fname, chunk, _)) in enumerate(tasks, first_id):
+            yield (worker_id, process_one(args, fname, worker_id, chunk))
+        return
+    order = sorted(enumerate(tasks, first_id), key=lambda t: t[1][2], reverse=True)
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(process_one, args, fname, worker_id, chunk): worker_id
+                        for (worker_id, (fname, chunk, _)) in order}
+        for future in as_completed(futures):
+            yield (futures[future], future.result())
+
+def process_tasks(args, manifest: Optional[Manifest] = None) -> None:
+    """Processes files (or chunks) as independent tasks, every task has its own tracker and
+        backend. With the manifest, every task writes into its own slot. Chunks of the file are
+        committed into the manifest in the file order, as soon as the chunks before them are
+        done, the tail with the last one. Files without the resume point are committed when all
+        their tasks are done."""
+    first_slot = 0
+    if manifest is not None:
+        for fname in manifest.clean_pending():
+            print(f"removed output of the interrupted run: {fname}")
+    tasks = plan_tasks(args, manifest)
+    if manifest is not None:
+        first_slot = manifest.reserve(len(tasks))
+    slots = defaultdict(list)
+    chunks = {}
+    for (slot, (fname, chunk, _)) in enumerate(tasks, first_slot):
+        slots[fname].append(slot)
+        chunks[slot] = chunk
+    # {slot: (resume point, lines)} of the finished tasks, and {file: tasks committed}
+    done = {}
+    committed = defaultdict(int)
+    file_lines = defaultdict(int)
+    profiles = defaultdict(list)
+
+    no_files = len(tasks)
+    fcount = 1
+    cumul_lines = 0
+    cumul_errors = 0
+    cumul_bytes = 0
+    start_time = time.time_ns()
+    stats = []
+    for (slot, (fname, lines, errors, size, elapsed, resume, profile, run)) in run_tasks(
+            args, tasks, first_slot):
+        cumul_lines += lines
+        cumul_errors += errors
+        cumul_bytes += size
+        stats.append(run)
+        print(f"[{fcount}/{no_files}] processed file {fname}")
+        print(f"   -> {lines} lines, {int(elapsed/1000000000)} seconds"
+              + (f", {run['evicted']} cursors evicted" if run['evicted'] else ''))
+        fcount += 1
+        if profile is not None:
+            profiles[fname].append(profile)
+        if manifest is None:
+            continue
+        done[slot] = (resume, lines)
+        (first, end) = (committed[fname], committed[fname])
+        while end < len(slots[fname]) and slots[fname][end] in done:
+            end += 1
+        finished = slots[fname][first:end]
+        last = done[finished[-1]][0] if finished else None
+        if not finished or (last is None and end < len(slots[fname])):
+            continue
+        committed[fname] = end
+        file_lines[fname] += sum(done[s][1] for s in finished)
+        if last is None:
+            manifest.commit(fname, finished, None, file_lines[fname])
+        elif end < len(slots[fname]):
+            manifest.commit(fname, finished, last, last.line)
+        else:
+            # Tail ends inside a span, the file is committed at its start
+            tail = finished.pop()
+            start = replace(chunks[tail], end=chunks[tail].start)
+            manifest.commit(fname, finished, start, start.line, [tail])
+
+    elapsed = max((time.time_ns() - start_time)/1000000000, 1e-9)
+    print(f"Processed {cumul_lines} lines in {int(elapsed)} seconds, with {cumul_errors} errors, "
+            +f"{args.jobs} jobs")
+    print(f"Throughput: {int(cumul_lines/elapsed)} lines/s, "
+            +f"{cumul_bytes/elapsed/1000000:.1f} MB/s")
+    print_pipeline(stats)
+    if args.profile:
+        # Chunks of the file are summed up
+        write_profile(args, [instrumentation.merge(p, fname) for (fname, p) in profiles.items()],
+                      elapsed)
+
+def follow_file(args) -> None:
+    """Follows the trace file that is being written, until interrupted or idle timeout."""
+    tracker = get_tracker(args)
+    fname = args.trace_files[0]
+    print(f"following file {fname}")
+    start = time.time_ns()
+    (lines, errors) = (0, 0)
+    try:
+        (lines, errors) = trcparser.follow_file(tracker, fname, args.orphans,
+                                flush_interval=args.flush_interval,
+                                flush_lines=args.flush_lines, idle_timeout=args.follow_idle)
+    except KeyboardInterrupt:
+        print("interrupted")
+    tracker.flush()
+    elapsed = time.time_ns() - start
+    print(f"Processed {lines} lines in {int(elapsed/1000000000)} "
+            +f"seconds, with {errors} errors")
+    print_pipeline([run_stats(tracker)])
+    if args.profile:
+        write_profile(args, [take_profile(tracker, fname, os.path.getsize(fname), lines, errors,
+                                          elapsed)], elapsed/1e9)
+
 def process_files(args) -> None:
-    backend = get_backend(args)
-    tracker = CallTracker(backend)
+    if args.decompress_threads:
+        decompress.THREADS = args.decompress_threads
+    if args.follow:
+        follow_file(args)
+        return
+    manifest = get_manifest(args)
+    if args.jobs > 1 or manifest is not None:
+        process_tasks(args, manifest)
+        return
+    tracker = get_tracker(args)
 
     no_files = len(args.trace_files)
     fcount = 1
     cumul_lines = 0
     cumul_errors = 0
+    profiles = []
     start_time = time.time_ns()
     for fname in args.trace_files:
         print(f"[{fcount}/{no_files}] processing file {fname}")
         start = time.time_ns()
-        (lines, errors) = trcparser.process_file(tracker, fname, args.orphans)
+        if archive.archive_type(fname) is not None:
+            (lines, errors) = process_archive(args, tracker, fname, verbose=True)
+        else:
+            (lines, errors) = trcparser.process_file(tracker, fname, args.orphans)
         cumul_lines += lines
         cumul_errors += errors
+        if fcount == no_files:
+            # Last spans and writes go to the last file
+            tracker.flush()
+        if tracker.profiler is not None:
+            profiles.append(take_profile(tracker, fname, os.path.getsize(fname), lines, errors,
+                                         time.time_ns() - start))
         fcount += 1
         print(f"   -> {lines} lines, {int((time.time_ns() - start)/1000000000)} seconds")
 
-    tracker.flush()
-    print(f"Processed {cumul_lines} lines in {int((time.time_ns() - start_time)/1000000000)} "
+    elapsed = time.time_ns() - start_time
+    print(f"Processed {cumul_lines} lines in {int(elapsed/1000000000)} "
             +f"seconds, with {cumul_errors} errors")
+    if any(tracker.evictions.values()):
+        print(f"Evicted {tracker.evictions['idle']} idle and {tracker.evictions['lru']} least "
+              + "recently used cursors")
+    print_pipeline([run_stats(tracker)])
+    if args.profile:
+        write_profile(args, profiles, elapsed/1e9)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=__doc__)
@@ -71,6 +385,146 @@ if __name__ == '__main__':
                     help="Parameter that service uses to pass the trace_id to the database")
     parser.add_argument('--log-orphans', type=bool, default = False, dest='orphans',
                     help="Logs lines not matched by the parser")
+    parser.add_argument('-j', '--jobs', type=int, default = 1, dest='jobs',
+                    help="Number of worker processes. Every file is processed by one worker "
+                    +"that writes its own Parquet files, parquet backend only. Default: 1")
+    parser.add_argument('--split-size', type=int, default = 0, dest='split_size',
+                    help="With --jobs, uncompressed files larger than twice the split size are "
+                    +"split into chunks of roughly this many megabytes, and chunks are parsed "
+                    +"in parallel. Default: 0, files are not split")
+    parser.add_argument('--engine', type=str, default = 'ops', dest='engine',
+                    choices=['ops', 'columnar'],
+                    help="Ingestion engine. columnar skips the per-line Ops objects and writes "
+                    +"fields straight into column buffers, works only with the parquet backend. "
+                    +"Default: ops")
+    parser.add_argument('--ingest-profile', type=str, default = 'full', dest='ingest_profile',
+                    choices=list(PROFILES),
+                    help="What is captured from the trace files. full: everything. latency: "
+                    +"calls, waits and SQL text, BINDS and STAT are skipped and waits have no "
+                    +"raw text. plans: like latency, but with STAT. Default: full")
+    parser.add_argument('--bind-sample', type=float, default = None, dest='bind_sample',
+                    help="Keeps BINDS of the deterministic sample of spans, fraction between 0 "
+                    +"and 1, whatever the ingest profile. Default: profile decides")
+    parser.add_argument('--profile', type=str, nargs='?', default = None, const='-',
+                    dest='profile', metavar='FILE',
+                    help="Writes the JSON report with bytes, lines/s, time per stage (decompression, "
+                    +"tokenizer, ops, CallTracker, backend, Parquet writing) and records per type, "
+                    +"per file and in total, into FILE. Without FILE the report goes to stdout")
+    parser.add_argument('--max-cursors', type=int, default = None, dest='max_cursors',
+                    help="Most cursors with the open span in one session. Spans of the least "
+                    +"recently used cursors over the limit are written out early, memory use "
+                    +"doesn't grow with the number of cursors. Default: 0, no limit, with "
+                    +f"--follow {FOLLOW_MAX_CURSORS}")
+    parser.add_argument('--idle-gap', type=float, default = None, dest='idle_gap',
+                    help="Writes out the open span of the cursor that hasn't been used for that "
+                    +"many seconds of trace time (tim). Default: 0, spans stay open until the "
+                    +f"cursor is used again or the ===== line, with --follow {FOLLOW_IDLE_GAP}")
+    parser.add_argument('--pipeline-depth', type=int, default = 0, dest='pipeline_depth',
+                    help="With the parquet backend, spans are turned into Arrow tables in the "
+                    +f"encoder thread. They are passed there in batches of {pipeline.BATCH_SPANS} "
+                    +"spans, through the queue of that many batches. When the queue is full, "
+                    +f"the parser waits. {pipeline.QUEUE_DEPTH} is a good start. Default: 0, "
+                    +"spans are encoded in the parser thread")
+    parser.add_argument('--histogram-digits', type=int, default = histograms.DIGITS,
+                    dest='histogram_digits',
+                    help="Precision of the latency histograms written with the parquet backend, "
+                    +"in significant figures, 1-5. Every digit gives about ten times more "
+                    +f"buckets. Default: {histograms.DIGITS}")
+    parser.add_argument('--row-group-size', type=int, default = 262144, dest='row_group_size',
+                    help="Rows in one Parquet row group. Rows are buffered and written a row "
+                    +"group at a time, memory use of the parquet backend is a couple of row "
+                    +"groups. Default: 262144")
+    parser.add_argument('--file-size', type=float, default = 256, dest='file_size',
+                    help="Parquet file is closed and the next one started when it grows over "
+                    +"that many megabytes. Default: 256")
+    parser.add_argument('--compression', type=str, default = 'zstd', dest='compression',
+                    choices=('zstd', 'lz4', 'snappy', 'gzip', 'brotli', 'none'),
+                    help="Parquet compression codec. Default: zstd")
+    parser.add_argument('--compression-level', type=int, default = None,
+                    dest='compression_level',
+                    help="Level of the codec, zstd goes up to 22, gzip up to 9, snappy has no "
+                    +"levels. Default: the default of the codec")
+    parser.add_argument('--column-compression', type=str, default = '',
+                    dest='column_compression',
+                    help="Per column codecs, overriding --compression: comma separated list of "
+                    +"column=codec[:level], like 'event_raw=zstd:9,ops=none'")
+    parser.add_argument('--partition-by', type=str, default = '', dest='partition_by',
+                    help="Writes the Parquet files in the hive partitioned layout, "
+                    +"<dbdir>/date=.../hour=.../<file>, partitioned by the comma separated list "
+                    +"of date, hour, service_name, client_id, module and action, like "
+                    +"'date,hour,service_name'. Rows of the span go to the partition of its "
+                    +"start. summary.py prunes the partitions with the --start, --end and "
+                    +"--client_id filters. Default: flat layout")
+    parser.add_argument('-f', '--follow', action='store_true', dest='follow',
+                    help="Follows the trace file that is being written, like tail -f. Handles "
+                    +"rotation and truncation. Processed spans are flushed to the backend "
+                    +"every --flush-interval seconds or --flush-lines lines, as row groups of "
+                    +"the open Parquet files")
+    parser.add_argument('--flush-interval', type=float, default = 5.0, dest='flush_interval',
+                    help="With --follow, seconds between the flushes. Default: 5")
+    parser.add_argument('--flush-lines', type=int, default = 100000, dest='flush_lines',
+                    help="With --follow, lines between the flushes. Default: 100000")
+    parser.add_argument('--roll-interval', type=float, default = 300, dest='roll_interval',
+                    help="With --follow, Parquet files are closed after that many seconds, or "
+                    +"when they grow over --file-size. Rows are visible to the readers once the "
+                    +"file is closed. Default: 300")
+    parser.add_argument('--follow-idle', type=float, default = 0, dest='follow_idle',
+                    help="With --follow, stops if the file hasn't grown for that many seconds. "
+                    +"Default: 0, follows until interrupted")
+    parser.add_argument('--member-glob', type=str, default = None, dest='member_glob',
+                    help="Trace files can be tar, tar.gz, tar.bz2, tar.xz, tar.zst or zip archives. "
+                    +"Processes only the members that match the glob, like '*_ora_*.trc'. "
+                    +"Default: all members")
+    parser.add_argument('--decompress-threads', type=int, default = 0, dest='decompress_threads',
+                    help="Threads that decompress one compressed file. Multi-member gzip, "
+                    +"multi-stream bzip2 and xz, and multi-frame zstd files are decompressed in "
+                    +f"parallel. Default: {decompress.THREADS}")
+    parser.add_argument('--manifest', action='store_true', dest='manifest',
+                    help="Keeps the ingestion manifest in the output directory: files that "
+                    +"haven't changed since the last run are skipped, and only the new tail of "
+                    +"the growing files is processed. Output files are named "
+                    +"<prefix>.<slot>.<n>. Parquet backend only")
 
     arguments = parser.parse_args()
+    if arguments.bind_sample is not None and not 0 <= arguments.bind_sample <= 1:
+        parser.error('--bind-sample has to be between 0 and 1')
+    if arguments.follow:
+        if arguments.max_cursors == 0 or arguments.idle_gap == 0:
+            parser.error('--follow needs a limit, --max-cursors and --idle-gap can not be 0')
+        if arguments.max_cursors is None:
+            arguments.max_cursors = FOLLOW_MAX_CURSORS
+        if arguments.idle_gap is None:
+            arguments.idle_gap = FOLLOW_IDLE_GAP
+    if arguments.max_cursors is None:
+        arguments.max_cursors = 0
+    if arguments.idle_gap is None:
+        arguments.idle_gap = 0
+    if arguments.max_cursors < 0 or arguments.idle_gap < 0 or arguments.pipeline_depth < 0:
+        parser.error('--max-cursors, --idle-gap and --pipeline-depth can not be negative')
+    if arguments.row_group_size < 1 or arguments.file_size <= 0:
+        parser.error('--row-group-size and --file-size have to be positive')
+    if arguments.roll_interval <= 0:
+        parser.error('--roll-interval has to be positive')
+    if arguments.db == 'parquet':
+        from backend.arrow import parse_column_compression, parse_partition_by
+        try:
+            parse_column_compression(arguments.column_compression)
+        except ValueError as ex:
+            parser.error(f'--column-compression: {ex}')
+        try:
+            parse_partition_by(arguments.partition_by)
+        except ValueError as ex:
+            parser.error(f'--partition-by: {ex}')
+        if arguments.compression_level is not None and arguments.compression in ('snappy', 'none'):
+            parser.error(f'--compression {arguments.compression} has no levels')
+    if not 1 <= arguments.histogram_digits <= 5:
+        parser.error('--histogram-digits has to be between 1 and 5')
+    if arguments.engine == 'columnar' and arguments.db != 'parquet':
+        parser.error('--engine columnar works only with the parquet backend')
+    if arguments.jobs > 1 and arguments.db != 'parquet':
+        # Only the parquet backend keeps the span ids of the workers apart
+        parser.error('--jobs works only with the parquet backend')
+    if arguments.follow and (len(arguments.trace_files) != 1 or arguments.jobs > 1
+                                or archive.archive_type(arguments.trace_files[0]) is not None):
+        parser.error('--follow takes exactly one trace file, and no --jobs')
     process_files(arguments)
@@ -1,63 +1,44 @@
-import bz2
 import collections
-import datetime
 from enum import Enum
 import fnmatch
-import gzip
-import lzma
-import re
+import functools
+import itertools
+import mmap
+import os
+import time
 from sys import exception
 from traceback import print_exception
 from typing import Optional
-from zoneinfo import ZoneInfo
 import filetype
 
-from ops import ops_factory, Ops
+from decompress import DecompressedFile, MIME_TYPES
+from ops import Ops
+from timestamp import TimestampParser
+import tokenizer
+from tokenizer import tokenize, to_str, PIC_MATCHER
 
 __doc__ = '''Parser for the SQL trace files. '''
 
-RES_MATCHER = re.compile(r'''^(={21})''')
-PIC_MATCHER = re.compile(r'''^END OF STMT(.*)''')
-
-# 2023-05-19T05:28:00.339263+02:00
-DATE_MATCHER = re.compile(r'''^\*{3} (\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}\+\d\d:\d\d)''')
-TIMEZONE_MATCHER = re.compile(r'''(?:.*)\+(\d\d:\d\d)''')
-
-STARS_MATCHER = re.compile(r'''^\*\*\* (SESSION ID:|CLIENT ID:|SERVICE NAME:|MODULE NAME:'''
-        +r'''|ACTION NAME:|CLIENT DRIVER:|CONTAINER ID:|CLIENT IP:|CONNECTION ID:)(\(.*\)) (.*)''')
-CALL_MATCHER = re.compile(r'''^(PARSE|EXEC|FETCH|WAIT|CLOSE|STAT|ERROR|PARSING IN CURSOR|BINDS|PARSE ERROR) (#\d+)(:| )(.*)''')
-XLOB_MATCHER = re.compile(r'''^(LOB[A-Z]+|XCTEND):* (.*)''')
-
-FILE_HEADER_MATCHER = re.compile(r'''^(Build label|ORACLE_HOME|System name'''
-                        +r'''|Node name|Release|Version|Machine|CLID|Instance name'''
-                        +r'''|Instance number|Database name|Database unique name'''
-                        +r'''|Database unique id'''
-                        +r'''|Redo thread mounted by this instance|Oracle process number'''
-                        +r'''|Unix process pid):\s+(.*)''')
-
-def get_timestamp(instr) -> datetime.datetime:
-    """Checks if input has a time zone or not, and adjusts the format accordingly."""
-    tz_match = TIMEZONE_MATCHER.match(instr)
-    if tz_match:
-        date_format = '%Y-%m-%dT%H:%M:%S.%f%z'
-    else:
-        date_format = '%Y-%m-%dT%H:%M:%S.%f'
-    return datetime.datetime.strptime(instr, date_format).astimezone(tz=ZoneInfo('UTC'))
+# Timestamps of the *** lines, see timestamp.py
+get_timestamp = TimestampParser()
 
 def get_opener(fname):
-    """Tries to guess the file type and returns corresponding open function."""
+    """Tries to guess the file type and returns corresponding open function. Compressed files
+        are decompressed in the background threads, see decompress.py. Members of the archives
+        are named 'archive!member', see archive.py."""
+    if not os.path.exists(fname):
+        # archive.py uses MappedFile
+        import archive
+        if archive.split_name(fname) is not None:
+            return archive.open_member
     match filetype.guess(fname):
         case None if fnmatch.fnmatch(fname, '*.lzma'):
             # Filetype does not recognize legacy lzma?
-            return lzma.open
+            return functools.partial(DecompressedFile, fmt='lzma')
         case None:
-            return open
-        case ft if ft.mime == 'application/gzip':
-            return gzip.open
-        case ft if ft.mime == 'application/x-bzip2':
-            return bz2.open
-        case ft if ft.mime == 'application/x-xz':
-            return lzma.open
+            return MappedFile
+        case ft if ft.mime in MIME_TYPES:
+            return functools.partial(DecompressedFile, fmt=MIME_TYPES[ft.mime])
         case other_type :
             raise RuntimeError(f"Unsupported file type {other_type}")
 
@@ -67,11 +48,12 @@ class ParserState(Enum):
     BINDS = 1 # BINDS and PARSE ERROR do not have a end marker
     PARSE_ERROR = 2
     PIC = 3 # PARSING IN CURSOR is a multi-line event with end marker
+    SKIP = 4 # BINDS that is not captured by the ingest profile
 
 def ex_helper(line, line_count):
     """Logs errors from lower layers"""
     print(f"Got exception whole handling the line, ignoring. Offending line #{line_count}:")
-    print(line)
+    print(to_str(line))
     print_exception(exception())
 
 def init_fmeta(file_name: str) -> collections.defaultdict():
@@ -85,17 +67,178 @@ def init_fmeta(file_name: str) -> collections.defaultdict():
     fmeta['LINE_COUNT'] = 0
     return fmeta
 
-def process_file(tracker, fname, orphans=False) -> collections.defaultdict():
-    """The god function. Does everything: reads the input file and parses the lines. """
+class MappedFile:
+    """Uncompressed trace file mapped to the memory. Iterating over it gives lines as bytes,
+        copied straight from the page cache instead of going through the read buffers. Start and
+        end limit the iteration to the byte range, start has to be at the start of a line.
+        Has the same signature as the open functions returned by get_opener()."""
+    def __init__(self, fname: str, mode: str = 'rb', start: int = 0,
+                    end: Optional[int] = None) -> None:
+        if mode != 'rb':
+            raise ValueError(f"MappedFile: unsupported mode {mode}")
+        self.buf = None
+        with open(fname, 'rb') as fdesc:
+            # Empty file can't be mapped
+            if os.fstat(fdesc.fileno()).st_size > 0:
+                self.buf = mmap.mmap(fdesc.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buf is not None and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self.buf.madvise(mmap.MADV_SEQUENTIAL)
+        self.start = start
+        self.end = end
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc) -> None:
+        self.close()
+    def close(self) -> None:
+        if self.buf is not None:
+            self.buf.close()
+    def __iter__(self):
+        if self.buf is None:
+            return iter(())
+        self.buf.seek(self.start)
+        if self.end is None or self.end >= len(self.buf):
+            return iter(self.buf.readline, b'')
+        return self._range()
+    def _range(self):
+        (readline, tell) = (self.buf.readline, self.buf.tell)
+        while tell() < self.end:
+            yield readline()
+
+class FollowFile:
+    """Follows the trace file that is being written, like tail -f. Yields complete lines as they
+        appear, and calls flush() when flush_interval seconds or flush_lines lines have passed
+        since the last flush. Iteration stops when the file is truncated or rotated (replaced by
+        another file with the same name), reopened is set then. Without the new data for
+        idle_timeout seconds iteration stops too, 0 means follow forever."""
+    def __init__(self, fname: str, flush=None, flush_interval: float = 5.0,
+                    flush_lines: int = 100000, poll_interval: float = 0.2,
+                    idle_timeout: float = 0) -> None:
+        self.fname = fname
+        self.flush = flush
+        self.flush_interval = flush_interval
+        self.flush_lines = flush_lines
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.reopened = False
+        self.fdesc = None
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc) -> None:
+        self.close()
+    def close(self) -> None:
+        if self.fdesc is not None:
+            self.fdesc.close()
+            self.fdesc = None
+    def _open(self) -> bool:
+        try:
+            self.fdesc = open(self.fname, 'rb')
+        except FileNotFoundError:
+            return False
+        return True
+    def _replaced(self) -> bool:
+        """Checks if the file was rotated or truncated."""
+        try:
+            stat = os.stat(self.fname)
+        except FileNotFoundError:
+            # Rotated away, new file isn't there yet
+            return False
+        return (stat.st_ino != os.fstat(self.fdesc.fileno()).st_ino
+                or stat.st_size < self.fdesc.tell())
+    def __iter__(self):
+        last_data = last_flush = time.monotonic()
+        lines = 0
+        partial = b''
+        while True:
+            if self.fdesc is not None and (line := self.fdesc.readline()):
+                last_data = time.monotonic()
+                if line[-1:] != b'\n':
+                    # Line is not written completely yet
+                    partial += line
+                    continue
+                yield partial + line
+                partial = b''
+                lines += 1
+                if lines >= self.flush_lines or last_data - last_flush >= self.flush_interval:
+                    (lines, last_flush) = (0, self._flush())
+                continue
+            now = time.monotonic()
+            if lines and now - last_flush >= self.flush_interval:
+                (lines, last_flush) = (0, self._flush())
+            if self.fdesc is None:
+                self._open()
+            elif self._replaced():
+                if partial:
+                    yield partial
+                self.reopened = True
+                return
+            if self.idle_timeout and now - last_data >= self.idle_timeout:
+                if partial:
+                    yield partial
+                return
+            time.sleep(self.poll_interval)
+    def _flush(self) -> float:
+        if self.flush:
+            self.flush()
+        return time.monotonic()
+
+def follow_file(tracker, fname, orphans=False, **kwargs) -> tuple:
+    """Follows the trace file, see FollowFile for the kwargs. Processed spans are flushed to the
+        backend on the time or size budget. After rotation or truncation the new file is
+        processed from the start. Returns line and error count, like process_file."""
+    total = (0, 0)
+    # Parquet backend writes a row group and keeps the files open
+    flush = getattr(tracker.db, 'write_row_group', tracker.db.flush)
+    while True:
+        with FollowFile(fname, flush, **kwargs) as trace:
+            (lines, errors) = process_file(tracker, fname, orphans, trace=trace)
+        total = (total[0] + lines, total[1] + errors)
+        if not trace.reopened:
+            return total
+        # New file, cursors of the old one are gone
+        tracker.flush()
+
+def crlf_lines(trace):
+    """Lines are read in binary mode, without universal newlines. Translates CRLF line endings
+        to LF if the first line ends with CRLF."""
+    trace = iter(trace)
+    first = next(trace, None)
+    if first is None:
+        return iter(())
+    lines = itertools.chain((first,), trace)
+    if first.endswith(b'\r\n'):
+        return (line[:-2] + b'\n' if line.endswith(b'\r\n') else line for line in lines)
+    return lines
+
+def process_file(tracker, fname, orphans=False, chunk=None,
+                    trace=None, on_end=None) -> collections.defaultdict():
+    """The god function. Does everything: reads the input file and parses the lines.
+        Lines are processed as bytes, only the fields that are persisted as strings are decoded.
+        If chunk (trcsplit.Chunk) is set, only that part of the file is processed, starting
+        from the parser state recorded in the chunk. If trace is set, lines are read from it
+        instead of opening the file, like FollowFile does. on_end(tracker, file_meta) is called
+        at the end of the input, before the tracker is flushed. Records that the ingest profile
+        of the tracker doesn't capture are skipped without creating the ops."""
 
     parser_state: int = ParserState.NOC
     ops: Optional[Ops] = None
 
     error_count: int = 0
     file_meta = init_fmeta(fname)
-    opener = get_opener(fname)
-    with opener(fname, 'rt', encoding='utf_8') as trace:
-        for (file_meta['LINE_COUNT'], line) in enumerate(trace, 1):
+    profile = tracker.profile
+    (checked, no_raw) = (profile.checked, profile.no_raw)
+    profiler = tracker.profiler
+    tokenize_line = tokenize if profiler is None else profiler.timed('tokenize', tokenize)
+    first_line = 1
+    if trace is not None:
+        trace_cm = trace
+    elif chunk:
+        chunk.seed(tracker, file_meta)
+        first_line = chunk.line + 1
+        trace_cm = MappedFile(fname, 'rb', chunk.start, chunk.end)
+    else:
+        trace_cm = get_opener(fname)(fname, 'rb')
+    with trace_cm as trace:
+        for (file_meta['LINE_COUNT'], line) in enumerate(crlf_lines(trace), first_line):
 
             # Skip the first 3 lines
             if file_meta['LINE_COUNT'] < 4:
@@ -105,13 +248,23 @@ def process_file(tracker, fname, orphans=False) -> collections.defaultdict():
             if len(line) < 2:
                 continue
 
-            if parser_state == ParserState.BINDS and line.startswith(' '):
+            if parser_state == ParserState.BINDS and line.startswith(b' '):
                 ops.add_line(line)
                 continue
+            if parser_state == ParserState.SKIP and line.startswith(b' '):
+                continue
 
-            if (m := CALL_MATCHER.match(line)) is not None:
+            token = tokenize_line(line)
+            kind = token[0] if token else None
 
-                match m.group(1):
+            if kind == tokenizer.CALL:
+                (_, op_type, cursor, params) = token
+                if op_type in checked and not profile.captured(op_type, file_meta['FILE_NAME'],
+                                                                file_meta['LINE_COUNT']):
+                    parser_state = ParserState.SKIP if op_type == 'BINDS' else ParserState.NOC
+                    ops = None
+                    continue
+                match op_type:
                     case 'BINDS':
                         parser_state = ParserState.BINDS
                     case 'PARSE ERROR':
@@ -123,20 +276,22 @@ def process_file(tracker, fname, orphans=False) -> collections.defaultdict():
                         ops = None
 
                 try:
-                    ops = ops_factory(m.group(1), m.group(2), m.group(4), file_meta,
-                                        tracker.time_tracker.get_wc)
+                    ops = tracker.ops_factory(op_type, cursor, params, file_meta,
+                                        tracker.time_tracker.get_ts)
                 except (IndexError, ValueError):
                     print(f"process_file: ops = {ops}")
                     ex_helper(line, file_meta['LINE_COUNT'])
                     error_count += 1
                     continue
+                if op_type in no_raw:
+                    ops.drop_raw()
                 try:
                     # This throws error if cursor in STAT is malformed
-                    tracker.add_ops(m.group(2), ops)
+                    tracker.add_ops(cursor, ops)
                 except ValueError:
                     ex_helper(line, file_meta['LINE_COUNT'])
                     error_count += 1
-                    if m.group(1) in ('STAT', 'BINDS'):
+                    if op_type in ('STAT', 'BINDS'):
                         continue
                     raise
                 continue
@@ -152,48 +307,47 @@ def process_file(tracker, fname, orphans=False) -> collections.defaultdict():
                         ops.add_line(line)
                     continue
 
-
-            if (m := XLOB_MATCHER.match(line)) is not None:
-                try:
-                    lob = ops_factory(m.group(1), None, m.group(2), file_meta,
-                                    tracker.time_tracker.get_wc)
-                except (IndexError, ValueError):
-                    ex_helper(line, file_meta['LINE_COUNT'])
-                    error_count += 1
+            match token:
+                case (tokenizer.XLOB, op_type, params):
+                    try:
+                        lob = tracker.ops_factory(op_type, None, params, file_meta,
+                                        tracker.time_tracker.get_ts)
+                    except (IndexError, ValueError):
+                        ex_helper(line, file_meta['LINE_COUNT'])
+                        error_count += 1
+                        continue
+                    tracker.db.add_ops(tracker.db.get_span_id(), None, [lob])
+                    continue
+                # '=====================' starts new tracing span
+                case (tokenizer.RES,):
+                    tracker.reset()
+                    continue
+                case (tokenizer.DATE, timestamp):
+                    ts2 = get_timestamp(timestamp)
+                    tracker.time_tracker.reset(ts2)
+                    dt = tracker.ops_factory('STAR', None, None, file_meta, lambda x: None,
+                                        'DATETIME', ts2)
+                    tracker.db.add_ops(tracker.db.get_span_id(), None, [dt])
+                    continue
+                case (tokenizer.STARS, name, value, timestamp):
+                    ts2 = get_timestamp(timestamp)
+                    file_meta[name] = value
+                    tracker.time_tracker.reset(ts2)
+                    star = tracker.ops_factory('STAR', None, value, file_meta, lambda x: None,
+                                                name, ts2)
+                    tracker.db.add_ops(tracker.db.get_span_id(), None, [star])
+                    continue
+                case (tokenizer.HEADER, name, value):
+                    header = tracker.ops_factory('HEADER', None, value, file_meta,
+                                            lambda x: None, name, None)
+                    tracker.db.add_ops(tracker.db.get_span_id(), None, [header])
                     continue
-                tracker.db.add_ops(tracker.db.get_span_id(), None, [lob])
-                continue
-
-            # '=====================' starts new tracing span
-            if (m := RES_MATCHER.match(line)) is not None:
-                tracker.reset()
-                continue
-
-            if (m := DATE_MATCHER.match(line)) is not None:
-                ts2 = get_timestamp(m.group(1))
-                tracker.time_tracker.reset(ts2)
-                dt = ops_factory('STAR', None, None, file_meta, lambda x: None,
-                                    'DATETIME', ts2)
-                tracker.db.add_ops(tracker.db.get_span_id(), None, [dt])
-                continue
-
-            if (m := STARS_MATCHER.match(line)) is not None:
-                ts2 = get_timestamp(m.group(3))
-                name = m.group(1).strip(':')
-                value = m.group(2).strip('()')
-                file_meta[name] = value
-                tracker.time_tracker.reset(ts2)
-                star = ops_factory('STAR', None, value, file_meta, lambda x: None, name, ts2)
-                tracker.db.add_ops(tracker.db.get_span_id(), None, [star])
-                continue
-
-            if (m := FILE_HEADER_MATCHER.match(line)) is not None:
-                header = ops_factory('HEADER', None, m.group(2), file_meta,
-                                        lambda x: None, m.group(1), None)
-                tracker.db.add_ops(tracker.db.get_span_id(), None, [header])
-                continue
 
             if orphans:
-                print(f"non-matching line: {line}")
+                print(f"non-matching line: {to_str(line)}")
+        if profiler is not None:
+            profiler.add_source(trace)
 
+    if on_end:
+        on_end(tracker, file_meta)
     return (file_meta['LINE_COUNT'], error_count)
@@ -0,0 +1,174 @@
+from dataclasses import dataclass, field, replace
+import datetime
+import mmap
+import os
+import re
+from typing import Optional
+from tokenizer import CALL_MATCHER, DATE_MATCHER, STARS_MATCHER, to_str
+from trcparser import get_timestamp
+
+__doc__ = '''Splits large uncompressed trace files into chunks that can be parsed independently.
+    Chunks start at the "=====================" lines, where CallTracker is reset anyway. State
+    that crosses the chunk edge (sql_id's of the cursors, session parameters from the *** lines,
+    wall clock and line number) is collected by the cheap scan of the file and recorded in the
+    chunk.'''
+
+RES_MARKER = b'\n' + b'=' * 21
+# Lines that change the state carried over the chunk edge
+STATE_MATCHER = re.compile(rb'\n(PARSING IN CURSOR |\*\*\* )')
+TIM_MATCHER = re.compile(rb'tim=(\d+)')
+SQLID_MATCHER = re.compile(rb'''(?:^| )sqlid=(\S*)''')
+# How far back we look for the call that could make chunk edge unsafe
+MAX_LOOKBACK = 1000
+
+@dataclass
+class Chunk:
+    """Byte range of the trace file and parser state at the start of it."""
+    start: int
+    end: int
+    # Number of lines before the start of the chunk
+    line: int = 0
+    # {cursor handle: sql_id}
+    cursors: dict = field(default_factory=dict)
+    # Session level parameters from the *** lines
+    fmeta: dict = field(default_factory=dict)
+    wall_clock: Optional[datetime.datetime] = None
+    first_tim: Optional[int] = None
+    # Latest tim before the start, lines without tim get the reading of it
+    current_tim: Optional[int] = None
+
+    def seed(self, tracker, file_meta) -> None:
+        """Restores the state in the tracker and file metadata."""
+        tracker.cursors.update(self.cursors)
+        tracker.time_tracker.reset(self.wall_clock)
+        tracker.time_tracker.first_tim = self.first_tim
+        tracker.time_tracker.current_tim = (self.first_tim if self.current_tim is None
+                                            else self.current_tim)
+        file_meta.update(self.fmeta)
+        file_meta['LINE_COUNT'] = self.line
+    def resume_point(self, tracker, file_meta) -> 'Chunk':
+        """Parser state at the end of the chunk, the reverse of seed(). Processing of the file can
+            be resumed from there when the file grows."""
+        fmeta = {k: v for (k, v) in file_meta.items() if k not in ('FILE_NAME', 'LINE_COUNT')}
+        return Chunk(self.end, self.end, file_meta['LINE_COUNT'], dict(tracker.cursors), fmeta,
+                     tracker.time_tracker.wall_clock, tracker.time_tracker.first_tim,
+                     tracker.time_tracker.current_tim)
+
+def _safe_edge(buf, pos: int) -> bool:
+    """Checks that parser state is NOC at the "=====" line at pos. After PARSE ERROR and inside
+        PARSING IN CURSOR parser just collects the lines."""
+    end = pos - 1
+    for _ in range(MAX_LOOKBACK):
+        if end <= 0:
+            return True
+        start = buf.rfind(b'\n', 0, end) + 1
+        line = buf[start:end]
+        if line.startswith(b'END OF STMT'):
+            return True
+        if (m := CALL_MATCHER.match(line)) is not None:
+            return m.group(1) not in (b'PARSE ERROR', b'PARSING IN CURSOR')
+        end = start - 1
+    return True
+
+def _find_edges(buf, size: int, chunk_size: int, start: int = 0) -> list[int]:
+    """Finds chunk edges, first "=====" line after every chunk_size bytes."""
+    edges = []
+    pos = start + chunk_size
+    while pos < size:
+        idx = buf.find(RES_MARKER, pos)
+        while idx >= 0 and not _safe_edge(buf, idx + 1):
+            idx = buf.find(RES_MARKER, idx + 1)
+        if idx < 0:
+            break
+        edges.append(idx + 1)
+        pos = idx + 1 + chunk_size
+    return edges
+
+def _last_edge(buf, start: int, end: int) -> Optional[int]:
+    """Last safe edge after start and before end, None if there is none."""
+    while (idx := buf.rfind(RES_MARKER, start, end)) >= 0:
+        if _safe_edge(buf, idx + 1):
+            return idx + 1
+        end = idx
+    return None
+
+def _last_tim(buf, start: int, end: int) -> Optional[int]:
+    """Last tim between start and end, None if there is none."""
+    while (idx := buf.rfind(b'tim=', start, end)) >= 0:
+        if (t := TIM_MATCHER.match(buf, idx, end)) is not None:
+            return int(t.group(1))
+        end = idx
+    return None
+
+def _count_lines(buf, start: int, end: int) -> int:
+    out = 0
+    for pos in range(start, end, 1 << 26):
+        out += buf[pos:min(pos + (1 << 26), end)].count(b'\n')
+    return out
+
+def last_line_end(fname: str) -> int:
+    """Offset after the last complete line of the file."""
+    with open(fname, 'rb') as fdesc:
+        if os.fstat(fdesc.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(fdesc.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return buf.rfind(b'\n') + 1
+
+def plan_chunks(fname: str, chunk_size: int, first: Optional[Chunk] = None,
+                end: Optional[int] = None, last_edge: bool = False) -> list[Chunk]:
+    """Splits the file into chunks of roughly chunk_size bytes. If first is set, planning starts
+        from its offset and state, up to end. With last_edge the last chunk starts at the last
+        safe edge before end: every chunk but the last one ends at the edge, where no span is
+        open."""
+    if first is None:
+        first = Chunk(0, 0)
+    with open(fname, 'rb') as fdesc:
+        with mmap.mmap(fdesc.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            size = len(buf) if end is None else end
+            pos = first.start
+            edges = [e for e in _find_edges(buf, size, chunk_size, pos) if e < size]
+            if last_edge and (edge := _last_edge(buf, pos, size)) is not None \
+                    and (not edges or edge > edges[-1]):
+                edges.append(edge)
+            chunks = [replace(first, end=size, cursors=dict(first.cursors),
+                              fmeta=dict(first.fmeta))]
+
+            cursors = dict(first.cursors)
+            fmeta = dict(first.fmeta)
+            wall_clock = first.wall_clock
+            # Wall clock of the first chunk was set before its start
+            anchor = None
+            lines = first.line
+            for edge in edges:
+                for m in STATE_MATCHER.finditer(buf, pos, edge):
+                    line_end = buf.find(b'\n', m.end())
+                    line = buf[m.start(1):line_end if line_end >= 0 else edge]
+                    if m.group(1) == b'*** ':
+                        if (d := DATE_MATCHER.match(line)) is not None:
+                            wall_clock = get_timestamp(to_str(d.group(1)))
+                            anchor = line_end
+                        elif (s := STARS_MATCHER.match(line)) is not None:
+                            wall_clock = get_timestamp(to_str(s.group(3)))
+                            name = to_str(s.group(1).strip(b':'))
+                            fmeta[name] = to_str(s.group(2).strip(b'()'))
+                            anchor = line_end
+                    elif (c := CALL_MATCHER.match(line)) is not None:
+                        sqlid = SQLID_MATCHER.search(c.group(4))
+                        sqlid = to_str(sqlid.group(1).strip(b"'")) if sqlid else ''
+                        cursors[to_str(c.group(2))] = sqlid
+                lines += _count_lines(buf, pos, edge)
+                pos = edge
+
+                (first_tim, current_tim) = (None, None)
+                if anchor is None:
+                    (first_tim, current_tim) = (first.first_tim, first.current_tim)
+                if (wall_clock and first_tim is None
+                        and (t := TIM_MATCHER.search(buf, anchor or first.start, edge)) is not None):
+                    first_tim = int(t.group(1))
+                if wall_clock and first_tim is not None:
+                    current_tim = (_last_tim(buf, anchor or first.start, edge) or current_tim
+                                   or first_tim)
+                chunks[-1].end = edge
+                chunks.append(Chunk(edge, size, lines, dict(cursors), dict(fmeta), wall_clock,
+                                    first_tim, current_tim))
+    return chunks